@@ -52,15 +52,31 @@ Supported options::
 
   nodefaults:bool (default=off): turn off default lookups through variables.
 
+  noexpansion (default=off): the variable module leaves $variables
+            in this command's input alone so the command can look
+            them up itself (#if and #math do this)
+
+  cache (default=on): whether parse results are kept in a small LRU 
+            cache keyed on the input and the resolved defaults.  Use 
+            "nocache" for commands whose type checks have side effects
+            or give different answers over time.  Arg specs with eval
+            or time arguments are never cached.
+
 Refer to the modules.lyntincmds and modules.tintincmds for examples
 on arg specs and commands and how it all intertwines.
 """
 import re, time
 import utils
 
-defaultOptions={ "stripBraces": 1, "noparsing": 0, "limitparsing": -1, "nodefaults":0 }
+defaultOptions={ "stripBraces": 1, "noparsing": 0, "limitparsing": -1, "nodefaults":0, "cache": 1 }
 optionParser = None
 
+# how many parse results each ArgumentParser holds on to
+CACHE_SIZE = 100
+
+# for tokenizing input without \ or = in it
+FAST_SPLIT_REGEXP = re.compile(r"[ \t]+|[{}]")
+
 class ParserException(Exception):
   pass
 
@@ -95,6 +111,14 @@ class ArgumentParser:
     else:
       self.options = defaultOptions.copy()
     self.buildParsers(argspec)
+
+    self._cache = None
+    if self.options["cache"]:
+      for mem in self.parsers.values():
+        if not mem.typechecker.cacheable:
+          break
+      else:
+        self._cache = utils.LRUCache(CACHE_SIZE)
     return
 
   def getOption(self, optionname):
@@ -157,6 +181,7 @@ class ArgumentParser:
 
     # set types for certain options
     self.options["limitparsing"] = int(self.options["limitparsing"])
+    self.options["cache"] = int(self.options["cache"])
 
   def buildParsers(self, argspec):
     """
@@ -257,6 +282,10 @@ class ArgumentParser:
     Takes an input string and produces the populated dictionary
     matching self's argspec.  
 
+    Unless caching is turned off for this parser, the result is kept
+    keyed on the input and the values the defaultresolver gives for
+    our arguments and callers get a copy of it.
+
     @param input: the user input string
     @type  input: string
 
@@ -272,6 +301,60 @@ class ArgumentParser:
         appropriate collection arguments specified, or if required arguments
         are missing, or if arguments passed in aren't valid
     """    
+    if self._cache == None:
+      return self._parse(input, defaultresolver)[0]
+
+    # the cached result is only good if the defaults for the arguments
+    # the input didn't specify haven't changed
+    entry = self._cache.get(input)
+    if entry != None:
+      argdict, missing, resolved = entry
+      if self._resolveDefaults(missing, defaultresolver) != resolved:
+        entry = None
+
+    if entry == None:
+      entry = self._parse(input, defaultresolver)
+      self._cache.put(input, entry)
+      argdict = entry[0]
+
+    # the collectors hold on to lists and dicts which the command
+    # could change on us
+    argdict = argdict.copy()
+    if self.extraindexparser:
+      name = self.extraindexparser.argname
+      argdict[name] = list(argdict[name])
+    if self.extranamedparser:
+      name = self.extranamedparser.argname
+      argdict[name] = argdict[name].copy()
+    return argdict
+
+  def getCacheStatus(self):
+    """
+    Returns a one liner on how the parse cache is doing.
+
+    @return: the status of the cache or None if we're not caching
+    @rtype: string
+    """
+    if self._cache == None:
+      return None
+    return self._cache.getStatus()
+
+  def _resolveDefaults(self, keys, defaultresolver):
+    """
+    Returns what the defaultresolver gives for each of the keys.
+    """
+    if self.getOption("nodefaults") or not defaultresolver:
+      return None
+    return [defaultresolver(m) for m in keys]
+
+  def _parse(self, input, defaultresolver):
+    """
+    Does the actual parsing for parse.
+
+    @return: the populated dictionary, the arguments that weren't
+        in the input and what the defaultresolver gave for them
+    @rtype: (dict, list of strings, list)
+    """
     argdict = {}
 
     arguments = self.split(input, self.getOption("limitparsing"))
@@ -312,30 +395,33 @@ class ArgumentParser:
 
     # now check that everything has been specified, putting in defaults 
     # where available
-    for key in self.parsers.keys():
-      if not argdict.has_key(key):
-        # gotta be careful here with the extra defaultset value since
-        # the parser may parse a string into None, or anything really
-        default = None
-        defaultset = 0
-        parser = self.parsers[key]
-
-        if not self.getOption("nodefaults") and defaultresolver:
-          default = defaultresolver(key)
-          if default != None:
-            default = parser.parse(default)
-            defaultset = 1
-            
-        if not defaultset and parser.defaultset:
-          default = parser.default
+    missing = [m for m in self.parsers.keys() if not argdict.has_key(m)]
+    resolved = self._resolveDefaults(missing, defaultresolver)
+
+    for i in range(len(missing)):
+      key = missing[i]
+      # gotta be careful here with the extra defaultset value since
+      # the parser may parse a string into None, or anything really
+      default = None
+      defaultset = 0
+      parser = self.parsers[key]
+
+      if resolved != None:
+        default = resolved[i]
+        if default != None:
+          default = parser.parse(default)
           defaultset = 1
-        
-        if not defaultset and not self.getOption("noparsing"):
-          raise ParserException, "Must specify a value for argument %s" % (key)
-        else:
-          argdict[key] = default
           
-    return argdict
+      if not defaultset and parser.defaultset:
+        default = parser.default
+        defaultset = 1
+      
+      if not defaultset and not self.getOption("noparsing"):
+        raise ParserException, "Must specify a value for argument %s" % (key)
+      else:
+        argdict[key] = default
+        
+    return (argdict, missing, resolved)
 
   def split(self, input, maxsplit=-1, buildsyntaxline=0):
     """
@@ -376,6 +462,10 @@ class ArgumentParser:
     @raises ParserException: if \\ (single backslash) is found at the end 
         of the line or if mismatched { or } are found
     """
+    if maxsplit < 0 and not buildsyntaxline and \
+        input.find("\\") == -1 and input.find("=") == -1:
+      return self._splitFast(input)
+
     bracketdepth = 0
     arg = ""
     val = None
@@ -470,6 +560,46 @@ class ArgumentParser:
     
     return arguments
 
+  def _splitFast(self, input):
+    """
+    Does what split does for input without \\ or = in it (so without
+    escapes or named arguments) when there's no maxsplit.  Every
+    argument is then a slice of the input and we only have to look
+    at the whitespace and braces.
+
+    @param input: the user input to tokenize
+    @type  input: string
+
+    @return: the split input
+    @rtype: list of (string, None) tuples
+
+    @raises ParserException: if mismatched { or } are found
+    """
+    arguments = []
+    bracketdepth = 0
+    start = 0
+
+    for mem in FAST_SPLIT_REGEXP.finditer(input):
+      c = mem.group(0)
+      if c == "{":
+        bracketdepth = bracketdepth + 1
+      elif c == "}":
+        bracketdepth = bracketdepth - 1
+        if bracketdepth < 0:
+          raise ParserException, "mismatched }"
+      elif not bracketdepth:
+        if mem.start() > start:
+          arguments.append( (input[start:mem.start()], None) )
+        start = mem.end()
+
+    if bracketdepth:
+      raise ParserException, "Mismatched {"
+
+    if start < len(input):
+      arguments.append( (input[start:], None) )
+
+    return arguments
+
 class Parser:
   """
   This is the base class for the parsers that argumentparser uses to
@@ -678,7 +808,13 @@ def _createTypeChecker(typespec):
 class TypeChecker:
   """
   Trivial base class for argument checkers
+
+  Subclasses whose check has side effects or whose answer for the
+  same argument can change should set cacheable to 0 so that parse
+  results for arg specs using them aren't cached.
   """
+  cacheable = 1
+
   def __init__(self, typename, typeargs):
     """
     Initializes the TypeChecker.  Over-ridden by all the TypeChecker 
@@ -832,6 +968,8 @@ class EvalChecker(TypeChecker):
   """
   Evaluate its input argument as python code and return the resulting object.
   """
+  cacheable = 0
+
   def __init__(self, typename, typeargs):
     if typeargs:
       raise ParserException, "TypeArgs (%s) specified for non-configurable type (%s)" % (typeargs, typename)
@@ -872,7 +1010,7 @@ class TimeSpanChecker(TypeChecker):
     @type  arg: string
 
     @returns: the number of seconds in the timespan
-    @rtype: int
+    @rtype: int or float
 
     @raise ParserException: if the timespan is invalid
     """
@@ -891,6 +1029,8 @@ class TimeChecker(TypeChecker):
   Will also accept a time specification and apply it as a delta from
   _now_.  converts to the standard seconds-from_epoch. 
   """
+  cacheable = 0
+
   def __init__(self, typename, typeargs):
     if typeargs:
       raise ParserException, "TypeArgs (%s) specified for non-configurable type (%s)" % (typeargs, typename)
@@ -0,0 +1,326 @@
+#########################################################################
+# This file is part of Lyntin.
+#
+# Lyntin is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# Lyntin is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# copyright (c) Free Software Foundation 2001-2007
+#
+#########################################################################
+"""
+Runs Lyntin in X{batch} mode: the lines of a log file or a #record
+recording are fed through a session as fast as they can be handled
+and what the session would have sent to the mud is captured instead.
+It's a way to test triggers against a fight without the mud and to
+see how fast a set of scripts is::
+
+  runlyntin --readfile mytriggers.tin --batch fight.log 
+            --batchoutput sent.txt
+
+There's no ui and no engine, timer or scheduler thread.  Mud data is
+handled on the main thread and anything the handling puts on the
+event queue is run right after each chunk, so runs are repeatable.
+Because there's no timer, #tick and #schedule don't go off.  Messages
+and mud data that would go to the ui are thrown away except for
+errors which go to stderr.
+
+When the input has been handled, a summary is written to stdout:
+lines per second, how many times actions fired, how many commands
+were sent to the "mud" and how long each mud_filter_hook function
+took (including anything it set off, like an action's commands).
+"""
+import sys, time
+from lyntin import exported, recording, event
+from lyntin.ui import message
+
+# the hooks whose functions we time
+TIMED_HOOKS = ["mud_filter_hook", "prompt_hook", "to_mud_hook"]
+
+# the number of errors error_hook has seen
+errorcount = 0
+
+def error_hook(args):
+  """
+  to_user_hook function that writes errors to stderr since there's
+  no ui to show them.
+  """
+  global errorcount
+  mess = args["message"]
+  if isinstance(mess, message.Message) and mess.type == message.ERROR:
+    errorcount += 1
+    sys.stderr.write(mess.data)
+
+class CaptureSocket:
+  """
+  Stands in for the batch session's SocketCommunicator.  Everything
+  written to it is counted and optionally written to a file.
+  """
+  def __init__(self, output=None):
+    """
+    @param output: the file to write what's sent to the mud to (or
+        None)
+    @type  output: File
+    """
+    self._output = output
+    self._lines = 0
+    self._bytes = 0
+
+  def __repr__(self):
+    return "CaptureSocket: %d line(s) sent" % self._lines
+
+  def write(self, data):
+    """
+    Captures data the session sends to the mud.
+
+    @param data: the data
+    @type  data: string
+    """
+    self._lines += len(data.strip().split("\n"))
+    self._bytes += len(data)
+    if self._output:
+      self._output.write(data)
+
+  def setSessionName(self, name):
+    pass
+
+  def shutdown(self):
+    if self._output:
+      self._output.flush()
+
+  def getLineCount(self):
+    """
+    Returns the number of lines sent to the mud.
+
+    @rtype: int
+    """
+    return self._lines
+
+
+class HookTimer:
+  """
+  Times the functions registered with a hook by replacing each of
+  them with a wrapper that keeps a count and total time.
+  """
+  def __init__(self, hookname):
+    """
+    @param hookname: the hook to time
+    @type  hookname: string
+    """
+    self._hookname = hookname
+    self._wrapped = []
+    self._stats = []
+
+  def install(self):
+    """
+    Wraps the functions registered with the hook.
+    """
+    hook = exported.get_hook(self._hookname)
+    for priority, func in hook.getPriorities():
+      stats = [get_function_name(func), 0, 0.0]
+      wrapper = self._wrap(func, stats)
+      hook.remove(func)
+      hook.add(wrapper, priority)
+      self._wrapped.append((priority, func, wrapper))
+      self._stats.append(stats)
+
+  def uninstall(self):
+    """
+    Puts the original functions back.
+    """
+    hook = exported.get_hook(self._hookname)
+    for priority, func, wrapper in self._wrapped:
+      hook.remove(wrapper)
+      hook.add(func, priority)
+    self._wrapped = []
+
+  def _wrap(self, func, stats):
+    clock = time.time
+    def wrapper(args):
+      start = clock()
+      try:
+        return func(args)
+      finally:
+        stats[1] += 1
+        stats[2] += clock() - start
+    return wrapper
+
+  def getReport(self):
+    """
+    Returns a line for each function that was called.
+
+    @return: the report lines
+    @rtype: list of strings
+    """
+    ret = []
+    for name, calls, seconds in self._stats:
+      if calls:
+        ret.append("    %-40s %8d calls %8.3fs %8.2f usec/call" % 
+                   (name, calls, seconds, seconds * 1000000.0 / calls))
+    if ret:
+      ret.insert(0, "  %s:" % self._hookname)
+    return ret
+
+def get_function_name(func):
+  """
+  Returns a module.function style name for a hook function.
+
+  @param func: the function
+  @type  func: function or bound method
+
+  @rtype: string
+  """
+  if hasattr(func, "im_func"):
+    module = func.im_func.__module__
+  else:
+    module = getattr(func, "__module__", None) or ""
+  if module.startswith("lyntin.modules."):
+    module = module[len("lyntin.modules."):]
+  return "%s.%s" % (module, getattr(func, "__name__", repr(func)))
+
+def read_input(filename, chunklines=50):
+  """
+  Reads a log file or recording and returns chunks of it to feed to
+  the session.
+
+  @param filename: the log file or recording
+  @type  filename: string
+
+  @param chunklines: the most lines of mud data to put in a chunk
+  @type  chunklines: int
+
+  @return: iterator of (type, text) tuples where type is
+      recording.MUD or recording.PROMPT
+  @rtype: iterator
+  """
+  f = open(filename, "rb")
+  magic = f.read(len(recording.MAGIC))
+  f.seek(0)
+
+  if magic == recording.MAGIC:
+    f.close()
+    reader = recording.RecordReader(filename)
+    chunk = []
+    for t, rectype, text in reader.records(types=[recording.MUD, recording.PROMPT]):
+      if rectype == recording.MUD:
+        chunk.append(text)
+        if len(chunk) < chunklines:
+          continue
+      if chunk:
+        yield (recording.MUD, "".join(chunk))
+        chunk = []
+      if rectype == recording.PROMPT:
+        yield (recording.PROMPT, text)
+    if chunk:
+      yield (recording.MUD, "".join(chunk))
+    reader.close()
+    return
+
+  chunk = []
+  for line in f:
+    chunk.append(line)
+    if len(chunk) >= chunklines:
+      yield (recording.MUD, "".join(chunk))
+      chunk = []
+  if chunk:
+    yield (recording.MUD, "".join(chunk))
+  f.close()
+
+
+def run(engine, filename, output=None, sessionname="batch", chunklines=50):
+  """
+  Feeds a log file or recording through a new session and writes
+  a summary to stdout.
+
+  @param engine: the engine (with modules loaded and rc files read)
+  @type  engine: engine.Engine
+
+  @param filename: the log file or recording to feed through
+  @type  filename: string
+
+  @param output: the name of a file to write what's sent to the mud
+      to (or None)
+  @type  output: string
+
+  @param sessionname: the name of the session to create
+  @type  sessionname: string
+
+  @param chunklines: the number of lines handed to the session at a
+      time
+  @type  chunklines: int
+
+  @return: the number of errors error_hook has seen (including any
+      from before the run)
+  @rtype: int
+  """
+  if output:
+    outputfile = open(output, "w")
+  else:
+    outputfile = None
+  sock = CaptureSocket(outputfile)
+
+  ses = engine.createSession(sessionname)
+  ses.setSocketCommunicator(sock)
+  engine.set_current_session(ses)
+  engine.processEvents()
+
+  timers = [HookTimer(mem) for mem in TIMED_HOOKS]
+  for mem in timers:
+    mem.install()
+
+  lines = 0
+  bytes = 0
+  start = time.time()
+  try:
+    for rectype, text in read_input(filename, chunklines):
+      if rectype == recording.MUD:
+        lines += text.count("\n")
+        bytes += len(text)
+        event.MudEvent(ses, text).execute()
+      else:
+        exported.hook_spam("prompt_hook", {"session": ses, "prompt": text})
+      engine.processEvents()
+  finally:
+    elapsed = time.time() - start
+    for mem in timers:
+      mem.uninstall()
+
+  am = exported.get_manager("action")
+  if am:
+    fired = am.getFiredCount(ses)
+  else:
+    fired = 0
+  sent = sock.getLineCount()
+
+  engine.closeSession(ses)
+  engine.processEvents()
+  if outputfile:
+    outputfile.close()
+
+  report = []
+  report.append("batch: %d lines (%d bytes) from %s in %.3fs" % 
+                (lines, bytes, filename, elapsed))
+  report.append("  lines/sec:        %.0f" % (lines / max(elapsed, 0.000001)))
+  report.append("  actions fired:    %d" % fired)
+  report.append("  commands sent:    %d" % sent)
+  report.append("  errors:           %d" % errorcount)
+  for mem in timers:
+    report.extend(mem.getReport())
+  print "\n".join(report)
+
+  return errorcount
+
+# Local variables:
+# mode:python
+# py-indent-offset:2
+# tab-width:2
+# End:
@@ -53,8 +53,12 @@ X{default_resolver_hook}::
 
    commandname - the name of the command that was executed
 
+   The result is cached per session and command until a variable or
+   config item changes or a function registers with (or unregisters
+   from) the hook.
+
 """
-import inspect, re
+import inspect, re, bisect
 from lyntin import manager, exported, argparser, utils
 
 class _CommandData:
@@ -95,6 +99,16 @@ class CommandManager(manager.Manager):
     self._commands = {}
     self._engine = e
 
+    # sorted names of the plain commands and sorted (name, compiled)
+    # tuples for the ^ commands--rebuilt when commands are added
+    # or removed
+    self._names = []
+    self._patterns = []
+
+    # (session, command name) -> (hook list, resolver) for the
+    # default_resolver_hook results
+    self._resolvers = {}
+
   def getCommands(self):
     """
     Returns a list of the commands we have registered.
@@ -144,12 +158,22 @@ class CommandManager(manager.Manager):
 
     cd.setFunc(func)
 
+    if name.startswith("^"):
+      try:
+        compiled = re.compile(name)
+      except re.error, e:
+        raise ValueError, "%s is not a valid regular expression (%s)" % (name, e)
+
     # removeCommand tests to see if the command exists already and will
     # remove it if it does.
     self.removeCommand(name)
 
     # toss the command thing in the dict
     self._commands[name] = cd
+    if name.startswith("^"):
+      bisect.insort(self._patterns, (name, compiled))
+    else:
+      bisect.insort(self._names, name)
 
     # deal with the help text
     if not helptext:
@@ -185,6 +209,12 @@ class CommandManager(manager.Manager):
     if self._commands.has_key(name):
       cd = self._commands[name]
       del self._commands[name]
+      if name.startswith("^"):
+        self._patterns = [m for m in self._patterns if m[0] != name]
+      else:
+        del self._names[bisect.bisect_left(self._names, name)]
+      for mem in [m for m in self._resolvers.keys() if m[1] == name]:
+        del self._resolvers[mem]
       try:
         exported.remove_help(cd.getFQN())
       except:
@@ -215,6 +245,72 @@ class CommandManager(manager.Manager):
 
     return None
 
+  def findCommand(self, word):
+    """
+    Returns the name of the command the user meant by word: the first
+    command in sorted order that either starts with word or is a
+    ^ command whose regular expression matches word.
+
+    @param word: the command name the user typed (without the
+        command character)
+    @type  word: string
+
+    @return: the name of the command or None if nothing matched
+    @rtype:  string
+    """
+    found = None
+    names = self._names
+    i = bisect.bisect_left(names, word)
+    if i < len(names) and names[i].startswith(word):
+      found = names[i]
+
+    for name, compiled in self._patterns:
+      if found != None and name > found:
+        break
+      if compiled.search(word):
+        return name
+
+    return found
+
+  def getResolver(self, ses, name):
+    """
+    Returns the default resolver for the command from the
+    default_resolver_hook.  Results are cached until clearResolvers
+    is called or the functions registered with the hook change.
+
+    @param ses: the session the command is being executed in
+    @type  ses: session.Session
+
+    @param name: the name of the command
+    @type  name: string
+
+    @return: the resolver or None
+    @rtype:  function
+    """
+    hooklist = exported.get_hook("default_resolver_hook").getList()
+    cached = self._resolvers.get((ses, name))
+    if cached != None and cached[0] is hooklist:
+      return cached[1]
+
+    resolver = exported.hook_spam("default_resolver_hook", 
+                        {"session": ses, "commandname": name}, 
+                        mappingfunc=exported.query_mapper, 
+                        donefunc=exported.query_done)
+    self._resolvers[(ses, name)] = (hooklist, resolver)
+    return resolver
+
+  def clearResolvers(self, args=None):
+    """
+    Throws away the cached default resolvers.  This is registered with
+    the variable_change_hook and the config_change_hook since default
+    values can come from either.
+    """
+    self._resolvers.clear()
+
+  def removeSession(self, ses):
+    for mem in [m for m in self._resolvers.keys() if m[0] == ses]:
+      del self._resolvers[mem]
+
   def getArgParser(self, name):
     """
     Returns the arguments parser for a given command name.
@@ -248,7 +344,7 @@ class CommandManager(manager.Manager):
     internal = args["internal"]
     input = args["dataadj"]
 
-    commandchar = self._engine.getConfigManager().get("commandchar")
+    commandchar = self._engine.getConfigManager().getSnapshot().commandchar
     if len(input) > 1 and input.startswith(commandchar):
       input = input[1:]
 
@@ -266,53 +362,40 @@ class CommandManager(manager.Manager):
         return
 
       # this finds the first matching command and ends there.
-      commands = self.getCommands()
-      commands.sort()
-      for mem in commands:
-        command = None
-        if mem.startswith("^"):
-          if re.compile(mem).search(words[0]):
-            command = self.getCommand(mem)
-        else:
-          if mem.startswith(words[0]):
-            command = self.getCommand(mem)
-
-        if command:
-          argumentparser = self.getArgParser(mem)
-          if argumentparser == None:
-            command(ses, input.split(" "), input)
-          else:
-            # for printing out the error message, we remove the ^
-            # from the command name if it's there.
-            fixedmem = mem
-            if len(fixedmem) > 0 and fixedmem.startswith("^"):
-              fixedmem = fixedmem[1:]
-
-            resolver = exported.hook_spam("default_resolver_hook", 
-                                {"session": ses, "commandname": mem}, 
-                                mappingfunc=exported.query_mapper, 
-                                donefunc=exported.query_done)
-
-            try:
-              argdict = argumentparser.parse(words[1], resolver)
-              argdict["command"]=mem
-              command(ses, argdict, input)
-            except ValueError, e:
-              exported.write_error("%s: %s\nsyntax: %s%s %s" % 
-                                   (fixedmem, e, commandchar, fixedmem,
-                                    argumentparser.syntaxline))
-            except argparser.ParserException, e:
-              exported.write_error("%s: %s\nsyntax: %s%s %s" % 
-                                   (fixedmem, e, commandchar, fixedmem,
-                                    argumentparser.syntaxline))
-          if internal == 0:
-            ses.prompt()
-          break
-
-      else:
+      mem = self.findCommand(words[0])
+      if mem == None:
         if internal == 0:
           ses.prompt()
         exported.write_error("Not a valid command: %s" % (words[0]))
+        return
+
+      command = self.getCommand(mem)
+      argumentparser = self.getArgParser(mem)
+      if argumentparser == None:
+        command(ses, input.split(" "), input)
+      else:
+        # for printing out the error message, we remove the ^
+        # from the command name if it's there.
+        fixedmem = mem
+        if len(fixedmem) > 0 and fixedmem.startswith("^"):
+          fixedmem = fixedmem[1:]
+
+        resolver = self.getResolver(ses, mem)
+
+        try:
+          argdict = argumentparser.parse(words[1], resolver)
+          argdict["command"]=mem
+          command(ses, argdict, input)
+        except ValueError, e:
+          exported.write_error("%s: %s\nsyntax: %s%s %s" % 
+                               (fixedmem, e, commandchar, fixedmem,
+                                argumentparser.syntaxline))
+        except argparser.ParserException, e:
+          exported.write_error("%s: %s\nsyntax: %s%s %s" % 
+                               (fixedmem, e, commandchar, fixedmem,
+                                argumentparser.syntaxline))
+      if internal == 0:
+        ses.prompt()
       return
     return args["dataadj"]
 
@@ -216,6 +216,23 @@ class BoolConfig(ConfigBase):
     return bv(self._value) + " (bool)"
 
 
+class ConfigSnapshot:
+  """
+  Holds the current values of the config items for a session as
+  plain attributes so the code that handles every line can read
+  them without going through the ConfigManager::
+
+    snap = exported.get_config_snapshot(ses)
+    if snap.speedwalk == 1:
+      ...
+
+  The ConfigManager keeps the attributes up to date as items are
+  added, changed and removed.  Items that don't exist aren't there,
+  so use getattr with a default for items a module might not have
+  added (and for names with a . in them).
+  """
+  pass
+
 class ConfigManager(manager.Manager):
   """
   Holds all the configuration pieces for Lyntin.
@@ -225,6 +242,9 @@ class ConfigManager(manager.Manager):
     self._config = {}
     self._engine = e
 
+    # this is a map of session -> ConfigSnapshot
+    self._snapshots = {}
+
   def add(self, name, configitem, ses=None):
     """
     Adds a new configuration item.
@@ -271,6 +291,10 @@ class ConfigManager(manager.Manager):
       raise ValueError("That item does not exist.")
 
     del self._config[ses][name]
+
+    snap = self.getSnapshot(ses)
+    if snap.__dict__.has_key(name):
+      del snap.__dict__[name]
     
   def change(self, name, newvalue, ses=None):
     """
@@ -327,7 +351,36 @@ class ConfigManager(manager.Manager):
 
     return self._config[ses][name].get()
 
+  def getSnapshot(self, ses=None):
+    """
+    Returns the ConfigSnapshot for a session.  The same snapshot
+    object is returned for as long as the session exists and its
+    values change as the config items change, so it's fine to hold
+    on to it.
+
+    @param ses: the session (or None for the general Lyntin items)
+    @type  ses: Session
+
+    @returns: the snapshot of config values for that session
+    @rtype: ConfigSnapshot
+    """
+    try:
+      return self._snapshots[ses]
+    except KeyError:
+      snap = ConfigSnapshot()
+      self._snapshots[ses] = snap
+      self._fillSnapshot(ses)
+      return snap
+
+  def _fillSnapshot(self, ses):
+    snap = self._snapshots[ses]
+    snap.__dict__.clear()
+    if self._config.has_key(ses):
+      for name, item in self._config[ses].items():
+        setattr(snap, name, item.get())
+
   def _configChangeHook(self, ses, name, value, newvalue):
+    setattr(self.getSnapshot(ses), name, newvalue)
     exported.hook_spam("config_change_hook", 
         {"session": ses, "name": name, "oldvalue": value, "newvalue": newvalue })
 
@@ -385,7 +438,14 @@ class ConfigManager(manager.Manager):
 
     self._config[newsession] = x
 
+    # the items were copied without going through add, so we fill
+    # in the snapshot (which someone may already be holding) from them
+    self.getSnapshot(newsession)
+    self._fillSnapshot(newsession)
+
   def removeSession(self, ses):
     if self._config.has_key(ses):
       del self._config[ses]
+    if self._snapshots.has_key(ses):
+      del self._snapshots[ses]
 
@@ -53,6 +53,16 @@ HELPTEXT = """syntax: lyntin.py [[OPTIONS] | [--help] | [--version]]
        sets the configuration file to use for setting up the
        datadir, moduledirs, plugins to load, files to read,
        ui to use, and other boot options.
+
+  --batch <file>
+       feeds the lines of a log file or #record recording through
+       a session without a ui or a mud connection and prints how
+       fast it went, how many actions fired and how many commands
+       were sent.  exits with status 1 if there were errors.
+
+  --batchoutput <file>
+       with --batch, writes what would have been sent to the mud
+       to this file.
 """
 
 # Lyntin displays this after it's done initializing and it's
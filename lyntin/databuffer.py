@@ -0,0 +1,1071 @@
+#########################################################################
+# This file is part of Lyntin.
+#
+# Lyntin is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# Lyntin is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# copyright (c) Free Software Foundation 2001-2007
+#
+#########################################################################
+"""
+Holds the DataBuffer which is the scrollback each session keeps of
+the (ansi and ^M filtered) lines that came from the mud.
+
+The DataBuffer is a ring buffer: once it's full, each new line
+replaces the oldest one in place.  Alongside each line it keeps the
+time the line arrived in an array of doubles.  It can be limited by
+a number of lines, a number of bytes or both--whichever is hit first
+causes the oldest lines to be dropped.
+
+Every line that's ever been added gets a line number which doesn't
+change as older lines are dropped.  Indexing the buffer like a list
+(C{buffer[0]}, C{buffer[-1]}, C{buffer[10:20]}) is relative to the
+oldest line still in the buffer.
+
+Searching the buffer (which #grep does) goes through a trigram index
+of the lines: for every three character sequence, the line numbers
+of the lines it's in.  The literal text a regular expression requires
+(the "says:" in C{^\w+ says: .*loot}) gives us trigrams that all have
+to be in a matching line, so we only run the regular expression on
+the lines that have all of them.  The index is started the first
+time the buffer is searched, so sessions that never get searched
+don't pay for it.  After that every time lines are added, up to
+INDEX_LINES more lines get indexed (the ones already in the buffer
+first, then the new ones), so the index for a big buffer gets built
+a bit at a time rather than freezing the first search.  Searches
+look at the lines that aren't indexed yet one by one.  Lines are
+taken out of the index as they're dropped and the index counts
+towards the byte limit.
+
+A DataBuffer can also be given a SpillFile.  Then lines that get
+dropped from the buffer are written to the file in zlib compressed
+blocks instead of being thrown away.  The lines are still there by
+line number (getLine, getLines, search and so on) but they're read
+back in a block at a time through mmap when they're asked for.  The
+only thing kept in memory for them is a small index of the blocks, so
+the history can grow without the memory use growing with it.
+"""
+import time, array, bisect, sre_parse, sre_constants, zlib, struct, mmap, \
+       threading
+import utils
+
+# the most lines that get indexed each time lines are added
+INDEX_LINES = 500
+
+class DataBuffer:
+  """
+  Fixed capacity ring buffer of lines with timestamps.
+  """
+  def __init__(self, maxlines=10000, maxbytes=0):
+    """
+    @param maxlines: the most lines we keep
+    @type  maxlines: int
+
+    @param maxbytes: the most bytes of text we keep (0 for no limit)
+    @type  maxbytes: int
+    """
+    self._maxlines = max(int(maxlines), 1)
+    self._maxbytes = max(int(maxbytes), 0)
+    self._next = 0
+    self._spill = None
+
+    # the engine thread adds lines while the ui thread can be reading
+    # them (the curses scrollback window pages them in) so everything
+    # that changes or reads the lines or the spill file holds this
+    self._lock = threading.RLock()
+    self.clear()
+
+  def clear(self):
+    """
+    Removes all the lines (including the ones in the spill file).
+    Line numbers keep counting up from where they were.
+    """
+    self._lock.acquire()
+    try:
+      self._reset()
+      self._index = None
+      if self._spill != None:
+        self._spill.clear(self._next)
+    finally:
+      self._lock.release()
+
+  def _reset(self):
+    # line number of the oldest line we have, the line number the
+    # next line gets (self._next) and the line number in slot 0
+    self._first = self._next
+    self._base = self._next
+
+    # the slots grow up to maxlines and then get reused
+    self._lines = []
+    self._times = array.array("d")
+    self._bytes = 0
+
+  def setSpillFile(self, file):
+    """
+    Sets the file that lines dropped from the buffer get written to.
+    Any lines in the previous spill file are gone.
+
+    @param file: a file opened for reading and writing that we can
+        use however we like or None to stop spilling
+    @type  file: file
+    """
+    self._lock.acquire()
+    try:
+      if self._spill != None:
+        self._spill.close()
+        self._spill = None
+      if file != None:
+        self._spill = SpillFile(file, self._first)
+    finally:
+      self._lock.release()
+
+  def getSpillFile(self):
+    """
+    Returns the SpillFile lines dropped from the buffer go to.
+
+    @returns: the spill file or None
+    @rtype: SpillFile
+    """
+    return self._spill
+
+  def resize(self, maxlines=None, maxbytes=None):
+    """
+    Changes the limits.  If the buffer is over the new limits, the
+    oldest lines are dropped.
+
+    @param maxlines: the most lines we keep or None to leave it alone
+    @type  maxlines: int
+
+    @param maxbytes: the most bytes we keep (0 for no limit) or None
+        to leave it alone
+    @type  maxbytes: int
+    """
+    self._lock.acquire()
+    try:
+      if maxbytes != None:
+        self._maxbytes = max(int(maxbytes), 0)
+
+      if maxlines != None and max(int(maxlines), 1) != self._maxlines:
+        maxlines = max(int(maxlines), 1)
+        if self._next - self._first > maxlines:
+          self._drop(self._next - self._first - maxlines)
+
+        # move what's left into new slots starting at 0
+        times = array.array("d", [self._times[self._slot(i)]
+                                  for i in range(self._first, self._next)])
+        self._lines = self.getLines()
+        self._times = times
+        self._maxlines = maxlines
+        self._base = self._first
+
+      self._trim()
+    finally:
+      self._lock.release()
+
+  def getLimits(self):
+    """
+    Returns the line and byte limits.
+
+    @returns: (maxlines, maxbytes)
+    @rtype: (int, int)
+    """
+    return (self._maxlines, self._maxbytes)
+
+  def append(self, lines, timestamp=None):
+    """
+    Adds lines to the buffer.  If the newest line in the buffer
+    doesn't end in a newline, the first of the new lines gets
+    added to the end of it.
+
+    @param lines: the filtered lines to add
+    @type  lines: list of strings
+
+    @param timestamp: the time the lines arrived (defaults to now)
+    @type  timestamp: float
+    """
+    self._lock.acquire()
+    try:
+      if not lines:
+        return
+      if timestamp == None:
+        timestamp = time.time()
+
+      # lines from splitlines can only have a partial line at the end
+      if [m for m in lines[:-1] if not m.endswith("\n")]:
+        lines = _join_partial_lines(lines)
+
+      if self._next > self._first:
+        slot = self._slot(self._next - 1)
+        last = self._lines[slot]
+        if not last.endswith("\n"):
+          self._lines[slot] = last + lines[0]
+          self._bytes += len(lines[0])
+          lines = lines[1:]
+
+      count = len(lines)
+      if count == 0:
+        self._trim()
+        if self._index != None:
+          self._index.update(self, INDEX_LINES)
+        return
+
+      if count >= self._maxlines:
+        # everything we've got gets pushed out and so do the first
+        # of the new lines
+        if self._next > self._first:
+          self._drop(self._next - self._first)
+        skipped = count - self._maxlines
+        if skipped and self._spill != None:
+          self._spill.add(lines[:skipped], array.array("d", [timestamp]) * skipped)
+        self._next += skipped
+        self._reset()
+        lines = lines[-self._maxlines:]
+        count = self._maxlines
+      else:
+        over = self._next - self._first + count - self._maxlines
+        if over > 0:
+          self._drop(over)
+
+      # while the buffer is growing, the next slot is the end of the
+      # list and slice assignment appends
+      slot = self._slot(self._next)
+      first = min(count, self._maxlines - slot)
+      self._lines[slot:slot + first] = lines[:first]
+      self._times[slot:slot + first] = array.array("d", [timestamp]) * first
+      if first < count:
+        self._lines[:count - first] = lines[first:]
+        self._times[:count - first] = array.array("d", [timestamp]) * (count - first)
+
+      self._next += count
+      self._bytes += len("".join(lines))
+      self._trim()
+      if self._index != None:
+        self._index.update(self, INDEX_LINES)
+        self._trim()
+    finally:
+      self._lock.release()
+
+  def _slot(self, lineno):
+    return (lineno - self._base) % self._maxlines
+
+  def _drop(self, count):
+    """
+    Drops the oldest count lines.
+    """
+    slot = self._slot(self._first)
+    pieces = [(slot, min(slot + count, len(self._lines)))]
+    if slot + count > len(self._lines):
+      pieces.append((0, slot + count - len(self._lines)))
+
+    lineno = self._first
+    for start, end in pieces:
+      if self._index != None:
+        self._index.drop(lineno, self._lines[start:end])
+      lineno += end - start
+      if self._spill != None:
+        self._spill.add(self._lines[start:end], self._times[start:end])
+      self._bytes -= len("".join(self._lines[start:end]))
+      self._lines[start:end] = [None] * (end - start)
+    self._first += count
+
+  def _trim(self):
+    if self._next - self._first > self._maxlines:
+      self._drop(self._next - self._first - self._maxlines)
+
+    if self._maxbytes:
+      while self.getByteCount() > self._maxbytes and self._next - self._first > 1:
+        self._drop(1)
+
+  def getFirstLineNumber(self):
+    """
+    Returns the line number of the oldest line in the buffer.
+
+    @rtype: int
+    """
+    return self._first
+
+  def getOldestLineNumber(self):
+    """
+    Returns the line number of the oldest line we can get at which
+    is in the spill file if there is one.
+
+    @rtype: int
+    """
+    self._lock.acquire()
+    try:
+      if self._spill != None:
+        return self._spill.getFirstLineNumber()
+      return self._first
+    finally:
+      self._lock.release()
+
+  def getNextLineNumber(self):
+    """
+    Returns the line number the next line added will get (which is
+    also the number of lines that have ever been added).
+
+    @rtype: int
+    """
+    return self._next
+
+  def getLine(self, lineno):
+    """
+    Returns a line by its line number.
+
+    @param lineno: the line number
+    @type  lineno: int
+
+    @returns: the line
+    @rtype: string
+
+    @raises IndexError: if that line isn't in the buffer
+    """
+    self._lock.acquire()
+    try:
+      if lineno < self._first and self._spill != None:
+        return self._spill.getLine(lineno)
+      if lineno < self._first or lineno >= self._next:
+        raise IndexError("line %d is not in the buffer" % lineno)
+      return self._lines[self._slot(lineno)]
+    finally:
+      self._lock.release()
+
+  def getTime(self, lineno):
+    """
+    Returns the time a line arrived by its line number.
+
+    @param lineno: the line number
+    @type  lineno: int
+
+    @returns: the time in seconds since the epoch
+    @rtype: float
+
+    @raises IndexError: if that line isn't in the buffer
+    """
+    self._lock.acquire()
+    try:
+      if lineno < self._first and self._spill != None:
+        return self._spill.getTime(lineno)
+      if lineno < self._first or lineno >= self._next:
+        raise IndexError("line %d is not in the buffer" % lineno)
+      return self._times[self._slot(lineno)]
+    finally:
+      self._lock.release()
+
+  def getLines(self, start=None, end=None):
+    """
+    Returns the lines between two line numbers as a list.
+
+    @param start: the line number to start at (defaults to the oldest)
+    @type  start: int
+
+    @param end: the line number to stop before (defaults to the end)
+    @type  end: int
+
+    @returns: the lines
+    @rtype: list of strings
+    """
+    self._lock.acquire()
+    try:
+      if start == None:
+        start = self._first
+      if end == None or end > self._next:
+        end = self._next
+      if start < self._first:
+        if self._spill != None and start < end:
+          return self._spill.getLines(start, min(end, self._first)) + \
+                 self.getLines(self._first, end)
+        start = self._first
+      if start >= end:
+        return []
+
+      startslot = self._slot(start)
+      endslot = startslot + (end - start)
+      if endslot <= len(self._lines):
+        return self._lines[startslot:endslot]
+      return self._lines[startslot:] + self._lines[:endslot - len(self._lines)]
+    finally:
+      self._lock.release()
+
+  def getLineNumberAt(self, timestamp):
+    """
+    Returns the line number of the first line that arrived at or
+    after the given time.  If all the lines arrived before then,
+    this is the line number the next line will get.
+
+    @param timestamp: the time in seconds since the epoch
+    @type  timestamp: float
+
+    @returns: the line number
+    @rtype: int
+    """
+    self._lock.acquire()
+    try:
+      if self._spill != None and (self._first == self._next or 
+                                  self._times[self._slot(self._first)] >= timestamp):
+        return self._spill.getLineNumberAt(timestamp)
+
+      low, high = self._first, self._next
+      while low < high:
+        mid = (low + high) // 2
+        if self._times[self._slot(mid)] < timestamp:
+          low = mid + 1
+        else:
+          high = mid
+      return low
+    finally:
+      self._lock.release()
+
+  def search(self, regexp, start=None, end=None):
+    """
+    Returns the line numbers of the lines that match a regular
+    expression.
+
+    @param regexp: the compiled regular expression to search with
+    @type  regexp: compiled regular expression
+
+    @param start: the line number to start at (defaults to the oldest)
+    @type  start: int
+
+    @param end: the line number to stop before (defaults to the end)
+    @type  end: int
+
+    @returns: the matching line numbers in order
+    @rtype: list of ints
+    """
+    self._lock.acquire()
+    try:
+      if start == None:
+        start = self._first
+      if end == None or end > self._next:
+        end = self._next
+      if start < self._first:
+        if self._spill != None and start < end:
+          return self._spill.search(regexp, start, min(end, self._first)) + \
+                 self.search(regexp, self._first, end)
+        start = self._first
+      if start >= end:
+        return []
+
+      trigrams = {}
+      for mem in required_literals(regexp):
+        for tri in _trigrams(mem):
+          trigrams[tri] = 1
+
+      if not trigrams:
+        candidates = xrange(start, end)
+      else:
+        if self._index == None:
+          self._index = TrigramIndex(self._first)
+
+        # the lines after the ones that are indexed get looked at one
+        # by one
+        indexed = max(start, min(end, self._index.getNextLineNumber()))
+        candidates = self._index.find(trigrams.keys(), start, indexed)
+        if indexed < end:
+          candidates = candidates + range(max(start, indexed), end)
+
+      search = regexp.search
+      lines = self._lines
+      return [m for m in candidates if search(lines[self._slot(m)])]
+    finally:
+      self._lock.release()
+
+  def getIndexStatus(self):
+    """
+    Returns a one-liner describing the search index.
+
+    @rtype: string
+    """
+    self._lock.acquire()
+    try:
+      if self._index == None:
+        return "not built"
+      return self._index.getStatus()
+    finally:
+      self._lock.release()
+
+  def getByteCount(self):
+    """
+    Returns the number of bytes of text in the buffer plus the size
+    of the search index.
+
+    @rtype: int
+    """
+    self._lock.acquire()
+    try:
+      if self._index != None:
+        return self._bytes + self._index.getByteCount()
+      return self._bytes
+    finally:
+      self._lock.release()
+
+  def getStatus(self):
+    """
+    Returns a one-liner describing the buffer.
+
+    @rtype: string
+    """
+    self._lock.acquire()
+    try:
+      if self._maxbytes:
+        limit = "%d lines/%d bytes" % (self._maxlines, self._maxbytes)
+      else:
+        limit = "%d lines" % self._maxlines
+      ret = "%d line(s), %d byte(s) (limit %s)" % (len(self), self._bytes, limit)
+      if self._spill != None:
+        ret = ret + ", spilled " + self._spill.getStatus()
+      return ret
+    finally:
+      self._lock.release()
+
+  def __len__(self):
+    return self._next - self._first
+
+  def __iter__(self):
+    return iter(self.getLines())
+
+  def __getitem__(self, index):
+    self._lock.acquire()
+    try:
+      if isinstance(index, slice):
+        start, stop, step = index.indices(len(self))
+        lines = self.getLines(self._first + start, self._first + max(start, stop))
+        if step != 1:
+          lines = lines[::step]
+        return lines
+
+      if index < 0:
+        index += len(self)
+      if index < 0 or index >= len(self):
+        raise IndexError("DataBuffer index out of range")
+      return self._lines[self._slot(self._first + index)]
+    finally:
+      self._lock.release()
+
+
+class TrigramIndex:
+  """
+  Maps each three character sequence (of the lowercased lines) to an
+  array of the line numbers of the lines it's in.  The DataBuffer
+  updates it every time lines are added and tells it when lines are
+  dropped.  Line numbers only go up, so the arrays are sorted and the
+  dropped lines are at the start of them.  Rather than shifting an
+  array every time its first line is dropped, we keep where its live
+  entries start and only cut off the dead ones once they're half of
+  it.
+  """
+  def __init__(self, lineno=0):
+    """
+    @param lineno: the line number of the first line to index
+    @type  lineno: int
+    """
+    self._postings = {}
+
+    # trigram -> index of the first live entry in its postings (for
+    # trigrams where that isn't 0)
+    self._starts = {}
+
+    # the next line number to index and the number of live entries
+    self._next = lineno
+    self._entries = 0
+
+  def getNextLineNumber(self):
+    """
+    Returns the line number of the first line that isn't indexed.
+
+    @rtype: int
+    """
+    return self._next
+
+  def update(self, buffer, limit=None):
+    """
+    Indexes the lines that have been added to the buffer since the
+    last update.  The newest line isn't indexed if it's a partial line
+    since it can still change.
+
+    @param buffer: the buffer this indexes
+    @type  buffer: DataBuffer
+
+    @param limit: the most lines to index (None for all of them)
+    @type  limit: int
+    """
+    first = buffer.getFirstLineNumber()
+    end = buffer.getNextLineNumber()
+    if end > first and not buffer.getLine(end - 1).endswith("\n"):
+      end = end - 1
+    if limit != None:
+      end = min(end, max(self._next, first) + limit)
+
+    postings = self._postings
+    get = postings.get
+    entries = 0
+    for lineno in xrange(max(self._next, first), end):
+      for tri in _trigrams(buffer.getLine(lineno)):
+        linenos = get(tri)
+        if linenos == None:
+          postings[tri] = array.array("i", [lineno])
+        else:
+          linenos.append(lineno)
+        entries += 1
+    self._entries += entries
+    self._next = max(self._next, end)
+
+  def drop(self, lineno, lines):
+    """
+    Takes lines that are being dropped from the buffer out of the
+    index.  They have to be the oldest lines in the index.
+
+    @param lineno: the line number of the first of the lines
+    @type  lineno: int
+
+    @param lines: the lines
+    @type  lines: list of strings
+    """
+    postings = self._postings
+    starts = self._starts
+    for i in xrange(min(len(lines), self._next - lineno)):
+      trigrams = _trigrams(lines[i])
+      self._entries -= len(trigrams)
+      for tri in trigrams:
+        linenos = postings[tri]
+        start = starts.get(tri, 0) + 1
+        if start == len(linenos):
+          del postings[tri]
+          if starts.has_key(tri):
+            del starts[tri]
+        elif start > 16 and start * 2 > len(linenos):
+          del linenos[:start]
+          del starts[tri]
+        else:
+          starts[tri] = start
+
+  def getByteCount(self):
+    """
+    Returns roughly how many bytes the index takes up.
+
+    @rtype: int
+    """
+    return self._entries * 4 + len(self._postings) * TRIGRAM_OVERHEAD
+
+  def find(self, trigrams, start, end):
+    """
+    Returns the line numbers between start and end of the lines that
+    have all the trigrams in them.  This takes time in proportion to
+    the number of lines the least common trigram is in.
+
+    @param trigrams: the trigrams
+    @type  trigrams: list of strings
+
+    @param start: the first line number to look at
+    @type  start: int
+
+    @param end: the line number to stop before
+    @type  end: int
+
+    @returns: the line numbers
+    @rtype: list of ints
+    """
+    lists = []
+    for mem in trigrams:
+      if not self._postings.has_key(mem):
+        return []
+      linenos = self._postings[mem]
+      lists.append((len(linenos) - self._starts.get(mem, 0), linenos))
+    lists.sort(lambda x, y: cmp(x[0], y[0]))
+    lists = [m[1] for m in lists]
+
+    ret = []
+    rarest = lists[0]
+    others = lists[1:]
+    for i in xrange(bisect.bisect_left(rarest, start), len(rarest)):
+      lineno = rarest[i]
+      if lineno >= end:
+        break
+      for mem in others:
+        j = bisect.bisect_left(mem, lineno)
+        if j == len(mem) or mem[j] != lineno:
+          break
+      else:
+        ret.append(lineno)
+    return ret
+
+  def getStatus(self):
+    """
+    Returns a one-liner describing the index.
+
+    @rtype: string
+    """
+    return "%d trigram(s), %d entries, indexed to line %d" % \
+           (len(self._postings), self._entries, self._next)
+
+
+# the bytes we count for each trigram in a TrigramIndex on top of its
+# line numbers (the string, the array and the dict entries)
+TRIGRAM_OVERHEAD = 120
+
+# each block in a spill file starts with the line number of its first
+# line, the number of lines and the length of the compressed data
+BLOCK_HEADER = "<qii"
+
+class SpillFile:
+  """
+  An append-only file of the lines dropped from a DataBuffer.  Lines
+  are collected until there's a block's worth, then the block (the
+  line times, the line lengths and the text) gets compressed with zlib
+  and written out.  We keep the line number and time of the first
+  line of each block and where the block is in the file.  Blocks are
+  read back through mmap and the last few we've read are cached.
+  It's only used through its DataBuffer whose lock covers it.
+  """
+  def __init__(self, file, lineno, blocklines=1000):
+    """
+    @param file: the file to use which must be open for reading and 
+        writing.  we truncate it.
+    @type  file: file
+
+    @param lineno: the line number of the first line we'll get
+    @type  lineno: int
+
+    @param blocklines: the number of lines in a block
+    @type  blocklines: int
+    """
+    self._file = file
+    self._blocklines = blocklines
+    self._map = None
+    self._cache = utils.LRUCache(8)
+    self.clear(lineno)
+
+  def clear(self, lineno):
+    """
+    Removes all the lines.
+
+    @param lineno: the line number of the next line we'll get
+    @type  lineno: int
+    """
+    self._closeMap()
+    self._file.seek(0)
+    self._file.truncate()
+    self._size = 0
+    self._cache.clear()
+
+    # the block index: first line number, time of the first line,
+    # offset of the compressed data and its length
+    self._blockfirsts = array.array("l")
+    self._blocktimes = array.array("d")
+    self._offsets = array.array("l")
+    self._lengths = array.array("l")
+
+    # lines waiting for there to be a block's worth
+    self._pendingfirst = lineno
+    self._pending = []
+    self._pendingtimes = array.array("d")
+
+  def close(self):
+    """
+    Closes the file.
+    """
+    self._closeMap()
+    self._file.close()
+
+  def _closeMap(self):
+    if self._map != None:
+      self._map.close()
+      self._map = None
+
+  def getFirstLineNumber(self):
+    """
+    Returns the line number of the oldest line in here.
+
+    @rtype: int
+    """
+    if self._blockfirsts:
+      return self._blockfirsts[0]
+    return self._pendingfirst
+
+  def getNextLineNumber(self):
+    """
+    Returns the line number the next line added will get.
+
+    @rtype: int
+    """
+    return self._pendingfirst + len(self._pending)
+
+  def add(self, lines, times):
+    """
+    Adds lines to the end.
+
+    @param lines: the lines
+    @type  lines: list of strings
+
+    @param times: the time each line arrived
+    @type  times: array of doubles
+    """
+    self._pending.extend(lines)
+    self._pendingtimes.extend(times)
+    while len(self._pending) >= self._blocklines:
+      self._writeBlock(self._blocklines)
+
+  def _writeBlock(self, count):
+    lines = self._pending[:count]
+    lengths = array.array("l", [len(m) for m in lines])
+    data = zlib.compress(self._pendingtimes[:count].tostring() +
+                         lengths.tostring() + "".join(lines))
+    header = struct.pack(BLOCK_HEADER, self._pendingfirst, count, len(data))
+
+    self._file.seek(self._size)
+    self._file.write(header + data)
+
+    self._blockfirsts.append(self._pendingfirst)
+    self._blocktimes.append(self._pendingtimes[0])
+    self._offsets.append(self._size + len(header))
+    self._lengths.append(len(data))
+    self._size = self._size + len(header) + len(data)
+
+    del self._pending[:count]
+    del self._pendingtimes[:count]
+    self._pendingfirst = self._pendingfirst + count
+
+  def _readBlock(self, i):
+    """
+    Returns the (times, lines, text) of block i.
+    """
+    block = self._cache.get(i)
+    if block != None:
+      return block
+
+    offset = self._offsets[i]
+    end = offset + self._lengths[i]
+    if self._map == None or len(self._map) < end:
+      self._closeMap()
+      self._file.flush()
+      self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+    data = zlib.decompress(self._map[offset:end])
+
+    if i + 1 < len(self._blockfirsts):
+      count = self._blockfirsts[i + 1] - self._blockfirsts[i]
+    else:
+      count = self._pendingfirst - self._blockfirsts[i]
+
+    times = array.array("d")
+    times.fromstring(data[:times.itemsize * count])
+    pos = times.itemsize * count
+    lengths = array.array("l")
+    lengths.fromstring(data[pos:pos + lengths.itemsize * count])
+    pos = pos + lengths.itemsize * count
+
+    text = data[pos:]
+    lines = []
+    for mem in lengths:
+      lines.append(data[pos:pos + mem])
+      pos = pos + mem
+
+    block = (times, lines, text)
+    self._cache.put(i, block)
+    return block
+
+  def _findBlock(self, lineno):
+    """
+    Returns the index of the block with the line in it or -1 if the
+    line is still waiting to be written.
+    """
+    if lineno >= self._pendingfirst:
+      return -1
+    return bisect.bisect_right(self._blockfirsts, lineno) - 1
+
+  def _check(self, lineno):
+    if lineno < self.getFirstLineNumber() or lineno >= self.getNextLineNumber():
+      raise IndexError("line %d is not in the buffer" % lineno)
+
+  def getLine(self, lineno):
+    """
+    Returns a line by its line number.
+
+    @raises IndexError: if that line isn't in here
+    """
+    self._check(lineno)
+    i = self._findBlock(lineno)
+    if i == -1:
+      return self._pending[lineno - self._pendingfirst]
+    return self._readBlock(i)[1][lineno - self._blockfirsts[i]]
+
+  def getTime(self, lineno):
+    """
+    Returns the time a line arrived by its line number.
+
+    @raises IndexError: if that line isn't in here
+    """
+    self._check(lineno)
+    i = self._findBlock(lineno)
+    if i == -1:
+      return self._pendingtimes[lineno - self._pendingfirst]
+    return self._readBlock(i)[0][lineno - self._blockfirsts[i]]
+
+  def getLines(self, start, end):
+    """
+    Returns the lines between two line numbers.
+
+    @returns: the lines
+    @rtype: list of strings
+    """
+    start = max(start, self.getFirstLineNumber())
+    end = min(end, self.getNextLineNumber())
+
+    ret = []
+    while start < end:
+      i = self._findBlock(start)
+      if i == -1:
+        ret.extend(self._pending[start - self._pendingfirst:end - self._pendingfirst])
+        break
+      first = self._blockfirsts[i]
+      lines = self._readBlock(i)[1]
+      ret.extend(lines[start - first:end - first])
+      start = first + len(lines)
+    return ret
+
+  def getLineNumberAt(self, timestamp):
+    """
+    Returns the line number of the first line that arrived at or
+    after the given time or the next line number if they all
+    arrived before then.
+
+    @rtype: int
+    """
+    low, high = self.getFirstLineNumber(), self.getNextLineNumber()
+    
+    # narrow it down to a block before we start reading them
+    i = bisect.bisect_left(self._blocktimes, timestamp)
+    if i < len(self._blockfirsts):
+      high = self._blockfirsts[i]
+    if i > 0:
+      low = self._blockfirsts[i - 1]
+
+    while low < high:
+      mid = (low + high) // 2
+      if self.getTime(mid) < timestamp:
+        low = mid + 1
+      else:
+        high = mid
+    return low
+
+  def search(self, regexp, start, end):
+    """
+    Returns the line numbers of the lines between two line numbers
+    that match a regular expression.  Blocks that don't have the
+    literal text the expression needs in them are skipped without
+    looking at each line.
+
+    @returns: the matching line numbers in order
+    @rtype: list of ints
+    """
+    start = max(start, self.getFirstLineNumber())
+    end = min(end, self.getNextLineNumber())
+
+    literals = []
+    if not regexp.flags & sre_constants.SRE_FLAG_IGNORECASE:
+      literals = required_literals(regexp)
+
+    search = regexp.search
+    ret = []
+    while start < end:
+      i = self._findBlock(start)
+      if i == -1:
+        first = self._pendingfirst
+        lines = self._pending
+      else:
+        first = self._blockfirsts[i]
+        times, lines, text = self._readBlock(i)
+        if [m for m in literals if text.find(m) == -1]:
+          start = first + len(lines)
+          continue
+
+      for lineno in xrange(start, min(end, first + len(lines))):
+        if search(lines[lineno - first]):
+          ret.append(lineno)
+      start = first + len(lines)
+    return ret
+
+  def getStatus(self):
+    """
+    Returns a one-liner describing the spill file.
+
+    @rtype: string
+    """
+    return "%d line(s) in %d block(s), %d byte(s) on disk" % \
+           (self.getNextLineNumber() - self.getFirstLineNumber(), 
+            len(self._blockfirsts), self._size)
+
+
+def _trigrams(text):
+  """
+  Returns the distinct trigrams in the lowercased text.
+  """
+  text = text.rstrip("\n").lower()
+  return set([text[i:i + 3] for i in xrange(len(text) - 2)])
+
+def required_literals(regexp):
+  """
+  Returns pieces of literal text that have to be in any string the
+  regular expression matches.  For example, C{^(\w+) tells you '(.*)'}
+  requires " tells you '" and "'".  It doesn't find all of them, but
+  the ones it finds are right.
+
+  @param regexp: the compiled regular expression
+  @type  regexp: compiled regular expression
+
+  @returns: the pieces of literal text
+  @rtype: list of strings
+  """
+  ret = []
+  try:
+    _find_literals(sre_parse.parse(regexp.pattern, regexp.flags), ret)
+  except (sre_constants.error, TypeError, ValueError):
+    return []
+  return ret
+
+def _find_literals(parsed, ret):
+  current = []
+  for op, av in parsed:
+    if op == sre_constants.LITERAL:
+      current.append(chr(av))
+      continue
+
+    if current:
+      ret.append("".join(current))
+      current = []
+
+    if op == sre_constants.SUBPATTERN:
+      _find_literals(av[1], ret)
+    elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT) and av[0] >= 1:
+      _find_literals(av[2], ret)
+
+  if current:
+    ret.append("".join(current))
+
+def _join_partial_lines(lines):
+  """
+  Joins lines that don't end in a newline onto the line after them.
+  """
+  ret = []
+  for mem in lines:
+    if ret and not ret[-1].endswith("\n"):
+      ret[-1] += mem
+    else:
+      ret.append(mem)
+  return ret
+
+# Local variables:
+# mode:python
+# py-indent-offset:2
+# tab-width:2
+# End:
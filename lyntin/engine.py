@@ -56,8 +56,7 @@ X{shutdown_hook}::
 
 X{timer_hook}::
 
-   The timer hook spams all registered functions every second.  This
-   is how the scheduler works.
+   The timer hook spams all registered functions every second.
 
    Arg mapping: { "tick": int }
 
@@ -155,6 +154,11 @@ class Engine:
     # many which indicates a "bigger problem".
     self._errorcount = 0
 
+    # the number of Lyntin commands (and !-history expressions) that
+    # have gone through handleUserData--handleRepeat uses it to tell
+    # whether an iteration did anything besides send text to the mud
+    self._commandcount = 0
+
     # listeners exist at an engine level.  if you sign up for
     # an input hook, you get the input hook for ALL sessions.
     # this might change at some point....  we'll see.
@@ -211,6 +215,9 @@ class Engine:
     self._current_session = commonsession
 
     self.hookRegister("user_filter_hook", self._managers["command"].filter, 100)
+    self.hookRegister("variable_change_hook", self._managers["command"].clearResolvers)
+    self.hookRegister("config_change_hook", self._managers["command"].clearResolvers)
+    self.hookRegister("config_change_hook", self._managers["history"]._configChange)
 
   def _setupConfiguration(self):
     """
@@ -231,6 +238,19 @@ class Engine:
           "\"north\" again, if repeathistory is on, we record both.  " +
           "Otherwise we would only record the first one."))
 
+    c.add("historysize", config.IntConfig("historysize", 
+          int(cops.get("historysize", 1000)), 0,
+          "The number of lines of user input kept in the history buffer."))
+
+    if config.options["datadir"]:
+      historyfile = config.options["datadir"] + ".lyntinhistory"
+    else:
+      historyfile = ""
+    c.add("historyfile", config.StringConfig("historyfile", 
+          cops.get("historyfile", historyfile), 0,
+          "The file history is saved to and read from when Lyntin starts " +
+          "so it's kept between runs.  Set it to \"\" to not save history."))
+
     c.add("commandchar", config.CharConfig("commandchar", 
           config.options.get("commandchar", "#"), 0, 
           "The character used to denote a command."))
@@ -452,16 +472,16 @@ class Engine:
         exactly what the user typed--this is for the history manager)
     @rtype: string
     """ 
-    if self._managers["config"].get("debugmode") == 1:
+    snap = self._managers["config"].getSnapshot()
+    if snap.debugmode == 1:
       exported.write_message("evaluating: %s" % input)
 
-    inputlist = utils.split_commands(self._managers["config"].get("splitchar"), 
-                                     input)
+    inputlist = utils.split_commands(snap.splitchar, input)
     if session == None:
       session = self._current_session
 
     historyitems = []
-    commandchar = self._managers["config"].get("commandchar")
+    commandchar = snap.commandchar
     for mem in inputlist:
       # mem = mem.strip()
 
@@ -472,6 +492,9 @@ class Engine:
       if internal == 0:
         exported.hook_spam("from_user_hook", {"data": mem})
 
+      if mem.startswith("!") or mem.startswith(commandchar):
+        self._commandcount += 1
+
       if mem.startswith("!"):
         memhistory = self.getManager("history").getHistoryItem(mem)
         if memhistory != None:
@@ -492,8 +515,7 @@ class Engine:
             command = mem.split(" ", 1)[1]
             command = utils.strip_braces(command)
             if num > 0:
-              for i in range(num):
-                loopcommand = self.handleUserData(command, 1, session)
+              loopcommand = self.handleRepeat(command, num, session)
               historyitems.append(commandchar + ses + " {" + loopcommand + "}")
           continue
 
@@ -532,11 +554,66 @@ class Engine:
     # we don't record internal stuff or input that isn't supposed
     # to be echo'd
     executed = ";".join(historyitems)
-    if internal == 0 and self.getConfigManager().get("mudecho") == 1:
+    if internal == 0 and snap.mudecho == 1:
       self.getManager("history").recordHistory(executed)
 
     return executed
 
+  def countCommand(self):
+    """
+    Tells the engine that handling some user input did something
+    besides send text to the mud.  handleUserData counts Lyntin
+    commands itself--this is for filters that do other things (like
+    queueing up a paced speedwalk) so #N runs them every time rather
+    than resending what the first time sent.
+    """
+    self._commandcount += 1
+
+  def handleRepeat(self, input, count, session=None):
+    """
+    Executes input count times (this is what #N does).
+
+    The first time goes through handleUserData as usual.  If that
+    only sent text to the mud (no Lyntin commands ran--not even ones
+    that aliases expanded to), the same text is sent for the other
+    times without going through the user filters again.  Either way
+    the to_mud_hook sees every line and everything goes to the mud
+    in one write.
+
+    @param input: the data from the user
+    @type  input: string
+
+    @param count: the number of times to execute it
+    @type  count: int
+
+    @param session: the session scoping to execute this user input in
+    @type  session: session.Session instance
+
+    @return: the commands that were actually executed the first time
+    @rtype: string
+    """
+    if session == None:
+      session = self._current_session
+
+    session.startBatch()
+    try:
+      start = len(session.getBatch())
+      commandcount = self._commandcount
+      executed = self.handleUserData(input, 1, session)
+
+      if self._commandcount == commandcount:
+        written = session.getBatch()[start:]
+        for i in range(count - 1):
+          for mem in written:
+            session.writeSocket(mem)
+      else:
+        for i in range(count - 1):
+          self.handleUserData(input, 1, session)
+    finally:
+      session.endBatch()
+
+    return executed
+
   def handleMudData(self, session, text):
     """
     Handle input coming from the mud.  We toss this to the 
@@ -593,6 +670,13 @@ class Engine:
     for mem in self._managers.values():
       mem.addSession(session, commonsession)
 
+    # the session's config items were copied from the common session
+    # without spamming the config_change_hook
+    c = self.getConfigManager()
+    session.resizeDataBuffer(c.get("databuffersize", session, 10000),
+                             c.get("databufferbytes", session, 0))
+    session.setDataBufferSpill(c.get("databufferspill", session, 0))
+
     self._sessions[name] = session
 
   def unregisterSession(self, ses):
@@ -711,8 +795,10 @@ class Engine:
       return 0
          
     ses.shutdown((1,))
+    ses.setDataBufferSpill(0)
     self.unregisterSession(ses)
     exported.hook_unregister("shutdown_hook", ses.shutdown)
+    exported.hook_unregister("config_change_hook", ses._configChange)
     return 1
 
 
@@ -748,6 +834,26 @@ class Engine:
         exported.write_traceback("engine: unhandled error in engine.")
       self._num_events_processed += 1
 
+  def processEvents(self):
+    """
+    Executes the events in the queue until it's empty.  This is for
+    when there's no engine thread (batch mode)--otherwise runengine
+    handles the events.
+    """
+    while 1:
+      try:
+        e = self._event_queue.get_nowait()
+      except Queue.Empty:
+        return
+      try:
+        e.execute()
+      except SystemExit:
+        raise
+      except:
+        self.tallyError()
+        exported.write_traceback("engine: unhandled error in engine.")
+      self._num_events_processed += 1
+
         
   def tallyError(self):
     """
@@ -785,6 +891,7 @@ class Engine:
     data.append("   ansicolor: %d" % self.getConfigManager().get("ansicolor"))
     data.append("   ticks: %d" % self._current_tick)
     data.append("   errors: %d" % self._errorcount)
+    data.append("   split cache: %s" % utils.split_cache.getStatus())
 
     # print info from each session
     data.append("Sessions:")
@@ -1000,7 +1107,8 @@ def main(defaultoptions={}):
           else:
             config.options[opt] = [mem[1]]
 
-    for mem in ["datadir", "ui", "commandchar"]:
+    for mem in ["datadir", "ui", "commandchar", "batch", "batchoutput",
+                "historysize", "historyfile"]:
       if config.options.has_key(mem) and type(config.options[mem]) is list:
         config.options[mem] = config.options[mem][0]
 
@@ -1029,18 +1137,25 @@ def main(defaultoptions={}):
     exported.myengine = Engine.instance
     Engine.instance._setupConfiguration()
 
+    # batch mode runs without a ui so errors go to stderr
+    batchfile = config.options.get("batch")
+    if batchfile:
+      from lyntin import batch
+      exported.hook_register("to_user_hook", batch.error_hook)
+
     # instantiate the ui
     uiinstance = None
-    try:
-      uiname = str(config.options['ui'])
-      modulename = uiname + "ui"
-      uiinstance = base.get_ui(modulename)
-      if not uiinstance:
-        raise ValueError("No ui instance.")
-    except Exception, e:
-      print "Cannot start '%s': %s" % (uiname, e)
-      traceback.print_exc()
-      sys.exit(0)
+    if not batchfile:
+      try:
+        uiname = str(config.options['ui'])
+        modulename = uiname + "ui"
+        uiinstance = base.get_ui(modulename)
+        if not uiinstance:
+          raise ValueError("No ui instance.")
+      except Exception, e:
+        print "Cannot start '%s': %s" % (uiname, e)
+        traceback.print_exc()
+        sys.exit(0)
 
     Engine.instance.setUI(uiinstance)
 
@@ -1075,6 +1190,13 @@ def main(defaultoptions={}):
       # meaning in the argparser
       mem = mem.replace("\\", "\\\\")
       exported.lyntin_command("%sread %s" % (commandchar, mem), internal=1)
+
+    if batchfile:
+      Engine.instance.processEvents()
+      errors = batch.run(Engine.instance, batchfile, 
+                         config.options.get("batchoutput"))
+      exported.hook_spam("shutdown_hook", {})
+      sys.exit(errors and 1 or 0)
   
     # we're done initialization!
     exported.write_message(constants.STARTUPTEXT)
@@ -1090,6 +1212,8 @@ def main(defaultoptions={}):
       engine_thread.join(10)
       timer_thread.join(10)
       
+  except SystemExit:
+    raise
   except:
     import traceback
     traceback.print_exc()
@@ -281,6 +281,27 @@ def get_config(name, ses=None, defaultvalue=constants.NODEFAULTVALUE):
   """
   return myengine.getConfigManager().get(name, ses, defaultvalue)
 
+def get_config_snapshot(ses=None):
+  """
+  Gets the snapshot of config values for a session.  The snapshot
+  has an attribute for each config item holding its current value
+  and is kept up to date when config items change.  It's for code
+  that runs on every line of mud data or user input::
+
+     from lyntin.exported import get_config_snapshot
+
+     snap = get_config_snapshot(ses)
+     if getattr(snap, "ignoreactions", 0) == 0:
+       ...
+
+  @param ses: the session (or None if this is not session-scoped)
+  @type  ses: Session
+
+  @returns: the config snapshot for that session
+  @rtype: config.ConfigSnapshot
+  """
+  return myengine.getConfigManager().getSnapshot(ses)
+
 def add_config(name, configitem, ses=None):
   """
   Adds a new configuration item.  Configuration items allow you to
@@ -582,6 +603,22 @@ def get_history(count=30):
   """
   return get_manager("history").getHistory(count)
 
+def find_history(prefix, count=30):
+  """
+  Retrieves the most recent distinct lines in the history that
+  start with a prefix, newest first.
+
+  @param prefix: the prefix
+  @type  prefix: string
+
+  @param count: the most lines to return
+  @type  count: int
+
+  @return: the matching lines newest first
+  @rtype: list of strings
+  """
+  return get_manager("history").findHistory(prefix, count)
+
 def tally_error():
   """
   This adds one to the current error count and checks to see
@@ -0,0 +1,358 @@
+#########################################################################
+# This file is part of Lyntin.
+#
+# Lyntin is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# Lyntin is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# copyright (c) Free Software Foundation 2001-2007
+#
+#########################################################################
+"""
+This provides the X{expression} evaluator used by #if and #math.
+It handles:
+
+  - numbers (C{5}, C{2.5}) and quoted strings (C{'Joe'}, C{"Joe"})
+  - variables (C{$hp}, C{${hp max}})
+  - arithmetic: C{+ - * / // % **}
+  - comparisons: C{== != < <= > >=} (which chain like Python's)
+  - boolean logic: C{and or not}, C{True}, C{False} and C{None}
+  - parentheses
+
+Expressions are compiled once into a tree of functions and kept in
+a cache keyed on the expression text.  Variables are bound names that
+get looked up every time the expression is evaluated rather than
+being substituted into the text, so C{$hp < 100} is only compiled
+once no matter what $hp is.
+
+Variable values that look like numbers are treated as numbers and
+everything else is a string.  Variables inside quoted strings are
+expanded in place, so C{'$name' == 'Joe'} does what you'd expect.
+Nothing in an expression can run Python code.
+"""
+import re, operator
+import utils
+
+class ExpressionException(Exception):
+  pass
+
+TOKEN_REGEXP = re.compile(r"""\s*(?:
+  (?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)|
+  (?P<string>'(?:\\.|[^'\\])*'|"(?:\\.|[^"\\])*")|
+  (?P<variable>\$\{[^}]*\}|\$\w+(?:\.\w+)*)|
+  (?P<name>[A-Za-z_]\w*)|
+  (?P<op>\*\*|//|==|!=|<>|<=|>=|[-+*/%<>()])
+  )""", re.VERBOSE)
+
+# for finding variables inside quoted strings
+VARIABLE_REGEXP = re.compile(r"\$\{([^}]*)\}|\$(\w+(?:\.\w+)*)")
+
+NAMES = { "True": True, "False": False, "None": None }
+
+COMPARISONS = { "==": operator.eq, "!=": operator.ne, "<>": operator.ne,
+                "<": operator.lt, "<=": operator.le,
+                ">": operator.gt, ">=": operator.ge }
+
+ADDITIVE = { "+": operator.add, "-": operator.sub }
+
+MULTIPLICATIVE = { "*": operator.mul, "/": operator.div,
+                   "//": operator.floordiv, "%": operator.mod }
+
+# compiled Expressions keyed on the expression text
+expression_cache = utils.LRUCache(200)
+
+
+def evaluate(text, lookup):
+  """
+  Compiles (or pulls from the cache) and evaluates an expression.
+
+  @param text: the expression
+  @type  text: string
+
+  @param lookup: function that takes a variable name and returns
+      its value or None if there's no such variable
+  @type  lookup: function
+
+  @return: the value of the expression
+  @rtype: varies
+
+  @raise ExpressionException: if the expression is invalid or uses a
+      variable that doesn't exist
+  """
+  return compile_expression(text).evaluate(lookup)
+
+def compile_expression(text):
+  """
+  Returns the compiled Expression for the text from the cache,
+  compiling it if it's not there.
+
+  @param text: the expression
+  @type  text: string
+
+  @return: the compiled expression
+  @rtype: Expression
+
+  @raise ExpressionException: if the expression is invalid
+  """
+  expr = expression_cache.get(text)
+  if expr == None:
+    expr = Expression(text)
+    expression_cache.put(text, expr)
+  return expr
+
+def convert_value(value):
+  """
+  Converts a variable value to an int or float if it looks like one.
+
+  @param value: the variable value
+  @type  value: string (or something with a __str__)
+
+  @return: the converted value
+  @rtype: int, float or string
+  """
+  value = str(value)
+  try:
+    return int(value)
+  except ValueError:
+    try:
+      return float(value)
+    except ValueError:
+      return value
+
+
+class Expression:
+  """
+  A compiled expression.  Each node of the parsed expression becomes
+  a function that takes the lookup function and returns the node's
+  value.
+  """
+  def __init__(self, text):
+    """
+    Parses and compiles the expression.
+
+    @param text: the expression
+    @type  text: string
+
+    @raise ExpressionException: if the expression is invalid
+    """
+    self.text = text
+    self._tokens = self._tokenize(text)
+    self._index = 0
+
+    self._func = self._parseOr()
+    if self._index < len(self._tokens):
+      raise ExpressionException("unexpected '%s' in expression" %
+                                self._tokens[self._index][1])
+    del self._tokens
+
+  def evaluate(self, lookup):
+    """
+    Evaluates the expression.
+
+    @param lookup: function that takes a variable name and returns
+        its value or None if there's no such variable
+    @type  lookup: function
+
+    @return: the value of the expression
+    @rtype: varies
+
+    @raise ExpressionException: if the expression uses a variable
+        that doesn't exist
+    """
+    return self._func(lookup)
+
+  def _tokenize(self, text):
+    tokens = []
+    pos = 0
+    end = len(text.rstrip())
+    while pos < end:
+      m = TOKEN_REGEXP.match(text, pos)
+      if m == None:
+        raise ExpressionException("invalid expression at '%s'" % text[pos:].strip())
+      tokens.append((m.lastgroup, m.group(m.lastgroup)))
+      pos = m.end()
+    return tokens
+
+  def _peek(self):
+    if self._index < len(self._tokens):
+      return self._tokens[self._index]
+    return (None, None)
+
+  def _next(self):
+    token = self._peek()
+    if token[0] == None:
+      raise ExpressionException("unexpected end of expression")
+    self._index += 1
+    return token
+
+  def _peekOp(self, ops):
+    kind, value = self._peek()
+    if (kind == "op" or kind == "name") and ops.has_key(value):
+      self._index += 1
+      return value
+    return None
+
+  def _parseOr(self):
+    left = self._parseAnd()
+    while self._peekOp({"or": 1}):
+      left = _or(left, self._parseAnd())
+    return left
+
+  def _parseAnd(self):
+    left = self._parseNot()
+    while self._peekOp({"and": 1}):
+      left = _and(left, self._parseNot())
+    return left
+
+  def _parseNot(self):
+    if self._peekOp({"not": 1}):
+      return _unary(operator.not_, self._parseNot())
+    return self._parseComparison()
+
+  def _parseComparison(self):
+    first = self._parseArith()
+    rest = []
+    op = self._peekOp(COMPARISONS)
+    while op:
+      rest.append((COMPARISONS[op], self._parseArith()))
+      op = self._peekOp(COMPARISONS)
+
+    if not rest:
+      return first
+    return _comparison(first, rest)
+
+  def _parseArith(self):
+    left = self._parseTerm()
+    op = self._peekOp(ADDITIVE)
+    while op:
+      left = _binary(ADDITIVE[op], left, self._parseTerm())
+      op = self._peekOp(ADDITIVE)
+    return left
+
+  def _parseTerm(self):
+    left = self._parseFactor()
+    op = self._peekOp(MULTIPLICATIVE)
+    while op:
+      left = _binary(MULTIPLICATIVE[op], left, self._parseFactor())
+      op = self._peekOp(MULTIPLICATIVE)
+    return left
+
+  def _parseFactor(self):
+    op = self._peekOp(ADDITIVE)
+    if op == "-":
+      return _unary(operator.neg, self._parseFactor())
+    if op == "+":
+      return _unary(operator.pos, self._parseFactor())
+    return self._parsePower()
+
+  def _parsePower(self):
+    base = self._parseAtom()
+    if self._peekOp({"**": 1}):
+      return _binary(operator.pow, base, self._parseFactor())
+    return base
+
+  def _parseAtom(self):
+    kind, value = self._next()
+
+    if kind == "number":
+      if value.isdigit():
+        return _constant(int(value))
+      return _constant(float(value))
+
+    if kind == "string":
+      return _string(value[1:-1].decode("string_escape"))
+
+    if kind == "variable":
+      if value.startswith("${"):
+        return _variable(value[2:-1])
+      return _variable(value[1:])
+
+    if kind == "name":
+      if NAMES.has_key(value):
+        return _constant(NAMES[value])
+      raise ExpressionException("unknown name '%s' (variables start with $)" % value)
+
+    if value == "(":
+      func = self._parseOr()
+      if self._next()[1] != ")":
+        raise ExpressionException("missing )")
+      return func
+
+    raise ExpressionException("unexpected '%s' in expression" % value)
+
+
+# these build the functions the compiled expression is made of
+
+def _constant(value):
+  return lambda lookup: value
+
+def _variable(name):
+  def func(lookup, name=name):
+    value = lookup(name)
+    if value == None:
+      raise ExpressionException("no such variable $%s" % name)
+    return convert_value(value)
+  return func
+
+def _string(text):
+  if text.find("$") == -1:
+    return _constant(text)
+
+  # split the string into text and variable names which we fill in
+  # when we're evaluated.  variables that don't exist are left as is.
+  parts = []
+  pos = 0
+  for m in VARIABLE_REGEXP.finditer(text):
+    parts.append((text[pos:m.start()], None))
+    parts.append((m.group(0), m.group(1) or m.group(2)))
+    pos = m.end()
+  parts.append((text[pos:], None))
+
+  def func(lookup, parts=parts):
+    ret = []
+    for text, name in parts:
+      if name != None:
+        value = lookup(name)
+        if value != None:
+          text = str(value)
+      ret.append(text)
+    return "".join(ret)
+  return func
+
+def _unary(op, operand):
+  return lambda lookup: op(operand(lookup))
+
+def _binary(op, left, right):
+  return lambda lookup: op(left(lookup), right(lookup))
+
+def _and(left, right):
+  return lambda lookup: left(lookup) and right(lookup)
+
+def _or(left, right):
+  return lambda lookup: left(lookup) or right(lookup)
+
+def _comparison(first, rest):
+  def func(lookup):
+    left = first(lookup)
+    for op, right in rest:
+      right = right(lookup)
+      if not op(left, right):
+        return False
+      left = right
+    return True
+  return func
+
+# Local variables:
+# mode:python
+# py-indent-offset:2
+# tab-width:2
+# End:
@@ -19,11 +19,26 @@
 # $Id: history.py,v 1.4 2007/07/24 00:39:03 willhelm Exp $
 #########################################################################
 """
-The HistoryManager keeps track of the last 1000 lines of user input 
-X{history}. The HistoryManager is a singleton and it's on an engine 
-scoping thus we don't keep track of history per session.
+The HistoryManager keeps track of the last 1000 (or historysize)
+lines of user input X{history}. The HistoryManager is a singleton and
+it's on an engine scoping thus we don't keep track of history per
+session.
+
+The history is kept in a deque (oldest to newest) so recording a line
+doesn't shift the whole history.  A sorted list of the distinct lines
+in the history along with the last place each one was entered lets
+!prefix and the ui's history search find the most recent line that
+starts with something without looking at the whole history.
+
+If historyfile is set (it's .lyntinhistory in the datadir by
+default), every line that's recorded is appended to it and the
+history is read back from it the first time the history is used, so
+history survives restarting Lyntin.  When the file gets to be more
+than twice historysize lines, it's rewritten with just the last
+historysize lines.
 """
-import manager
+import os, bisect, collections
+import manager, exported
 
 class HistoryManager(manager.Manager):
   """
@@ -35,9 +50,166 @@ class HistoryManager(manager.Manager):
   they may have typed.
   """
   def __init__(self, e):
-    self._history = [""]
     self._config = e.getManager("config")
     self._engine = e
+    self._size = 1000
+
+    # the history oldest to newest
+    self._history = collections.deque()
+
+    # every line that's recorded gets the next sequence number.  the
+    # line at self._history[i] has sequence number 
+    # self._nextseq - len(self._history) + i.
+    self._nextseq = 0
+
+    # the prefix index: the distinct lines in the history sorted and
+    # the sequence number of the last time each one was entered
+    self._sorted = []
+    self._latest = {}
+
+    # the journal file--we open it (and read the history from it)
+    # the first time the history is used
+    self._journalname = None
+    self._journal = None
+    self._loaded = 0
+
+  def _configChange(self, args):
+    """
+    config_change_hook function that picks up changes to historysize
+    and historyfile.
+    """
+    if args["name"] == "historysize":
+      self.setHistorySize(args["newvalue"])
+    elif args["name"] == "historyfile":
+      self.setJournal(args["newvalue"])
+
+  def _load(self):
+    """
+    Opens the journal (if there is one) and reads the history from
+    it.  Called the first time the history is used.
+    """
+    self._loaded = 1
+    if self._journalname == None:
+      self._journalname = self._config.get("historyfile", None, "")
+    self._size = max(self._config.get("historysize", None, 1000), 1)
+    if not self._journalname:
+      return
+
+    lines = []
+    try:
+      if os.path.exists(self._journalname):
+        f = open(self._journalname, "r")
+        lines = f.read().splitlines()
+        f.close()
+
+      # compact the journal if it's gotten big
+      if len(lines) > 2 * self._size:
+        lines = lines[-self._size:]
+        tempname = self._journalname + ".tmp"
+        f = open(tempname, "w")
+        f.write("".join([mem + "\n" for mem in lines]))
+        f.close()
+        os.rename(tempname, self._journalname)
+
+      self._journal = open(self._journalname, "a")
+    except Exception, e:
+      self._journal = None
+      exported.write_error("history: cannot use history file '%s' (%s)." %
+                           (self._journalname, e))
+
+    # the lines are already in the journal so we add them directly
+    for mem in lines[-self._size:]:
+      self._add(mem)
+
+  def _add(self, input):
+    """
+    Adds a line to the history and the prefix index, dropping the
+    oldest line if the history is full.
+    """
+    if len(self._history) >= self._size:
+      self._drop()
+
+    seq = self._nextseq
+    self._nextseq += 1
+    self._history.append(input)
+    if not self._latest.has_key(input):
+      bisect.insort(self._sorted, input)
+    self._latest[input] = seq
+
+  def _drop(self):
+    """
+    Drops the oldest line from the history.
+    """
+    seq = self._nextseq - len(self._history)
+    old = self._history.popleft()
+    if self._latest.get(old) == seq:
+      del self._latest[old]
+      del self._sorted[bisect.bisect_left(self._sorted, old)]
+
+  def setHistorySize(self, size):
+    """
+    Changes how many lines of history we keep.
+
+    @param size: the number of lines
+    @type  size: int
+    """
+    if not self._loaded:
+      self._load()
+    self._size = max(size, 1)
+    while len(self._history) > self._size:
+      self._drop()
+
+  def setJournal(self, filename):
+    """
+    Changes the file history is written to.  The history we have is
+    kept--it isn't read from the new file.
+
+    @param filename: the file to append history to (or "" for none)
+    @type  filename: string
+    """
+    if self._journal:
+      self._journal.close()
+      self._journal = None
+    self._journalname = filename
+    if not self._loaded:
+      self._load()
+    elif filename:
+      try:
+        self._journal = open(filename, "a")
+      except Exception, e:
+        exported.write_error("history: cannot use history file '%s' (%s)." %
+                             (filename, e))
+
+  def findHistory(self, prefix, count=1):
+    """
+    Finds the most recent lines in the history that start with a
+    prefix.
+
+    @param prefix: the prefix
+    @type  prefix: string
+
+    @param count: the most lines to return
+    @type  count: int
+
+    @return: the distinct lines newest first
+    @rtype: list of strings
+    """
+    if not self._loaded:
+      self._load()
+
+    sortedlines = self._sorted
+    latest = self._latest
+    matches = []
+    i = bisect.bisect_left(sortedlines, prefix)
+    while i < len(sortedlines) and sortedlines[i].startswith(prefix):
+      matches.append((latest[sortedlines[i]], sortedlines[i]))
+      i += 1
+
+    if count == 1 and matches:
+      return [max(matches)[1]]
+    matches.sort()
+    matches.reverse()
+    return [mem[1] for mem in matches[:count]]
 
   def getHistoryItem(self, userinput):
     """
@@ -52,6 +224,9 @@ class HistoryManager(manager.Manager):
     @returns: None if we didn't discover anything or the command 
         string at the history index
     """
+    if not self._loaded:
+      self._load()
+
     tokens = userinput.split(" ", 1)
 
     # grab the first (and possibly only) token and remove the !
@@ -60,14 +235,24 @@ class HistoryManager(manager.Manager):
     # if it's very short, we're looking at the last thing typed
     # (prior to this thing they typed)
     if len(index) == 0:
-      returninput = self._history[0]
+      if self._history:
+        returninput = self._history[-1]
+      else:
+        returninput = ""
     else:
+      # !0 is the newest line, !1 the one before that and so on.
+      # negative numbers count from the oldest.  anything else is
+      # a prefix.
       try:
-        returninput = self._history[int(index)]
-      except:
-        for h in self._history:
-          if h[0:len(index)] == index:
-            return h
+        i = int(index)
+        if i >= 0:
+          returninput = self._history[-1 - i]
+        else:
+          returninput = self._history[-1 - i - len(self._history)]
+      except (ValueError, IndexError):
+        found = self.findHistory(index)
+        if found:
+          return found[0]
         return None
 
     # check to see if they want to do a substitution
@@ -80,12 +265,19 @@ class HistoryManager(manager.Manager):
 
   def getHistory(self, count):
     """
-    Returns everything in the history buffer as a list of strings
+    Returns the newest count lines in the history buffer as a list 
+    of strings
 
-    @return: everything in the history buffer
+    @return: the newest count lines of history newest first
     @rtype: list of strings
     """
-    return self._history[:count]
+    if not self._loaded:
+      self._load()
+
+    ret = []
+    for i in xrange(1, min(count, len(self._history)) + 1):
+      ret.append(self._history[-i])
+    return ret
 
   def recordHistory(self, input):
     """
@@ -97,12 +289,32 @@ class HistoryManager(manager.Manager):
     if not input:
       return
 
-    if input == self._history[0] and not self._config.get("repeathistory"):
+    if not self._loaded:
+      self._load()
+
+    if self._history and input == self._history[-1] and \
+       not self._config.get("repeathistory"):
       return
 
-    self._history.insert(0, input)
-    if len(self._history) > 1000:
-      del self._history[-1]
+    self._add(input)
+
+    if self._journal:
+      try:
+        self._journal.write(input.replace("\n", " ") + "\n")
+        self._journal.flush()
+      except Exception, e:
+        self._journal = None
+        exported.write_error("history: cannot write to history file (%s)." % e)
+
+  def getStatus(self, ses):
+    if not self._loaded:
+      return "history not loaded"
+    if self._journal:
+      journal = ", journal '%s'" % self._journalname
+    else:
+      journal = ""
+    return "%d of %d lines, %d distinct%s" % \
+           (len(self._history), self._size, len(self._sorted), journal)
 
 # Local variables:
 # mode:python
@@ -41,7 +41,7 @@ The compiled regular expressions gets recompiled every time a variable
 changes--this allows us to handle Lyntin variables in the action trigger
 statements.
 """
-import re
+import re, bisect
 from lyntin import manager, utils, event, exported, ansi
 from lyntin.modules import modutils
 
@@ -54,7 +54,68 @@ class ActionData:
     self._actions = {}
     self._ses = ses
     self._disabled = {}
-    self._actionlist = None
+
+    # actions are also kept in buckets by tag.  every bucket is a list
+    # of (priority, trigger, action tuple) kept sorted so that enabling
+    # or disabling a tag only has to merge the bucket into (or filter
+    # it out of) the active list rather than re-sorting everything.
+    # the active list is never changed in place--we replace it--so
+    # checkActions can walk it while responses add and remove actions.
+    self._buckets = {}
+    self._actionlist = []
+
+    # the number of times actions have fired
+    self._fired = 0
+
+  def _addToBuckets(self, action):
+    """
+    Adds an action tuple to its tag bucket and to the active list if
+    the tag isn't disabled.
+
+    @param action: the action tuple
+    @type  action: tuple
+    """
+    entry = (action[4], action[0], action)
+    bisect.insort(self._buckets.setdefault(action[6], []), entry)
+    if not self._disabled.has_key(action[6]):
+      actionlist = self._actionlist[:]
+      bisect.insort(actionlist, entry)
+      self._actionlist = actionlist
+
+  def _removeFromBuckets(self, action):
+    """
+    Removes an action tuple from its tag bucket and from the active
+    list.
+
+    @param action: the action tuple
+    @type  action: tuple
+    """
+    entry = (action[4], action[0], action)
+    bucket = self._buckets.get(action[6])
+    if bucket:
+      _remove_entry(bucket, entry)
+      if not bucket:
+        del self._buckets[action[6]]
+    actionlist = self._actionlist[:]
+    _remove_entry(actionlist, entry)
+    self._actionlist = actionlist
+
+  def _rebuildBuckets(self):
+    """
+    Rebuilds all the tag buckets and the active list from scratch.
+    Used when every action tuple changes at once.
+    """
+    self._buckets = {}
+    for action in self._actions.values():
+      self._buckets.setdefault(action[6], []).append((action[4], action[0], action))
+
+    actionlist = []
+    for (tag, bucket) in self._buckets.items():
+      bucket.sort()
+      if not self._disabled.has_key(tag):
+        actionlist.extend(bucket)
+    actionlist.sort()
+    self._actionlist = actionlist
 
   def addAction(self, trigger, response, color=0, priority=5, onetime=0, tag=None):
     """
@@ -88,8 +149,12 @@ class ActionData:
     if not expansion:
       expansion = trigger
     compiled = utils.compile_regexp(expansion, 1)
+
+    if self._actions.has_key(trigger):
+      self._removeFromBuckets(self._actions[trigger])
+
     self._actions[trigger] = (trigger, compiled, response, color, priority, onetime, tag)
-    self._actionlist = None       # invalidating action list
+    self._addToBuckets(self._actions[trigger])
     return 1
 
   def _recompileRegexps(self):
@@ -107,13 +172,16 @@ class ActionData:
 
       self._actions[trigger] = (trigger, compiled, response, color, priority, onetime, tag)
 
+    self._rebuildBuckets()
+
   def clear(self):
     """
     Clears all the stored actions from the action manager.
     """
     self._actions.clear()
     self._disabled = {}
-    self._actionlist = None
+    self._buckets = {}
+    self._actionlist = []
 
   def getInfoMappings(self):
     l = []
@@ -157,35 +225,40 @@ class ActionData:
       (trigger, compiled, response, color, priority, onetime, tag) = actions[mem]
       if not mytag or mytag == tag:
         ret.append((trigger, response, tag))
+        self._removeFromBuckets(actions[mem])
         del actions[mem]
 
-    self._actionlist = None       # invalidating action list
-
     return ret
 
-  def checkActions(self, text):
+  def checkActions(self, text, colorline=None, nocolorline=None):
     """
     Checks to see if text triggered any actions.  Any resulting 
     actions will get added as an InputEvent to the queue.
 
     @param text: the data coming from the mud to check for triggers
     @type  text: string
+
+    @param colorline: the text with ^M filtered out if the caller
+        already has it
+    @type  colorline: string
+
+    @param nocolorline: the text with ^M and ansi color codes filtered
+        out if the caller already has it
+    @type  nocolorline: string
     """
     # FIXME - make sure this works even when lines are broken up.
 
     actionlist = self._actionlist
-    if not actionlist:
-      actionlist = filter(lambda x: not self._disabled.has_key(x[6]),
-                          self._actions.values())
-      actionlist.sort(lambda x,y:cmp(x[3], y[3]))
-      self._actionlist = actionlist
 
-    colorline = utils.filter_cm(text)
-    nocolorline = ansi.filter_ansi(colorline)
+    if colorline == None:
+      colorline = utils.filter_cm(text)
+    if nocolorline == None:
+      nocolorline = ansi.filter_ansi(colorline)
 
     # go through all the lines in the data and see if we have
     # any matches
-    for (action, actioncompiled, response, color, priority, onetime, tag) in actionlist:
+    for entry in actionlist:
+      (action, actioncompiled, response, color, priority, onetime, tag) = entry[2]
       if color:
         match = actioncompiled.search(colorline)
         line = colorline
@@ -194,6 +267,8 @@ class ActionData:
         line = nocolorline
 
       if match:
+        self._fired += 1
+
         # for every match we figure out what the expanded response
         # is and add it as an InputEvent in the queue.  the reason
         # we do a series of separate events rather than one big
@@ -222,8 +297,8 @@ class ActionData:
           exported.write_traceback()
 
         if onetime and self._actions.has_key(action):
+          self._removeFromBuckets(self._actions[action])
           del self._actions[action]
-          self._actionlist = None           # invalidate the list
 
 
   def getStatus(self):
@@ -235,6 +310,15 @@ class ActionData:
     """
     return "%d action(s)." % len(self._actions)
 
+  def getFiredCount(self):
+    """
+    Returns the number of times actions have fired.
+
+    @return: the count
+    @rtype: int
+    """
+    return self._fired
+
   def getInfo(self, text="", tag=None):
     """
     Returns information about the actions in here.
@@ -293,7 +377,9 @@ class ActionData:
     """
     if self._disabled.has_key(tag):
       del self._disabled[tag]
-      self._actionlist = None
+      bucket = self._buckets.get(tag)
+      if bucket:
+        self._actionlist = _merge(self._actionlist, bucket)
 
   def disable(self, tag):
     """
@@ -302,8 +388,11 @@ class ActionData:
     @param tag: tag name
     @type tag: string
     """
+    if self._disabled.has_key(tag):
+      return
     self._disabled[tag] = 1
-    self._actionlist = None
+    if self._buckets.has_key(tag):
+      self._actionlist = [m for m in self._actionlist if m[2][6] != tag]
 
   def listTags(self):
     """
@@ -377,6 +466,9 @@ class ActionManager(manager.Manager):
   def getStatus(self, ses):
     return self.getActionData(ses).getStatus()
 
+  def getFiredCount(self, ses):
+    return self.getActionData(ses).getFiredCount()
+
   def persist(self, args):
     """
     write_hook function for persisting the state of our session.
@@ -412,13 +504,58 @@ class ActionManager(manager.Manager):
     ses = args["session"]
     text = args["dataadj"]
 
-    if exported.get_config("ignoreactions", ses, 0) == 0:
+    if getattr(exported.get_config_snapshot(ses), "ignoreactions", 0) == 0:
       if self._actions.has_key(ses):
-        self._actions[ses].checkActions(text)
+        self._actions[ses].checkActions(text, utils.filter_line_cm(args),
+                                        utils.filter_line_ansi(args))
 
     return text
 
 
+def _remove_entry(entrylist, entry):
+  """
+  Removes an entry from a sorted list of (priority, trigger, action)
+  entries if it's there.
+
+  @param entrylist: the sorted list to remove the entry from
+  @type  entrylist: list of tuples
+
+  @param entry: the entry to remove
+  @type  entry: tuple
+  """
+  i = bisect.bisect_left(entrylist, entry[:2])
+  if i < len(entrylist) and entrylist[i][:2] == entry[:2]:
+    del entrylist[i]
+
+def _merge(list1, list2):
+  """
+  Merges two sorted lists of (priority, trigger, action) entries into
+  a new sorted list in a single pass.
+
+  @param list1: the first sorted list
+  @type  list1: list of tuples
+
+  @param list2: the second sorted list
+  @type  list2: list of tuples
+
+  @return: the merged list
+  @rtype:  list of tuples
+  """
+  ret = []
+  i = j = 0
+  len1 = len(list1)
+  len2 = len(list2)
+  while i < len1 and j < len2:
+    if list2[j][:2] < list1[i][:2]:
+      ret.append(list2[j])
+      j = j + 1
+    else:
+      ret.append(list1[i])
+      i = i + 1
+  ret.extend(list1[i:])
+  ret.extend(list2[j:])
+  return ret
+
 def get_ordered_vars(text):
   """
   Takes in a string and removes any ordered variables
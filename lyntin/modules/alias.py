@@ -36,18 +36,44 @@ Whenever the user types "l3k" this module expands it to
 "#ses a localhost 3000" which then (after going through other user_filter
 hook functions) gets executed.
 
-Aliases are currently handled via string finding and not regular
-expressions.  At some point in the future, this will be changed to
-regular expressions to better handle a wider variety of aliases.
+Aliases are looked up by the first word of the input.  Aliases with
+spaces in their name match the first few words of the input--the
+longest one wins.  Aliases whose name is a regular expression using
+the r[ ... ] syntax are pattern aliases and they're checked if no
+other alias matched.  For pattern aliases %0 is the whole input and
+%1, %2, ... are the groups in the regular expression.
+
+A command in an alias's expansion that matches the same alias (like
+the "east" in "east -> open door;east") goes to the mud as it is
+rather than expanding again.  Otherwise aliases can expand to other
+aliases (or to themselves through commands like #if) up to MAX_DEPTH
+deep.  Past that the input is dropped with an error so aliases that
+expand to each other don't recurse forever.
 """
 from lyntin import manager, utils, exported
 from lyntin.modules import modutils
 
+# the most aliases that can be expanding inside one another
+MAX_DEPTH = 50
+
 class AliasData:
   """ Manages aliases."""
   def __init__(self):
     self._aliases = {}
 
+    # name -> compiled placement template (see 
+    # utils.compile_placement_vars) so we only look for placement
+    # variables when the alias is added
+    self._templates = {}
+
+    # the most words in the name of a (non-pattern) alias
+    self._maxwords = 1
+
+    # name -> compiled regexp of pattern aliases and the combined 
+    # matcher for them which gets built when we need it
+    self._patterns = {}
+    self._patternset = None
+
   def addAlias(self, name, expansion):
     """
     Adds an alias to the dict.
@@ -62,13 +88,30 @@ class AliasData:
     """
     if name == expansion:
       raise ValueError, "name cannot equal expansion."
+
+    if utils.REG_REGEXP.match(name):
+      self._patterns[name] = utils.compile_regexp(name)
+      self._patternset = None
+
+    try:
+      self._templates[name] = utils.compile_placement_vars(expansion)
+    except ValueError:
+      # expand_placement_vars will complain about it when the 
+      # alias gets used
+      self._templates[name] = expansion
+
     self._aliases[name] = expansion
+    self._maxwords = max(self._maxwords, len(name.split(" ")))
 
   def clear(self):
     """
     Removes all the aliases.
     """
     self._aliases.clear()
+    self._templates.clear()
+    self._maxwords = 1
+    self._patterns.clear()
+    self._patternset = None
 
   def removeAliases(self, text):
     """
@@ -90,6 +133,14 @@ class AliasData:
     for mem in badaliases:
       ret.append((mem, self._aliases[mem]))
       del self._aliases[mem]
+      del self._templates[mem]
+      if self._patterns.has_key(mem):
+        del self._patterns[mem]
+        self._patternset = None
+
+    self._maxwords = 1
+    for mem in self._aliases.keys():
+      self._maxwords = max(self._maxwords, len(mem.split(" ")))
 
     return ret
 
@@ -104,6 +155,47 @@ class AliasData:
     listing.sort()
     return listing
 
+  def _lookup(self, input):
+    """
+    Finds the alias that matches the input.
+
+    @param input: the user input
+    @type  input: string
+
+    @return: the alias name and the list of words to fill in the 
+        placement variables with (the first one being the alias) or 
+        None if no alias matches
+    @rtype: (string, list of strings)
+    """
+    if len(input) == 0:
+      return None
+
+    # the longest run of first words that's an alias--usually that's
+    # just the first word
+    inputsplit = input.split(' ')
+    for i in range(min(self._maxwords, len(inputsplit)), 1, -1):
+      name = ' '.join(inputsplit[:i])
+      if self._aliases.has_key(name) and not self._patterns.has_key(name):
+        return (name, [name] + inputsplit[i:])
+
+    if self._aliases.has_key(inputsplit[0]) and not self._patterns.has_key(inputsplit[0]):
+      return (inputsplit[0], inputsplit)
+
+    # then the pattern aliases
+    if self._patterns:
+      if self._patternset == None:
+        listing = self._patterns.keys()
+        listing.sort()
+        self._patternset = utils.RegexpSet([(mem, self._patterns[mem]) for mem in listing])
+
+      name = self._patternset.search(input)
+      if name != None:
+        match = self._patterns[name].search(input)
+        groups = [m or "" for m in match.groups()]
+        return (name, [input] + groups)
+
+    return None
+
   def expand(self, input):
     """
     Looks at user input and expands any aliases involved.
@@ -118,16 +210,41 @@ class AliasData:
         or None
     @rtype: string
     """
-    if len(input) > 0:
-      # pull out the first word of the input
-      firstword = input.split(' ', 1)[0]
-
-      # if we match an alias, we return the expansion
-      if firstword in self._aliases.keys():
-        return self._aliases[firstword]            
+    found = self._lookup(input)
+    if found:
+      return self._aliases[found[0]]
 
     return None
 
+  def expandInput(self, input):
+    """
+    Looks at user input and if it's an alias, returns the alias and 
+    the expansion with the placement variables filled in.
+
+    @param input: the user input to expand
+    @type  input: string
+
+    @return: the alias name and the finished expansion or None
+    @rtype: (string, string)
+    """
+    found = self._lookup(input)
+    if not found:
+      return None
+
+    (name, inputsplit) = found
+    template = self._templates[name]
+
+    if type(template) == type(""):
+      # the template didn't compile
+      return (name, utils.expand_placement_vars(' '.join(inputsplit), template))
+
+    if template[-1] == None and self._patterns.has_key(name):
+      # pattern aliases without placement variables don't get the 
+      # input tacked on the end
+      inputsplit = inputsplit[:1]
+
+    return (name, utils.expand_placement_template(template, inputsplit))
+
   def getStatus(self):
     """
     Returns the one-line status of this manager.
@@ -183,6 +300,10 @@ class AliasManager(manager.Manager):
     # session -> AliasData objects
     self._aliasdata = {}
 
+    # (session, alias name, commands in its expansion) for the
+    # aliases we're in the middle of expanding--innermost last
+    self._expanding = []
+
   def getAliasData(self, ses):
     if not self._aliasdata.has_key(ses):
       self._aliasdata[ses] = AliasData()
@@ -247,15 +368,33 @@ class AliasManager(manager.Manager):
     if not self._aliasdata.has_key(ses) or verbatim == 1:
       return text
 
-    aliasexpansion = self._aliasdata[ses].expand(text)
-
-    if not aliasexpansion:
+    found = self._aliasdata[ses].expandInput(text)
+    if not found:
       return text
-    else:
-      aliasexpansion = utils.expand_placement_vars(text, aliasexpansion)
-      exported.lyntin_command(aliasexpansion, 1, ses)
+
+    (name, aliasexpansion) = found
+    if self._expanding:
+      (lastses, lastname, commands) = self._expanding[-1]
+      if lastses == ses and lastname == name and commands.has_key(text):
+        return text
+
+    if len(self._expanding) >= MAX_DEPTH:
+      exported.write_error("alias: more than %d aliases inside one another " \
+                           "expanding '%s'." % (MAX_DEPTH, name), ses)
       return None
 
+    commands = {}
+    splitchar = exported.get_config_snapshot().splitchar
+    for mem in utils.split_commands(splitchar, aliasexpansion):
+      commands[mem] = 1
+
+    self._expanding.append((ses, name, commands))
+    try:
+      exported.lyntin_command(aliasexpansion, 1, ses)
+    finally:
+      self._expanding.pop()
+    return None
+
   def addSession(self, newsession, basesession=None):
     if basesession:
       if self._aliasdata.has_key(basesession):
@@ -289,10 +428,19 @@ def alias_cmd(ses, args, input):
   last item in the list, %:-1 is everything but the last item in the
   list. 
 
+  Aliases with spaces in the name match the first few words of the
+  input.  Aliases named with the r[ ... ] regular expression syntax
+  match anywhere in the input--%0 is the whole input and %1, %2, ... 
+  are the groups in the regular expression.
+
+  An alias doesn't get expanded again in its own expansion.
+
   examples:
     #alias {k*}                    - prints out aliases that start with k
     #alias {k} {kill %1}           - builds a new alias
     #alias {gg} {put %1: in chest} - builds a new alias
+    #alias {get all} {get all;put all in bag}
+    #alias {r[^k(ill)? (\\S+)$]} {kill %2;cackle}
 
   category: commands
   """
@@ -30,6 +30,11 @@ class GagData:
     self._gags = {}
     self._antigags = {}
 
+    # the combined matchers get built the first time we need them
+    # after the gags or antigags change
+    self._gagset = None
+    self._antigagset = None
+
   def addGag(self, item):
     """
     Adds a gag to the dict.
@@ -39,11 +44,13 @@ class GagData:
     """
     compiled = utils.compile_regexp(item, 1)
     self._gags[item] = compiled
+    self._gagset = None
 
   def addAntiGag(self, item):
     """ Adds an antigag."""
     compiled = utils.compile_regexp(item, 1)
     self._antigags[item] = compiled
+    self._antigagset = None
 
   def clear(self):
     """
@@ -51,6 +58,8 @@ class GagData:
     """
     self._gags.clear()
     self._antigags.clear()
+    self._gagset = None
+    self._antigagset = None
 
   def removeGags(self, text):
     """
@@ -71,6 +80,7 @@ class GagData:
     for mem in badgags:
       ret.append(mem)
       del self._gags[mem]
+    self._gagset = None
 
     return ret
 
@@ -87,6 +97,7 @@ class GagData:
     for mem in badgags:
       ret.append(mem)
       del self._antigags[mem]
+    self._antigagset = None
 
     return ret
 
@@ -101,7 +112,7 @@ class GagData:
     listing.sort()
     return listing
 
-  def expand(self, text):
+  def expand(self, text, nocolortext=None):
     """
     Looks at mud data and performs any gags.
 
@@ -110,21 +121,31 @@ class GagData:
     @param text: the text to expand gags in
     @type  text: string
 
+    @param nocolortext: the text with ansi color codes filtered out
+        if the caller already has it
+    @type  nocolortext: string
+
     @return: the (un)adjusted text
     @rtype: string
     """
     if len(text) > 0:
+      if self._gagset == None:
+        self._gagset = utils.RegexpSet(self._gags.items())
+      if self._antigagset == None:
+        self._antigagset = utils.RegexpSet(self._antigags.items())
+
+      if nocolortext == None:
+        nocolortext = ansi.filter_ansi(text)
+
       # check for antigags first
-      for mem in self._antigags.values():
-        if mem.search(ansi.filter_ansi(text)):
-          return text
+      if self._antigagset.search(nocolortext) != None:
+        return text
 
       # check for gags
-      for mem in self._gags.values():
-        if mem.search(ansi.filter_ansi(text)):
-          tokens = ansi.split_ansi_from_text(text)
-          tokens = [m for m in tokens if ansi.is_color_token(m)]
-          return "".join(tokens)
+      if self._gagset.search(nocolortext) != None:
+        tokens = ansi.split_ansi_from_text(text)
+        tokens = [m for m in tokens if ansi.is_color_token(m)]
+        return "".join(tokens)
 
     return text 
 
@@ -252,7 +273,7 @@ class GagManager(manager.Manager):
         for mem in bdata._gags.keys():
           ndata.addGag(mem)
         for mem in bdata._antigags.keys():
-          ndaga.addAntiGag(mem)
+          ndata.addAntiGag(mem)
 
   def removeSession(self, ses):
     if self._gagdata.has_key(ses):
@@ -281,8 +302,9 @@ class GagManager(manager.Manager):
     ses = args["session"]
     text = args["dataadj"]
 
-    if exported.get_config("ignoresubs", ses, 0) == 0 and self._gagdata.has_key(ses):
-      text = self._gagdata[ses].expand(text)
+    if self._gagdata.has_key(ses) and \
+        getattr(exported.get_config_snapshot(ses), "ignoresubs", 0) == 0:
+      text = self._gagdata[ses].expand(text, utils.filter_line_ansi(args))
     return text
 
 
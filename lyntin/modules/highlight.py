@@ -28,16 +28,25 @@ Note, if Lyntin's ansi is turned off, though, highlights won't happen.
 We might at some point want to highlight things with [[ ... ]] or 
 something like that when ansi is off.
 """
+import re
 from lyntin import ansi, manager, utils, config, exported
 from lyntin.modules import modutils
 
 
+RESET = chr(27) + "[0m"
+
 class HighlightData:
   def __init__(self):
     self._highlights = {}
     self._currcolor = list(ansi.DEFAULT_COLOR)
     self._colorleftover = ''
 
+    # the sorted list of (text, markup, compiled, literal) highlights
+    # and a combined matcher for all of them.  these get built the 
+    # first time we need them after the highlights change.
+    self._hlist = None
+    self._hset = None
+
   def addHighlight(self, style, text):
     """
     Adds a highlight to the dict.
@@ -51,12 +60,14 @@ class HighlightData:
     style = style.lower()
     markup, compiled = ansi.get_color(style), utils.compile_regexp(text, 0, 1)
     self._highlights[text] = (style, markup, compiled)
+    self._hlist = None
 
   def clear(self):
     """
     Removes all the highlights.
     """
     self._highlights.clear()
+    self._hlist = None
 
   def removeHighlights(self, text):
     """
@@ -77,6 +88,7 @@ class HighlightData:
     for mem in badhighlights:
       ret.append((self._highlights[mem][0], mem))
       del self._highlights[mem]
+    self._hlist = None
 
     return ret
 
@@ -91,7 +103,7 @@ class HighlightData:
     listing.sort()
     return listing
 
-  def expand(self, text):
+  def expand(self, text, faketext=None):
     """
     Looks at mud data and performs any highlights.
 
@@ -100,107 +112,193 @@ class HighlightData:
     @param text: the input text
     @type  text: string
 
+    @param faketext: the input text with ansi color codes filtered out
+        if the caller already has it
+    @type  faketext: string
+
     @return: the finalized text--even if no highlights were expanded
     @rtype: string
     """
     if text:
-      faketext = ansi.filter_ansi(text)
+      if faketext == None:
+        faketext = ansi.filter_ansi(text)
       textlist = ansi.split_ansi_from_text(text)
-      hlist = self._highlights.keys()
-      hlist.sort()
-      for mem in hlist:
-        miter = self._highlights[mem][2].finditer(faketext)
-        for m in miter:
-          # we need to loop for multiple instances of the highlight
-          begin, end = m.span()
-          hl = self._highlights[mem][1]
-          textlist = self.highlight(textlist, begin, end - begin, hl)
+
+      spans = self._findSpans(faketext)
+      if spans:
+        newtext = self._render(textlist, spans)
+      else:
+        newtext = text
 
       # here we sweep through the text string to update our current
       # color and leftover color attributes
       self._currcolor, self._colorleftover = ansi.figure_color(textlist, self._currcolor, self._colorleftover)
 
-      text = "".join(textlist)
+      text = newtext
 
     return text
 
-  def highlight(self, textlist, place, memlength, hl):
+  def _buildLists(self):
+    """
+    Builds the sorted highlight list and the matchers we use to figure
+    out which highlights apply to a line.
+    """
+    hlist = self._highlights.keys()
+    hlist.sort()
+    self._hlist = [(mem, self._highlights[mem][1], self._highlights[mem][2],
+                    utils.get_literal(self._highlights[mem][2]))
+                   for mem in hlist]
+    self._hset = utils.RegexpSet([(mem[0], mem[2]) for mem in self._hlist])
+
+    # plain text highlights map to their place in the sorted list and 
+    # get found with the trie.  the others we always check.
+    self._hliterals = {}
+    self._hpatterns = []
+    for i in range(len(self._hlist)):
+      literal = self._hlist[i][3]
+      if literal == None:
+        self._hpatterns.append(i)
+      elif literal and not self._hliterals.has_key(literal):
+        self._hliterals[literal] = i
+
+    self._htrie = None
+    if self._hliterals:
+      self._htrie = re.compile("(?=(" + utils.trie_regexp(self._hliterals.keys()) + "))")
+
+  def _findSpans(self, faketext):
+    """
+    Finds all the places highlights match in the text.  Where 
+    highlights overlap, the one that sorts first wins and the others
+    only get the parts it doesn't cover.
+
+    @param faketext: the text with the ansi color codes filtered out
+    @type  faketext: string
+
+    @returns: sorted list of non-overlapping (begin, end, markup) spans
+    @rtype: list of (int, int, string)
     """
-    Takes a bunch of stuff and applies the highlight involved.  
-    It's messy.
+    if self._hlist == None:
+      self._buildLists()
+
+    # most lines don't have anything to highlight in them
+    if self._hset.search(faketext) == None:
+      return []
+
+    # figure out which plain text highlights are in the line with one
+    # pass of the trie.  the trie gives us the longest one starting at
+    # each place, so we check the shorter ones starting there too.
+    candidates = self._hpatterns[:]
+    if self._htrie:
+      found = {}
+      for m in self._htrie.finditer(faketext):
+        literal = m.group(1)
+        while literal:
+          if self._hliterals.has_key(literal) and not found.has_key(literal):
+            found[literal] = 1
+            candidates.append(self._hliterals[literal])
+          literal = literal[:-1]
+      candidates.sort()
+
+    spans = []
+    for i in candidates:
+      (mem, markup, compiled, literal) = self._hlist[i]
+      if literal != None:
+        # plain text highlights are faster to find with find
+        matches = []
+        begin = faketext.find(literal)
+        while begin != -1:
+          matches.append((begin, begin + len(literal)))
+          begin = faketext.find(literal, begin + len(literal))
+      else:
+        matches = [m.span() for m in compiled.finditer(faketext)]
+
+      for (begin, end) in matches:
+        if begin == end:
+          continue
+
+        # trim the span by the spans we already have
+        pieces = [(begin, end)]
+        for (b, e, hl) in spans:
+          newpieces = []
+          for (pb, pe) in pieces:
+            if pe <= b or pb >= e:
+              newpieces.append((pb, pe))
+            else:
+              if pb < b:
+                newpieces.append((pb, b))
+              if pe > e:
+                newpieces.append((e, pe))
+          pieces = newpieces
+
+        for (pb, pe) in pieces:
+          spans.append((pb, pe, markup))
+
+    spans.sort()
+    return spans
+
+  def _render(self, textlist, spans):
+    """
+    Builds the highlighted text in one pass over the text and color
+    tokens.  Color tokens that fall in a highlight are dropped, but we
+    keep track of them so we can put the right color back after the
+    highlight ends.
 
     @param textlist: the list of strings representing the incoming
         text--this is usually text interspersed with ansi color tokens.
     @type textlist: list of strings
 
-    @param place: the point in the text (skipping over ansi color stuff)
-        that marks the beginning of the highlight
-    @type  place: int
-
-    @param memlength: the length of the string to be highlighted
-    @type  memlength: int
-
-    @param hl: the highlight to apply
-    @type  hl: string
+    @param spans: sorted list of non-overlapping (begin, end, markup) 
+        spans where begin and end are places in the text skipping
+        over ansi color stuff
+    @type  spans: list of (int, int, string)
 
-    @returns: the newly adjusted textlist
-    @rtype: list of strings
+    @returns: the highlighted text
+    @rtype: string
     """
-    # first we find the place to stick the highlight thingy.
-    i = 0
-    for i in range(0, len(textlist)):
-      if not ansi.is_color_token(textlist[i]):
-        if place > len(textlist[i]):
-          place -= len(textlist[i])
-        else:
-          break
+    newlist = []
+    color = list(self._currcolor)
+    place = 0
+    si = 0
+    numspans = len(spans)
+    inspan = 0
+
+    for mem in textlist:
+      if ansi.is_color_token(mem):
+        color = ansi.figure_color([mem], color)[0]
+        if not inspan:
+          newlist.append(mem)
+        continue
+
+      i = 0
+      memlength = len(mem)
+      while i < memlength:
+        if inspan:
+          end = spans[si][1] - place
+          if end > memlength:
+            newlist.append(mem[i:])
+            break
+
+          newlist.append(mem[i:end])
+          newlist.append(RESET)
+          newlist.append(ansi.convert_tuple_to_ansi(color))
+          inspan = 0
+          si = si + 1
+          i = end
+
+        elif si < numspans and spans[si][0] - place <= memlength:
+          begin = spans[si][0] - place
+          newlist.append(mem[i:begin])
+          newlist.append(spans[si][2])
+          inspan = 1
+          i = begin
 
-    newlist = textlist[:i]
-    newlist.append(textlist[i][:place])
-    newcolor = ansi.figure_color(newlist, self._currcolor)[0]
-    newlist.append(hl)
-
-    # if the string to highlight begins and ends in the
-    # same token we deal with that and eject
-    if len(textlist[i][place:]) >= memlength:
-      newlist.append(textlist[i][place:place + memlength])
-      newlist.append(chr(27) + "[0m")
-      color = ansi.convert_tuple_to_ansi(newcolor)
-      if color:
-        newlist.append(color)
-      newlist.append(textlist[i][place + memlength:])
-      for mem in textlist[i+1:]:
-        newlist.append(mem)
-
-      return newlist
-
-
-    newlist.append(textlist[i][place:])
-
-    # now we have to find the end of the highlight
-    memlength -= len(textlist[i][place:])
-    j = i+1
-    for j in range(i+1, len(textlist)):
-      if not ansi.is_color_token(textlist[j]):
-        if memlength > len(textlist[j]):
-          memlength -= len(textlist[j])
-          newlist.append(textlist[j])
         else:
+          newlist.append(mem[i:])
           break
-      else:
-        newcolor = ansi.figure_color([textlist[j]], newcolor, '')[0]
-
-    newlist.append(textlist[j][:memlength])
-    newlist.append(chr(27) + "[0m")
-    color = ansi.convert_tuple_to_ansi(newcolor)
-    if color:
-      newlist.append(color)
-    newlist.append(textlist[j][memlength:])
 
-    for mem in textlist[j+1:]:
-      newlist.append(mem)
+      place = place + memlength
 
-    return newlist
+    return "".join(newlist)
 
   def getInfo(self, text="", colorize=0):
     """
@@ -341,11 +439,18 @@ class HighlightManager(manager.Manager):
     ses = args["session"]
     text = args["dataadj"]
 
+    # highlight positions are figured against the text with ^M in it,
+    # so we can only use the shared filtered line if there's no ^M.
+    if text.find("\r") == -1:
+      faketext = utils.filter_line_ansi(args)
+    else:
+      faketext = ansi.filter_ansi(text)
+
     if self._config.get("ansicolor") == 0:
-      return ansi.filter_ansi(text)
+      return faketext
     else:
       if self._highlights.has_key(ses):
-        return self._highlights[ses].expand(text)
+        return self._highlights[ses].expand(text, faketext)
 
     return text
 
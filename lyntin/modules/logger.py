@@ -22,11 +22,466 @@
 This module defines the LoggerManager which handles logging.
 
 Logging can be turned on and shut off on a session by session basis.
+
+Log lines aren't written by the engine thread.  Each logger has a
+LogWriter with its own thread which collects the lines and writes
+them out in batches, flushing the file when the oldest line has been
+waiting for the flush interval or when there's a flush size's worth
+of lines.  Loggers are flushed when their session disconnects and
+closed when Lyntin shuts down or exits.
+
+Logs can be rotated when they get too big or at regular times by a
+LogRotator.  Log file names are strftime templates so segments can
+be named after the time they were started.  Finished segments can be
+gzipped in the background.
 """
-import string, os, thread
+import string, os, thread, threading, time, atexit, collections, calendar, \
+       gzip
 from lyntin import ansi, manager, config, utils, exported, constants
 from lyntin.modules import modutils
 
+# the LogWriters that are open--we close them at exit
+_writers = []
+
+def _close_writers():
+  for mem in _writers[:]:
+    mem.close()
+
+atexit.register(_close_writers)
+
+SIZE_UNITS = { "k": 1024, "m": 1024 ** 2, "g": 1024 ** 3 }
+
+def parse_size(size):
+  """
+  Parses a size in bytes with an optional k, m or g suffix.
+
+  @param size: the size (e.g. C{500000}, C{100m}, C{2G})
+  @type  size: string
+
+  @return: the number of bytes
+  @rtype: int
+
+  @raise ValueError: if the size is unparseable
+  """
+  size = size.strip().lower()
+  if size and SIZE_UNITS.has_key(size[-1]):
+    return int(float(size[:-1]) * SIZE_UNITS[size[-1]])
+  return int(size)
+
+def compress_file(filename):
+  """
+  Gzips a file to filename.gz and removes the original.
+
+  @param filename: the file to compress
+  @type  filename: string
+  """
+  gzname = filename + ".gz"
+  try:
+    f = open(filename, "rb")
+    try:
+      gz = gzip.open(gzname, "wb")
+      try:
+        while 1:
+          chunk = f.read(1024 * 1024)
+          if not chunk:
+            break
+          gz.write(chunk)
+      finally:
+        gz.close()
+    finally:
+      f.close()
+    os.remove(filename)
+  except:
+    if os.path.exists(gzname) and os.path.exists(filename):
+      os.remove(gzname)
+    exported.write_traceback("log: could not compress '%s'." % filename)
+
+class LogRotator:
+  """
+  Opens log segments and decides when it's time for a new one.
+
+  The filename is a strftime template which is filled in with the
+  time each segment starts.  If a segment would have the same name as
+  an existing file, the existing file is renamed to the first unused
+  name.1, name.2, ... before the segment is opened.  So with a plain
+  filename the active log always has that name.
+  """
+  def __init__(self, template, maxsize=0, interval=0, compress=0):
+    """
+    @param template: the filename (strftime template)
+    @type  template: string
+
+    @param maxsize: start a new segment before one gets bigger than
+        this many bytes (0 for no limit)
+    @type  maxsize: int
+
+    @param interval: start a new segment every this many seconds,
+        lined up with local midnight (0 for never)
+    @type  interval: int
+
+    @param compress: whether (1) or not (0) to gzip finished segments
+    @type  compress: boolean
+    """
+    self._template = template
+    self._maxsize = maxsize
+    self._interval = interval
+    self._compress = compress
+
+    self._size = 0
+    self._deadline = None
+    self._segments = 0
+
+  def getFileName(self, now=None):
+    """
+    Returns the filename for a segment starting at the given time.
+
+    @param now: the time (defaults to now)
+    @type  now: float
+
+    @rtype: string
+    """
+    if now == None:
+      now = time.time()
+    if self._template.find("%") == -1:
+      return self._template
+    return time.strftime(self._template, time.localtime(now))
+
+  def isRotating(self):
+    """
+    Returns whether (1) or not (0) this ever starts new segments.
+
+    @rtype: boolean
+    """
+    return self._maxsize > 0 or self._interval > 0
+
+  def open(self, now=None):
+    """
+    Opens the segment for now in append mode.
+
+    @param now: the time (defaults to now)
+    @type  now: float
+
+    @return: the segment
+    @rtype: File
+    """
+    return self.start(open(self.getFileName(now), "a"), now)
+
+  def start(self, fileob, now=None):
+    """
+    Starts keeping track of a segment that's already open.
+
+    @param fileob: the segment
+    @type  fileob: File
+
+    @param now: the time the segment started (defaults to now)
+    @type  now: float
+
+    @return: the segment
+    @rtype: File
+    """
+    if now == None:
+      now = time.time()
+    fileob.seek(0, 2)
+    self._size = fileob.tell()
+    if self._interval > 0:
+      # line boundaries up with local midnight so 1d rotates at
+      # midnight, 1h on the hour and so on
+      offset = calendar.timegm(time.localtime(now)) - int(now)
+      self._deadline = now - ((now + offset) % self._interval) + self._interval
+    return fileob
+
+  def isDue(self, length, now):
+    """
+    Returns whether (1) or not (0) a new segment should be started
+    before writing length bytes.
+
+    @param length: the number of bytes about to be written
+    @type  length: int
+
+    @param now: the time
+    @type  now: float
+
+    @rtype: boolean
+    """
+    if self._deadline != None and now >= self._deadline:
+      return 1
+    return self._maxsize > 0 and self._size > 0 \
+           and self._size + length > self._maxsize
+
+  def wrote(self, length):
+    """
+    Counts bytes written to the current segment.
+
+    @param length: the number of bytes
+    @type  length: int
+    """
+    self._size += length
+
+  def rotate(self, fileob, now):
+    """
+    Closes the segment, starts compressing it if we're compressing
+    and opens the next one.
+
+    @param fileob: the current segment
+    @type  fileob: File
+
+    @param now: the time
+    @type  now: float
+
+    @return: the new segment
+    @rtype: File
+    """
+    oldname = fileob.name
+    fileob.close()
+    self._segments += 1
+
+    newname = self.getFileName(now)
+    if os.path.exists(newname):
+      i = 1
+      while os.path.exists("%s.%d" % (newname, i)) or \
+            os.path.exists("%s.%d.gz" % (newname, i)):
+        i += 1
+      os.rename(newname, "%s.%d" % (newname, i))
+      if newname == oldname:
+        oldname = "%s.%d" % (newname, i)
+
+    if self._compress and os.path.exists(oldname):
+      exported.myengine.startthread("logger gzip", 
+                                    lambda: compress_file(oldname))
+
+    return self.open(now)
+
+  def getStatus(self):
+    """
+    Returns a one-liner describing the rotation settings.
+
+    @rtype: string
+    """
+    ret = []
+    if self._maxsize > 0:
+      ret.append("at %d bytes" % self._maxsize)
+    if self._interval > 0:
+      ret.append("every %ds" % self._interval)
+    ret = "rotating " + " or ".join(ret)
+    if self._compress:
+      ret += " (gzip)"
+    return "%s, %d rotation(s)" % (ret, self._segments)
+
+class LogWriter:
+  """
+  Writes text to a file from its own thread.  Callers hand text to
+  write which adds it to a queue and returns.  The thread writes
+  everything in the queue in one go and flushes the file when the
+  oldest text has waited flushinterval seconds, when there are
+  flushsize bytes waiting, or when someone calls flush or close.
+  """
+  def __init__(self, fileob, flushinterval=1.0, flushsize=65536, 
+               name="logger", ses=None, rotator=None):
+    """
+    @param fileob: the file to write to
+    @type  fileob: File
+
+    @param flushinterval: the most seconds text waits to be written
+    @type  flushinterval: float
+
+    @param flushsize: the number of bytes waiting that causes a write
+    @type  flushsize: int
+
+    @param name: the name of the thread
+    @type  name: string
+
+    @param ses: the session errors get reported to
+    @type  ses: session.Session
+
+    @param rotator: starts new segments of the file (None if the
+        file isn't rotated)
+    @type  rotator: LogRotator
+    """
+    self._file = fileob
+    self._rotator = rotator
+    self._interval = max(flushinterval, 0)
+    self._size = max(flushsize, 1)
+    self._session = ses
+
+    # write appends to the queue without taking the lock (deque
+    # appends and poplefts are thread-safe) and only wakes the thread
+    # when the queue was empty or has just gone over flushsize.
+    # queued is only changed by write and written only by the thread
+    # so neither needs the lock.
+    self._cond = threading.Condition()
+    self._queue = collections.deque()
+    self._queued = 0
+    self._written = 0
+    self._oldest = 0
+
+    # flush requests and writes are numbered so flush can wait for
+    # the write that covers its request
+    self._requested = 0
+    self._done = 0
+    self._closed = 0
+    self._failed = 0
+
+    # stats
+    self._writes = 0
+    self._bytes = 0
+    self._writetime = 0.0
+    self._maxwritetime = 0.0
+
+    _writers.append(self)
+    self._thread = exported.myengine.startthread(name, self._run)
+
+  def write(self, text):
+    """
+    Queues text to be written.
+
+    @param text: the text
+    @type  text: string
+    """
+    if self._closed or self._failed:
+      return
+
+    wake = 0
+    if not self._queue:
+      self._oldest = time.time()
+      wake = 1
+    self._queue.append(text)
+    pending = self._queued - self._written
+    self._queued += len(text)
+    if pending < self._size <= pending + len(text):
+      wake = 1
+
+    if wake:
+      self._cond.acquire()
+      try:
+        self._cond.notifyAll()
+      finally:
+        self._cond.release()
+
+  def flush(self):
+    """
+    Waits until everything that's been queued is written and the
+    file has been flushed.
+    """
+    self._cond.acquire()
+    try:
+      if self._closed:
+        return
+      self._requested += 1
+      request = self._requested
+      self._cond.notifyAll()
+      while self._done < request and self._thread.isAlive():
+        self._cond.wait(1.0)
+    finally:
+      self._cond.release()
+
+  def close(self):
+    """
+    Writes everything that's queued, stops the thread and closes
+    the file.
+    """
+    self._cond.acquire()
+    try:
+      if self._closed:
+        return
+      self._closed = 1
+      self._cond.notifyAll()
+    finally:
+      self._cond.release()
+
+    if self._thread.isAlive() and self._thread != threading.currentThread():
+      self._thread.join(10.0)
+    if self in _writers:
+      _writers.remove(self)
+    self._file.close()
+
+  def getFileName(self):
+    """
+    Returns the name of the file that's being written to.
+
+    @rtype: string
+    """
+    return self._file.name
+
+  def isOk(self):
+    """
+    Returns whether (1) or not (0) the file can still be written to.
+
+    @rtype: boolean
+    """
+    return not self._failed
+
+  def _run(self):
+    while 1:
+      self._cond.acquire()
+      try:
+        while not self._closed and self._requested == self._done:
+          wait = self._interval
+          if self._queue:
+            wait = self._oldest + self._interval - time.time()
+            if wait <= 0 or self._queued - self._written >= self._size:
+              break
+          self._cond.wait(max(wait, 0.01))
+
+        request = self._requested
+        closed = self._closed
+      finally:
+        self._cond.release()
+
+      # everything queued before the flush request is in the queue now
+      queue = self._queue
+      text = [queue.popleft() for i in xrange(len(queue))]
+      if queue:
+        self._oldest = time.time()
+
+      if text and not self._failed:
+        start = time.time()
+        try:
+          text = "".join(text)
+          if self._rotator:
+            if self._rotator.isDue(len(text), start):
+              self._file = self._rotator.rotate(self._file, start)
+            self._rotator.wrote(len(text))
+          self._file.write(text)
+          self._file.flush()
+        except:
+          self._failed = 1
+          exported.write_traceback("Logfile cannot be written to.", self._session)
+        else:
+          self._written += len(text)
+          elapsed = time.time() - start
+          self._writes += 1
+          self._bytes += len(text)
+          self._writetime += elapsed
+          self._maxwritetime = max(self._maxwritetime, elapsed)
+
+      self._cond.acquire()
+      try:
+        self._done = request
+        self._cond.notifyAll()
+      finally:
+        self._cond.release()
+
+      if closed:
+        return
+
+  def getStatus(self):
+    """
+    Returns a one-liner with the queue depth and write latency.
+
+    @rtype: string
+    """
+    depth = len(self._queue)
+    if self._writes:
+      average = self._writetime * 1000.0 / self._writes
+    else:
+      average = 0.0
+    ret = "queue depth %d, %d write(s) of %d byte(s), write latency " \
+          "%.2fms avg %.2fms max" % (depth, self._writes, self._bytes,
+                                     average, self._maxwritetime * 1000.0)
+    if self._rotator:
+      ret += ", " + self._rotator.getStatus()
+    return ret
+
 
 class LoggerData:
   def __init__(self, session):
@@ -39,38 +494,55 @@ class LoggerData:
     # pending mud prompt:
     self._prompt = None
     self._userprefix = ''
+    self._writer = None
 
     self._lock = thread.allocate_lock()
 
-  def log(self, input):
+  def log(self, input, stripped=0):
     """
     Logs text to a file instance self._logfile and optionally
     filters ansi according to self._strip_ansi.
 
     @param input: the string to log to the logfile for this session
     @type  input: string
+
+    @param stripped: whether (1) or not (0) the input has already had
+        ^M and ansi color codes filtered out
+    @type  stripped: boolean
     """
     if self._logfile == None:
       return
 
-    try:
+    if not self._writer.isOk():
+      # the writer has reported the error.  our callers hold the lock
+      # closeLogFile takes so the writer is dropped here.
+      writer = self._writer
+      self._writer = None
+      self._logfile = None
+      writer.close()
+      return
+
+    if stripped:
+      text = input
+    else:
       if self._strip_ansi == 1:
         input = ansi.filter_ansi(input)
 
       text = utils.filter_cm(input)
+    if os.linesep != "\n":
       text = text.replace("\n", os.linesep)
-      self._logfile.write(text)
-      self._logfile.flush()
-    except:
-      self._logfile = None
-      exported.write_traceback("Logfile cannot be written to.", self._session)
+    self._writer.write(text)
 
-  def log_mud(self, input):
+  def log_mud(self, input, stripped=0):
     """
     Logs mud output, synchronizing it with user inputs.
 
     @param input: the string from the mud for this session
     @type  input: string
+
+    @param stripped: whether (1) or not (0) the input has already had
+        ^M and ansi color codes filtered out
+    @type  stripped: boolean
     """
     try:
       self._lock.acquire()
@@ -80,22 +552,22 @@ class LoggerData:
         if self._prompt:
           # we already have one pending
           # (I'm not sure if it is possible, but who knows all the muds :)
-          self.log(self._prompt[0]+"\n")
-          self._prompt = (input, )
+          self.log(self._prompt[0]+"\n", self._prompt[1])
+          self._prompt = (input, stripped)
         elif self._user_input:
           # we have pending user input:
           self._log_user_input(input)
         else:
           # don't log prompts immediately, 
           # wait for a user input or a mud output
-          self._prompt = (input, )
+          self._prompt = (input, stripped)
       else:
         # it is ordinal output from mud
         if self._prompt:
           # we have a prompt pending, let's log it first:
-          self.log(self._prompt[0]+"\n")
+          self.log(self._prompt[0]+"\n", self._prompt[1])
           self._prompt = None
-        self.log(input)
+        self.log(input, stripped)
     finally:
       self._lock.release()
 
@@ -157,35 +629,88 @@ class LoggerData:
     finally:
       self._lock.release()
 
-    if self._logfile:
-      self._logfile.close()
-      self._logfile = None
+    if self._writer:
+      self._writer.close()
+      self._writer = None
+    self._logfile = None
 
-  def openLogFile(self, filename, stripansi=1, userprefix=''):
+  def flushLogFile(self):
+    """
+    Waits until everything that's been logged is written to the
+    logfile.
+    """
+    if self._writer:
+      self._writer.flush()
+
+  def getFileName(self):
+    """
+    Returns the name of the file we're logging to.
+
+    @return: the filename or None if we're not logging
+    @rtype: string
+    """
+    if self._writer:
+      return self._writer.getFileName()
+    return None
+
+  def openLogFile(self, filename, stripansi=1, userprefix='', 
+                  flushinterval=1.0, flushsize=65536, rotator=None):
     """
     Opens a new logfile.
 
     @param filename: the name of the new file to open in append mode.
+        It's a strftime template filled in with the current time.
     @type  filename: string
 
     @param stripansi: whether (1) or not (0) to strip ansi from the
         logs
     @type  stripansi: boolean
+
+    @param flushinterval: the most seconds a line waits to be written
+    @type  flushinterval: float
+
+    @param flushsize: the number of bytes waiting that causes a write
+    @type  flushsize: int
+
+    @param rotator: the LogRotator for the log or None to build one
+        that doesn't rotate
+    @type  rotator: LogRotator
     """
+    if rotator == None:
+      rotator = LogRotator(filename)
       
     # FIXME - what happens if we already have a logfile open?
-    self.setLogFile(open(filename, "a"), stripansi, userprefix)
+    self.setLogFile(rotator.open(), stripansi, userprefix, 
+                    flushinterval, flushsize, rotator)
 
-  def setLogFile(self, fileob, stripansi=1, userprefix=""):
+  def setLogFile(self, fileob, stripansi=1, userprefix="", 
+                 flushinterval=1.0, flushsize=65536, rotator=None):
     """
-    Sets the logfile.
+    Sets the logfile and starts the LogWriter that writes to it.
 
     @param fileob: the new File instance
     @type  fileob: File
+
+    @param flushinterval: the most seconds a line waits to be written
+    @type  flushinterval: float
+
+    @param flushsize: the number of bytes waiting that causes a write
+    @type  flushsize: int
+
+    @param rotator: the LogRotator that starts new segments of the
+        log (None if the log isn't rotated)
+    @type  rotator: LogRotator
     """
+    if rotator and rotator.isRotating():
+      rotator.start(fileob)
+    else:
+      rotator = None
     self._logfile = fileob
     self._strip_ansi = stripansi
     self._userprefix = userprefix
+    self._writer = LogWriter(fileob, flushinterval, flushsize, 
+                             "logger %s" % self._session.getName(), 
+                             self._session, rotator)
 
   def clear(self):
     """
@@ -202,9 +727,10 @@ class LoggerData:
     """
     if self._logfile:
       if self._strip_ansi == 1:
-        return "logging to '" + self._logfile.name + "' (noansi)"
+        ret = "logging to '" + self.getFileName() + "' (noansi)"
       else:
-        return "logging to '%s'" % self._logfile.name
+        ret = "logging to '%s'" % self.getFileName()
+      return ret + ": " + self._writer.getStatus()
     else:
       return "logging not enabled"
 
@@ -227,6 +753,22 @@ class LoggerManager(manager.Manager):
       self._loggers[ses].closeLogFile()
       del self._loggers[ses]
 
+  def disconnect(self, args):
+    """
+    disconnect_hook function that makes sure everything the session
+    logged is written out.
+    """
+    logger = self._loggers.get(args["session"])
+    if logger:
+      logger.flushLogFile()
+
+  def shutdown(self, args):
+    """
+    shutdown_hook function that closes all the logfiles.
+    """
+    for mem in self._loggers.values():
+      mem.closeLogFile()
+
   def getLogData(self, ses):
     if self._loggers.has_key(ses):
       return self._loggers[ses]
@@ -244,7 +786,10 @@ class LoggerManager(manager.Manager):
 
     logger = self._loggers.get(ses)
     if logger:
-      logger.log_mud(text)
+      if logger._strip_ansi == 1:
+        logger.log_mud(utils.filter_line_ansi(args), 1)
+      else:
+        logger.log_mud(text)
 
     return text
 
@@ -285,12 +830,42 @@ def log_cmd(ses, args, input):
   If USERPREFIX is omitted, then the user input will be attached to 
   mud prompts before logging.
 
+  Lines are written to the logfile in the background.  They're
+  written when the oldest one has waited FLUSHINTERVAL milliseconds
+  or when FLUSHSIZE bytes are waiting, whichever comes first.
+
+  The LOGFILE name is a strftime template (%Y, %m, %d, %H, %M and so
+  on--use %% for a %) filled in with the time the log is started.
+  Logs can be rotated when they get bigger than ROTATESIZE (bytes,
+  or with a k, m or g suffix) and/or every ROTATETIME (lined up with
+  midnight, so 1d rotates at midnight).  Each new segment gets the
+  LOGFILE name filled in with the time it's started.  If that's the
+  name of an existing file, the existing file is renamed to 
+  LOGFILE.1 (or .2, .3 ...).  With COMPRESS on, finished segments
+  are gzipped in the background.
+
+  examples:
+    #log mylog.txt
+    #log mylog.txt flushinterval=10000 flushsize=1000000
+    #log mud-%Y%m%d.txt rotatetime=1d compress=true
+    #log mylog.txt rotatesize=100m compress=true
+
   category: commands
   """
   logfile = args["logfile"]
   databuffer = args["databuffer"]
   stripansi = args["stripansi"]
   userprefix = args["userprefix"]
+  flushinterval = args["flushinterval"] / 1000.0
+  flushsize = args["flushsize"]
+  rotatetime = args["rotatetime"]
+  compress = args["compress"]
+
+  try:
+    rotatesize = parse_size(args["rotatesize"])
+  except ValueError:
+    exported.write_error("log: invalid rotatesize '%s'." % args["rotatesize"], ses)
+    return
 
   if not ses.isConnected():
     exported.write_error("log: You must have a session to log.", ses)
@@ -306,7 +881,7 @@ def log_cmd(ses, args, input):
   # handle stopping logging
   if loggerdata.isLogging() == 1:
     try:
-      logname = loggerdata._logfile.name
+      logname = loggerdata.getFileName()
       loggerdata.closeLogFile()
       exported.write_message("log: stopped logging to '%s'." % logname, ses)
     except Exception, e:
@@ -318,25 +893,28 @@ def log_cmd(ses, args, input):
     if os.sep not in logfile:
       logfile = config.options["datadir"] + logfile
 
+    rotator = LogRotator(logfile, rotatesize, rotatetime, compress)
     if databuffer:
-      f = open(logfile, "w")
+      f = open(rotator.getFileName(), "w")
       buffer = "".join(ses.getDataBuffer())
       f.write(buffer)
       exported.write_message("log: dumped %d lines of databuffer to logfile" % buffer.count("\n"), ses)
-      loggerdata.setLogFile(f, stripansi, userprefix)
+      loggerdata.setLogFile(f, stripansi, userprefix, flushinterval, flushsize,
+                            rotator)
 
     else:
-      loggerdata.openLogFile(logfile, stripansi, userprefix)
+      loggerdata.openLogFile(logfile, stripansi, userprefix, flushinterval, 
+                             flushsize, rotator)
     if stripansi:
       stripansimessage = " stripping ansi"
     else:
       stripansimessage = ""
 
-    exported.write_message("log: starting logging to '%s'%s." % (logfile, stripansimessage), ses)
+    exported.write_message("log: starting logging to '%s'%s." % (loggerdata.getFileName(), stripansimessage), ses)
   except Exception, e:
     exported.write_error("log: logfile cannot be opened for appending. %s" % (e), ses)
 
-commands_dict["log"] = (log_cmd, 'logfile= databuffer:boolean=false stripansi:boolean=true userprefix=')
+commands_dict["log"] = (log_cmd, 'logfile= databuffer:boolean=false stripansi:boolean=true userprefix= flushinterval:int=1000 flushsize:int=65536 rotatesize=0 rotatetime:timespan=0 compress:boolean=false')
 
 
 
@@ -352,6 +930,8 @@ def load():
   exported.hook_register("to_mud_hook", lm.tomudfilter, constants.LAST+1)
   exported.hook_register("mud_filter_hook", lm.mudfilter, 30)
   exported.hook_register("prompt_hook", lm.promptfilter, 30)
+  exported.hook_register("disconnect_hook", lm.disconnect)
+  exported.hook_register("shutdown_hook", lm.shutdown)
 
 def unload():
   """ Unloads the module by calling any unload/unbind functions."""
@@ -362,6 +942,8 @@ def unload():
   exported.hook_unregister("to_mud_hook", lm.tomudfilter)
   exported.hook_unregister("mud_filter_hook", lm.mudfilter)
   exported.hook_unregister("prompt_hook", lm.promptfilter)
+  exported.hook_unregister("disconnect_hook", lm.disconnect)
+  exported.hook_unregister("shutdown_hook", lm.shutdown)
 
 # Local variables:
 # mode:python
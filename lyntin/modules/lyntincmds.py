@@ -176,54 +176,94 @@ def grep_cmd(ses, args, input):
 
   It prints matching lines in their entirety.
 
+  size is the number of lines at the end of the data buffer to look
+  through.  since and until limit the search to lines that came from
+  the mud at or after since and before until.  They can be timespans
+  (10m is ten minutes ago) or times of day (14:30, 2:30p).
+
+  sessions lets you grep other sessions: either "all" for all of
+  them or a comma-separated list of session names.
+
   examples:
     #grep {says:} 1000
 
     Greps the last 1000 lines of the databuffer for lines that have
     "says:" in them.
 
+    #grep {tells you} 100000 since=1h sessions=all
+
+    Greps all the sessions for tells from the last hour.
+
   category: commands
   """
-  if (ses.getName() == "common"):
-    exported.write_error("grep cannot be applied to common session.", ses)
-    return
-
   pattern = args["pattern"]
   size = args["size"]
   context = args["context"]
-  buffer = ses.getDataBuffer()
 
-  ret = []
-  cpattern = re.compile(pattern)
-  for i in range(max(len(buffer)-size,0), len(buffer)):
-    mem = buffer[i]
-    if cpattern.search(mem):
-      if context > 0:
-        mem = []
-        if i > 0:
-          bound = i - context
-          if bound < 0: bound = 0
-          for j in range(bound, i):
-            mem.append("  " + buffer[j])
-
-        mem.append("+ " + buffer[i])
-
-        if i < len(buffer):
-          bound = i+context+1
-          if bound > len(buffer)-1: bound = len(buffer)-1
-          for j in range(i+1, bound):
-            mem.append("  " + buffer[j])
-        mem = "".join(mem)
+  if args["sessions"] == "all":
+    sessions = [m for m in exported.get_active_sessions() 
+                if m.getName() != "common"]
+    sessions.sort(lambda x, y: cmp(x.getName(), y.getName()))
+
+  elif args["sessions"]:
+    sessions = []
+    for mem in args["sessions"].split(","):
+      s = exported.get_session(mem.strip())
+      if s == None:
+        exported.write_error("grep: session %s does not exist." % mem.strip(), ses)
+        return
+      sessions.append(s)
+
+  elif ses.getName() == "common":
+    exported.write_error("grep cannot be applied to common session.", ses)
+    return
 
-      ret.append(mem)
+  else:
+    sessions = [ses]
+
+  try:
+    since = until = None
+    if args["since"]:
+      since = utils.parse_past_time(args["since"])
+    if args["until"]:
+      until = utils.parse_past_time(args["until"])
+  except ValueError:
+    exported.write_error("grep: invalid time.", ses)
+    return
+
+  cpattern = re.compile(pattern)
 
   if context == 0:
     splitter = ""
   else:
     splitter = "---\n"
-  exported.write_message("grep %s results:\n%s" % (pattern, splitter.join(ret)), ses)
 
-commands_dict["grep"] = (grep_cmd, "pattern size:int=300 context:int=0")
+  for s in sessions:
+    buffer = s.getScrollback()
+    end = buffer.getNextLineNumber()
+    start = end - size
+    if since != None:
+      start = max(start, buffer.getLineNumberAt(since))
+    if until != None:
+      end = min(end, buffer.getLineNumberAt(until))
+
+    ret = []
+    for i in buffer.search(cpattern, start, end):
+      mem = buffer.getLine(i)
+      if context > 0:
+        mem = ["  " + m for m in buffer.getLines(i - context, i)] + \
+              ["+ " + mem] + \
+              ["  " + m for m in buffer.getLines(i + 1, i + context + 1)]
+        mem = "".join(mem)
+      ret.append(mem)
+
+    if len(sessions) > 1:
+      exported.write_message("grep %s results (%s):\n%s" % 
+                             (pattern, s.getName(), splitter.join(ret)), ses)
+    else:
+      exported.write_message("grep %s results:\n%s" % (pattern, splitter.join(ret)), ses)
+
+commands_dict["grep"] = (grep_cmd, "pattern size:int=300 context:int=0 since= until= sessions=")
 
 
 def diagnostics_cmd(ses, args, input):
@@ -0,0 +1,1113 @@
+#########################################################################
+# This file is part of Lyntin.
+#
+# Lyntin is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# Lyntin is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# copyright (c) Free Software Foundation 2001-2007
+#
+#########################################################################
+"""
+This module defines the MapperManager which builds a map of the mud
+as you walk around it and finds routes with #path.
+
+The mapper watches what's sent to the mud for movement commands and
+the mud data for room titles.  Set maptitle to a regular expression
+that matches the line with the room's title (the first group is the
+title if there is one, otherwise it's the whole line) and the mapper
+goes to work::
+
+  #config maptitle {^\[(.+)\]$}
+
+Each movement is matched up with the next room title.  If the mud
+says you can't go that way, set mapfail so the mapper knows the
+movement didn't happen::
+
+  #config mapfail {^Alas, you cannot go that way}
+
+Rooms are placed on a grid by the compass directions so walking
+around a loop ends up back in the room you started in rather than
+in a copy of it.  A room title that shows up without a movement
+(you teleported, say) is looked up by title and starts a new area
+of the grid if it's not on the map yet.
+
+Routes are found with a breadth-first search from the room you're
+in (Dijkstra's algorithm if any rooms have a cost).  The search
+stops at the room it's looking for and is kept so the next route
+from the same room picks up where it left off--most routes come
+straight out of it.  The searches are thrown away when the map
+changes.
+"""
+import os, re, array, heapq, collections
+from lyntin import manager, config, exported, utils
+from lyntin.modules import modutils
+
+# direction -> (dx, dy, dz, reverse direction)
+DIRECTIONS = {
+  "north":     ( 0,  1,  0, "south"),
+  "south":     ( 0, -1,  0, "north"),
+  "east":      ( 1,  0,  0, "west"),
+  "west":      (-1,  0,  0, "east"),
+  "northeast": ( 1,  1,  0, "southwest"),
+  "northwest": (-1,  1,  0, "southeast"),
+  "southeast": ( 1, -1,  0, "northwest"),
+  "southwest": (-1, -1,  0, "northeast"),
+  "up":        ( 0,  0,  1, "down"),
+  "down":      ( 0,  0, -1, "up")
+}
+
+# movement commands -> direction
+MOVES = {
+  "n": "north", "s": "south", "e": "east", "w": "west",
+  "ne": "northeast", "nw": "northwest", "se": "southeast",
+  "sw": "southwest", "u": "up", "d": "down"
+}
+for mem in DIRECTIONS.keys():
+  MOVES[mem] = mem
+
+# the first line of a map file
+MAP_HEADER = "# lyntin map 1\n"
+
+# the most searches we keep
+MAX_TREES = 32
+
+# the most movements we wait for room titles for
+MAX_PENDING = 100
+
+
+class PathTree:
+  """
+  A shortest path search from one room.  It stops when it settles a
+  room that it's looking for and can be picked up again to look for
+  another.  Rooms are settled in order of their distance from the
+  source so the first target settled is the nearest one.
+
+  The search state is kept in lists indexed by room rather than 
+  dicts since it's touched for every exit the search goes through.
+  """
+  def __init__(self, roommap, source):
+    """
+    @param roommap: the map to search
+    @type  roommap: RoomMap
+
+    @param source: the room to search from
+    @type  source: int
+    """
+    rooms = len(roommap)
+    self._exits = roommap._exits
+    self._costs = roommap._costs
+    self._source = source
+
+    # the room each room was reached from (-1 if it hasn't been), 
+    # the direction it was reached by, its distance and whether
+    # it's settled
+    self._prev = [-1] * rooms
+    self._dirs = [None] * rooms
+    self._dist = [0] * rooms
+    self._settled = [0] * rooms
+    self._prev[source] = source
+
+    if self._costs:
+      self._heap = [(0, source)]
+      self._queue = None
+    else:
+      self._heap = None
+      self._queue = collections.deque([source])
+
+  def find(self, targets):
+    """
+    Finds the nearest of the targets.
+
+    @param targets: the rooms to look for
+    @type  targets: list of ints
+
+    @returns: the nearest target or None if none can be reached
+    @rtype: int
+    """
+    best = None
+    for mem in targets:
+      if self._settled[mem] and \
+         (best == None or self._dist[mem] < self._dist[best]):
+        best = mem
+    if best != None:
+      return best
+
+    targets = dict.fromkeys(targets)
+    if self._queue != None:
+      return self._breadthFirst(targets)
+    return self._dijkstra(targets)
+
+  def _breadthFirst(self, targets):
+    queue = self._queue
+    exits = self._exits
+    prev = self._prev
+    dirs = self._dirs
+    dist = self._dist
+    settled = self._settled
+    while queue:
+      room = queue.popleft()
+      settled[room] = 1
+      d = dist[room] + 1
+      for dir, dest in exits[room].iteritems():
+        if prev[dest] < 0:
+          prev[dest] = room
+          dirs[dest] = dir
+          dist[dest] = d
+          queue.append(dest)
+      if room in targets:
+        return room
+    return None
+
+  def _dijkstra(self, targets):
+    heap = self._heap
+    exits = self._exits
+    costs = self._costs
+    prev = self._prev
+    dirs = self._dirs
+    dist = self._dist
+    settled = self._settled
+    while heap:
+      d, room = heapq.heappop(heap)
+      if settled[room]:
+        continue
+      settled[room] = 1
+      for dir, dest in exits[room].iteritems():
+        nd = d + costs.get(dest, 1)
+        if prev[dest] < 0 or nd < dist[dest]:
+          prev[dest] = room
+          dirs[dest] = dir
+          dist[dest] = nd
+          heapq.heappush(heap, (nd, dest))
+      if room in targets:
+        return room
+    return None
+
+  def getPath(self, dest):
+    """
+    Returns the directions from the source to a room that's been
+    settled.
+
+    @param dest: the room
+    @type  dest: int
+
+    @returns: the directions
+    @rtype: list of strings
+    """
+    path = []
+    while dest != self._source:
+      path.append(self._dirs[dest])
+      dest = self._prev[dest]
+    path.reverse()
+    return path
+
+  def getDistance(self, dest):
+    return self._dist[dest]
+
+
+class RoomMap:
+  """
+  Holds the rooms and exits of a map.
+
+  Rooms are numbered from 0 in the order they're added.  Titles and
+  exits are lists indexed by the room number and the coordinates
+  are arrays of ints, so a room is little more than its title (which
+  is interned) and a dict of its exits (direction -> room).  Costs
+  and labels are only kept for the rooms that have them.
+  """
+  def __init__(self):
+    self.clear()
+
+  def clear(self):
+    """
+    Removes all the rooms.
+    """
+    self._titles = []
+    self._exits = []
+    self._area = array.array("i")
+    self._x = array.array("i")
+    self._y = array.array("i")
+    self._z = array.array("i")
+    self._areas = 0
+    self._exitcount = 0
+
+    # room -> cost of going into it (rooms that aren't here cost 1)
+    self._costs = {}
+
+    # label -> room, lower-cased title -> rooms,
+    # (area, x, y, z) -> room
+    self._labels = {}
+    self._bytitle = {}
+    self._bycoord = {}
+
+    self._changed()
+
+  def _changed(self):
+    # source room -> PathTree
+    self._trees = {}
+
+  def __len__(self):
+    return len(self._titles)
+
+  def newArea(self):
+    """
+    Returns a new area number for rooms that aren't connected to the
+    rooms we know about.
+
+    @rtype: int
+    """
+    self._areas += 1
+    return self._areas - 1
+
+  def addRoom(self, title, area, x=0, y=0, z=0):
+    """
+    Adds a room.
+
+    @param title: the room's title
+    @type  title: string
+
+    @param area: the room's area
+    @type  area: int
+
+    @param x, y, z: the room's coordinates in the area
+    @type  x, y, z: int
+
+    @returns: the new room's number
+    @rtype: int
+    """
+    title = intern(title)
+    room = len(self._titles)
+    self._titles.append(title)
+    self._exits.append({})
+    self._area.append(area)
+    self._x.append(x)
+    self._y.append(y)
+    self._z.append(z)
+    if area >= self._areas:
+      self._areas = area + 1
+
+    self._bytitle.setdefault(title.lower(), []).append(room)
+    coord = (area, x, y, z)
+    if not self._bycoord.has_key(coord):
+      self._bycoord[coord] = room
+
+    self._changed()
+    return room
+
+  def addExit(self, room, dir, dest):
+    """
+    Adds (or changes) an exit.
+
+    @param room: the room the exit is in
+    @type  room: int
+
+    @param dir: the direction
+    @type  dir: string
+
+    @param dest: the room the exit goes to
+    @type  dest: int
+    """
+    exits = self._exits[room]
+    if exits.get(dir) == dest:
+      return
+    if not exits.has_key(dir):
+      self._exitcount += 1
+    exits[intern(dir)] = dest
+    self._changed()
+
+  def move(self, room, dir, title):
+    """
+    Works out which room we're in after going in a direction from a
+    room and seeing a title, adding the room and the exits if they
+    aren't on the map.
+
+    @param room: the room we were in
+    @type  room: int
+
+    @param dir: the direction we went (one of DIRECTIONS)
+    @type  dir: string
+
+    @param title: the title of the room we ended up in
+    @type  title: string
+
+    @returns: the room we ended up in
+    @rtype: int
+    """
+    dest = self._exits[room].get(dir)
+    if dest != None and self._titles[dest] == title:
+      return dest
+
+    dx, dy, dz, reverse = DIRECTIONS[dir]
+    coord = (self._area[room], self._x[room] + dx, self._y[room] + dy,
+             self._z[room] + dz)
+    dest = self._bycoord.get(coord)
+    if dest == None or self._titles[dest] != title:
+      dest = self.addRoom(title, *coord)
+
+    self.addExit(room, dir, dest)
+    if not self._exits[dest].has_key(reverse):
+      self.addExit(dest, reverse, room)
+    return dest
+
+  def setCost(self, room, cost):
+    """
+    Sets the cost of going into a room (the default is 1).
+
+    @param room: the room
+    @type  room: int
+
+    @param cost: the cost
+    @type  cost: int
+    """
+    if cost == 1:
+      if self._costs.has_key(room):
+        del self._costs[room]
+    else:
+      self._costs[room] = cost
+    self._changed()
+
+  def getCost(self, room):
+    return self._costs.get(room, 1)
+
+  def setLabel(self, label, room):
+    """
+    Labels a room so #path can find it by the label.
+
+    @param label: the label
+    @type  label: string
+
+    @param room: the room (or None to remove the label)
+    @type  room: int
+    """
+    if room == None:
+      if self._labels.has_key(label):
+        del self._labels[label]
+    else:
+      self._labels[label] = room
+
+  def getLabels(self):
+    """
+    Returns the labels.
+
+    @returns: (label, room) tuples sorted by label
+    @rtype: list of (string, int)
+    """
+    labels = self._labels.items()
+    labels.sort()
+    return labels
+
+  def getTitle(self, room):
+    return self._titles[room]
+
+  def getExits(self, room):
+    return self._exits[room]
+
+  def getExitCount(self):
+    return self._exitcount
+
+  def findRooms(self, text):
+    """
+    Finds rooms by number, label or title (ignoring case).
+
+    @param text: the room number, label or title
+    @type  text: string
+
+    @returns: the rooms that match
+    @rtype: list of ints
+    """
+    if text.isdigit():
+      room = int(text)
+      if room < len(self._titles):
+        return [room]
+      return []
+    if self._labels.has_key(text):
+      return [self._labels[text]]
+    return self._bytitle.get(text.lower(), [])
+
+  def findPath(self, source, targets):
+    """
+    Finds the route from a room to the nearest of some rooms.
+
+    @param source: the room to start in
+    @type  source: int
+
+    @param targets: the rooms to go to
+    @type  targets: list of ints
+
+    @returns: the target that's nearest and the directions to it or
+        None if none of them can be reached
+    @rtype: (int, list of strings)
+    """
+    tree = self._trees.get(source)
+    if tree == None:
+      if len(self._trees) >= MAX_TREES:
+        self._trees = {}
+      tree = PathTree(self, source)
+      self._trees[source] = tree
+
+    dest = tree.find(targets)
+    if dest == None:
+      return None
+    return (dest, tree.getPath(dest))
+
+  def write(self, fileob):
+    """
+    Writes the map to a file.  After the header there's a line for
+    each room in order and then a line for each label::
+
+      R <tab> area <tab> x <tab> y <tab> z <tab> cost <tab> title
+          (<tab> direction <tab> room)...
+      L <tab> label <tab> room
+
+    @param fileob: the file to write to
+    @type  fileob: File
+    """
+    lines = [MAP_HEADER]
+    for room in xrange(len(self._titles)):
+      fields = ["R", str(self._area[room]), str(self._x[room]),
+                str(self._y[room]), str(self._z[room]),
+                str(self._costs.get(room, 1)), 
+                self._titles[room].replace("\t", " ")]
+      for dir, dest in self._exits[room].iteritems():
+        fields.append(dir)
+        fields.append(str(dest))
+      lines.append("\t".join(fields) + "\n")
+
+    for label, room in self.getLabels():
+      lines.append("L\t%s\t%d\n" % (label.replace("\t", " "), room))
+    fileob.write("".join(lines))
+
+  def read(self, fileob):
+    """
+    Replaces the map with one read from a file written by write.
+
+    @param fileob: the file to read from
+    @type  fileob: File
+
+    @raises ValueError: if the file isn't a map
+    """
+    if fileob.readline() != MAP_HEADER:
+      raise ValueError("not a map file")
+
+    self.clear()
+    exits = []
+    for line in fileob:
+      fields = line.rstrip("\r\n").split("\t")
+      if fields[0] == "R":
+        room = self.addRoom(fields[6], int(fields[1]), int(fields[2]),
+                            int(fields[3]), int(fields[4]))
+        cost = int(fields[5])
+        if cost != 1:
+          self._costs[room] = cost
+        for i in range(7, len(fields) - 1, 2):
+          exits.append((room, fields[i], int(fields[i + 1])))
+      elif fields[0] == "L":
+        self._labels[fields[1]] = int(fields[2])
+
+    for room, dir, dest in exits:
+      if dest < len(self._titles):
+        self.addExit(room, dir, dest)
+
+  def getStatus(self):
+    return "%d room(s), %d exit(s)." % (len(self._titles), self._exitcount)
+
+
+class MapperData:
+  """
+  Holds the map for a session and follows the session around it.
+  """
+  def __init__(self):
+    self._map = RoomMap()
+    self._current = None
+    self._pending = collections.deque()
+    self._filename = None
+
+  def moved(self, dir):
+    """
+    Notes that a movement command was sent to the mud.
+
+    @param dir: the direction
+    @type  dir: string
+    """
+    if len(self._pending) >= MAX_PENDING:
+      self._pending.clear()
+    self._pending.append(dir)
+
+  def failed(self):
+    """
+    Notes that the mud said the oldest movement didn't happen.
+    """
+    if self._pending:
+      self._pending.popleft()
+
+  def arrived(self, title):
+    """
+    Notes that the mud showed us a room title and works out which
+    room we're in.
+
+    @param title: the room title
+    @type  title: string
+    """
+    roommap = self._map
+    dir = None
+    if self._pending:
+      dir = self._pending.popleft()
+
+    if self._current != None:
+      if dir != None:
+        self._current = roommap.move(self._current, dir, title)
+        return
+      if roommap.getTitle(self._current) == title:
+        # they looked
+        return
+
+    # we don't know how we got here--if there's one room with the
+    # title we're there, otherwise it's somewhere new
+    rooms = [mem for mem in roommap.findRooms(title)
+             if roommap.getTitle(mem) == title]
+    if len(rooms) == 1:
+      self._current = rooms[0]
+    else:
+      self._current = roommap.addRoom(title, roommap.newArea())
+
+  def getMap(self):
+    return self._map
+
+  def getCurrent(self):
+    return self._current
+
+  def setCurrent(self, room):
+    self._current = room
+    self._pending.clear()
+
+  def findPath(self, text):
+    """
+    Finds the route from the current room to a room.
+
+    @param text: the room number, label or title
+    @type  text: string
+
+    @returns: the room and the directions or None if the room can't
+        be found or reached
+    @rtype: (int, list of strings)
+    """
+    if self._current == None:
+      return None
+    targets = self._map.findRooms(text)
+    if not targets:
+      return None
+    return self._map.findPath(self._current, targets)
+
+  def load(self, filename):
+    f = open(filename, "r")
+    try:
+      self._map.read(f)
+    finally:
+      f.close()
+    self._filename = filename
+    self.setCurrent(None)
+
+  def save(self, filename=None):
+    if filename == None:
+      filename = self._filename
+    f = open(filename + ".tmp", "w")
+    try:
+      self._map.write(f)
+    finally:
+      f.close()
+    if os.path.exists(filename):
+      os.remove(filename)
+    os.rename(filename + ".tmp", filename)
+    self._filename = filename
+
+  def getFileName(self):
+    return self._filename
+
+  def getStatus(self):
+    status = self._map.getStatus()
+    if self._current != None:
+      status += "  In room %d [%s]." % (self._current,
+                                        self._map.getTitle(self._current))
+    return status
+
+
+class MapperManager(manager.Manager):
+  def __init__(self):
+    self._mapperdata = {}
+
+    # pattern -> compiled regular expression
+    self._regexps = {}
+
+  def getMapperData(self, ses):
+    if not self._mapperdata.has_key(ses):
+      self._mapperdata[ses] = MapperData()
+    return self._mapperdata[ses]
+
+  def clear(self, ses):
+    if self._mapperdata.has_key(ses):
+      del self._mapperdata[ses]
+
+  def removeSession(self, ses):
+    self.clear(ses)
+
+  def getStatus(self, ses):
+    if self._mapperdata.has_key(ses):
+      return self._mapperdata[ses].getStatus()
+    return "0 room(s), 0 exit(s)."
+
+  def _compile(self, pattern):
+    regexp = self._regexps.get(pattern)
+    if regexp == None:
+      try:
+        regexp = re.compile(pattern)
+      except re.error, e:
+        exported.write_error("mapper: bad pattern '%s' (%s)." % (pattern, e))
+        regexp = re.compile("(?!)")
+      self._regexps[pattern] = regexp
+    return regexp
+
+  def tomud(self, args):
+    """
+    to_mud_hook function that watches for movement commands.
+    """
+    ses = args["session"]
+    if not getattr(exported.get_config_snapshot(ses), "maptitle", ""):
+      return
+
+    dir = MOVES.get(args["data"].strip().lower())
+    if dir:
+      self.getMapperData(ses).moved(dir)
+
+  def mudfilter(self, args):
+    """
+    mud_filter_hook function that watches for room titles and
+    failed movements.
+    """
+    ses = args["session"]
+    text = args["dataadj"]
+    snap = exported.get_config_snapshot(ses)
+    titlepattern = getattr(snap, "maptitle", "")
+    if not titlepattern:
+      return text
+
+    line = utils.chomp(utils.filter_line_ansi(args))
+    match = self._compile(titlepattern).search(line)
+    if match:
+      if match.groups() and match.group(1) != None:
+        title = match.group(1)
+      else:
+        title = match.group(0)
+      self.getMapperData(ses).arrived(title.strip())
+      return text
+
+    failpattern = getattr(snap, "mapfail", "")
+    if failpattern and self._compile(failpattern).search(line):
+      self.getMapperData(ses).failed()
+    return text
+
+  def shutdown(self, args):
+    """
+    shutdown_hook function that saves the maps that were loaded from
+    or saved to a file.
+    """
+    for ses, data in self._mapperdata.items():
+      if data.getFileName():
+        try:
+          data.save()
+        except Exception, e:
+          exported.write_error("mapper: cannot save map to '%s' (%s)." %
+                               (data.getFileName(), e))
+
+
+def format_path(ses, path):
+  """
+  Formats a route as a speedwalk if there are speedwalk dirs for all
+  the directions in it (and joined with ; if there aren't).
+
+  @param ses: the session
+  @type  ses: session.Session
+
+  @param path: the directions
+  @type  path: list of strings
+
+  @returns: the route
+  @rtype: string
+  """
+  sm = exported.get_manager("speedwalk")
+  aliases = {}
+  if sm:
+    for alias, dir in sm.getDirs(ses):
+      if not aliases.has_key(dir) or len(alias) < len(aliases[dir]):
+        aliases[dir] = alias
+
+  for mem in path:
+    if not aliases.has_key(mem):
+      return ";".join(path)
+
+  output = []
+  i = 0
+  while i < len(path):
+    j = i
+    while j < len(path) and path[j] == path[i]:
+      j += 1
+    if j - i > 1:
+      output.append(str(j - i))
+    output.append(aliases[path[i]])
+    i = j
+  return "".join(output)
+
+
+commands_dict = {}
+
+def map_cmd(ses, args, input):
+  """
+  Shows how big this session's map is and which room you're in and
+  its exits.
+
+  The mapper follows you around once maptitle is set to a regular
+  expression that matches the lines with room titles (the first
+  group is the title).  Set mapfail to a regular expression that
+  matches the mud telling you you can't go that way.
+
+  examples:
+    #config maptitle {^\[(.+)\]$}
+    #config mapfail {^Alas, you cannot go that way}
+
+  see also: path, mapload, mapsave, maplabel, mapcost, maphere, mapclear
+
+  category: commands
+  """
+  data = exported.get_manager("mapper").getMapperData(ses)
+  lines = ["map: " + data.getStatus()]
+  current = data.getCurrent()
+  if current != None:
+    exits = data.getMap().getExits(current).items()
+    exits.sort()
+    if exits:
+      lines.append("exits: " + ", ".join(["%s (%d)" % mem for mem in exits]))
+  exported.write_message("\n".join(lines), ses)
+
+commands_dict["map"] = (map_cmd, "")
+
+
+def path_cmd(ses, args, input):
+  """
+  Finds the shortest route from the room you're in to ROOM and shows
+  it.  If WALK is true, it walks it too--the route goes through the
+  speedwalk sender so it's sent in one write (or paced if
+  speedwalkdelay is set).
+
+  ROOM can be a room number, a label from #maplabel or a room title
+  (the nearest room with that title).
+
+  examples:
+    #path {temple}
+    #path {The Temple Square} {true}
+    #path 1234
+
+  see also: map, maplabel, mapcost
+
+  category: commands
+  """
+  room = args["room"]
+  walk = args["walk"]
+  quiet = args["quiet"]
+
+  data = exported.get_manager("mapper").getMapperData(ses)
+  if data.getCurrent() == None:
+    exported.write_error("path: don't know which room you're in.", ses)
+    return
+
+  found = data.findPath(room)
+  if found == None:
+    exported.write_error("path: no route to '%s'." % room, ses)
+    return
+
+  dest, path = found
+  if not quiet:
+    exported.write_message("path: %d move(s) to %d [%s]: %s" %
+                           (len(path), dest, data.getMap().getTitle(dest),
+                            format_path(ses, path)), ses)
+
+  if walk and path:
+    sm = exported.get_manager("speedwalk")
+    if sm:
+      sm.sendWalk(ses, path)
+    else:
+      exported.lyntin_command(";".join(path), 1, ses)
+
+commands_dict["path"] = (path_cmd, "room walk:boolean=false quiet:boolean=false")
+
+
+def mapload_cmd(ses, args, input):
+  """
+  Loads a map from a file (replacing this session's map).  If the
+  file doesn't have a path, it's in the datadir.  The map is saved
+  back to the file when Lyntin shuts down.
+
+  examples:
+    #mapload 3k.map
+
+  see also: map, mapsave
+
+  category: commands
+  """
+  mapfile = args["mapfile"]
+  if os.sep not in mapfile:
+    mapfile = config.options["datadir"] + mapfile
+
+  data = exported.get_manager("mapper").getMapperData(ses)
+  try:
+    data.load(mapfile)
+  except Exception, e:
+    exported.write_error("mapload: cannot load map from '%s' (%s)." %
+                         (mapfile, e), ses)
+    return
+  exported.write_message("mapload: loaded '%s': %s" %
+                         (mapfile, data.getMap().getStatus()), ses)
+
+commands_dict["mapload"] = (mapload_cmd, "mapfile")
+
+
+def mapsave_cmd(ses, args, input):
+  """
+  Saves this session's map to a file.  With no file, it's saved to
+  the file it was loaded from or last saved to.  If the file doesn't
+  have a path, it's in the datadir.  The map is saved to the file
+  again when Lyntin shuts down.
+
+  examples:
+    #mapsave 3k.map
+    #mapsave
+
+  see also: map, mapload
+
+  category: commands
+  """
+  mapfile = args["mapfile"]
+  data = exported.get_manager("mapper").getMapperData(ses)
+
+  if not mapfile:
+    mapfile = data.getFileName()
+    if not mapfile:
+      exported.write_error("mapsave: no file to save the map to.", ses)
+      return
+  elif os.sep not in mapfile:
+    mapfile = config.options["datadir"] + mapfile
+
+  try:
+    data.save(mapfile)
+  except Exception, e:
+    exported.write_error("mapsave: cannot save map to '%s' (%s)." %
+                         (mapfile, e), ses)
+    return
+  exported.write_message("mapsave: saved to '%s'." % mapfile, ses)
+
+commands_dict["mapsave"] = (mapsave_cmd, "mapfile=")
+
+
+def _find_room(ses, data, text, name):
+  """
+  Finds the one room a command is talking about--the room you're in
+  if text is empty.  Writes an error and returns None if there 
+  isn't one.
+  """
+  if not text:
+    room = data.getCurrent()
+    if room == None:
+      exported.write_error("%s: don't know which room you're in." % name, ses)
+    return room
+
+  rooms = data.getMap().findRooms(text)
+  if len(rooms) != 1:
+    exported.write_error("%s: '%s' isn't one room on the map." % (name, text), 
+                         ses)
+    return None
+  return rooms[0]
+
+
+def maplabel_cmd(ses, args, input):
+  """
+  Labels a room (the room you're in if you don't say which) so you
+  can #path to it by the label.  With no arguments it shows the
+  labels.
+
+  examples:
+    #maplabel {temple}
+    #maplabel {bank} {1234}
+
+  see also: path, unmaplabel
+
+  category: commands
+  """
+  label = args["label"]
+  data = exported.get_manager("mapper").getMapperData(ses)
+  roommap = data.getMap()
+
+  if not label:
+    labels = roommap.getLabels()
+    if not labels:
+      exported.write_message("maplabel: no labels defined.", ses)
+      return
+    exported.write_message("maplabels:\n" + "\n".join(
+          ["%s: %d [%s]" % (mem, r, roommap.getTitle(r)) for mem, r in labels]),
+          ses)
+    return
+
+  room = _find_room(ses, data, args["room"], "maplabel")
+  if room == None:
+    return
+
+  roommap.setLabel(label, room)
+  exported.write_message("maplabel: {%s} is room %d [%s]." %
+                         (label, room, roommap.getTitle(room)), ses)
+
+commands_dict["maplabel"] = (maplabel_cmd, "label= room=")
+
+
+def unmaplabel_cmd(ses, args, input):
+  """
+  Removes a room label.
+
+  examples:
+    #unmaplabel {bank}
+
+  see also: maplabel
+
+  category: commands
+  """
+  label = args["label"]
+  roommap = exported.get_manager("mapper").getMapperData(ses).getMap()
+  if not dict(roommap.getLabels()).has_key(label):
+    exported.write_error("unmaplabel: no label {%s}." % label, ses)
+    return
+
+  roommap.setLabel(label, None)
+  exported.write_message("unmaplabel: {%s} removed." % label, ses)
+
+commands_dict["unmaplabel"] = (unmaplabel_cmd, "label")
+
+
+def mapcost_cmd(ses, args, input):
+  """
+  Sets how much it costs to go into a room (the room you're in if
+  you don't say which) so #path goes around it if it's cheaper.
+  Rooms cost 1 unless you say otherwise.
+
+  examples:
+    #mapcost 10
+    #mapcost 5 1234
+
+  see also: path
+
+  category: commands
+  """
+  cost = args["cost"]
+  data = exported.get_manager("mapper").getMapperData(ses)
+
+  if cost < 1:
+    exported.write_error("mapcost: the cost has to be at least 1.", ses)
+    return
+
+  room = _find_room(ses, data, args["room"], "mapcost")
+  if room == None:
+    return
+
+  data.getMap().setCost(room, cost)
+  exported.write_message("mapcost: room %d [%s] costs %d." %
+                         (room, data.getMap().getTitle(room), cost), ses)
+
+commands_dict["mapcost"] = (mapcost_cmd, "cost:int room=")
+
+
+def maphere_cmd(ses, args, input):
+  """
+  Tells the mapper which room you're in when it's lost track.
+
+  examples:
+    #maphere 1234
+    #maphere {temple}
+
+  see also: map
+
+  category: commands
+  """
+  data = exported.get_manager("mapper").getMapperData(ses)
+  room = _find_room(ses, data, args["room"], "maphere")
+  if room == None:
+    return
+
+  data.setCurrent(room)
+  exported.write_message("maphere: in room %d [%s]." %
+                         (room, data.getMap().getTitle(room)), ses)
+
+commands_dict["maphere"] = (maphere_cmd, "room")
+
+
+def mapclear_cmd(ses, args, input):
+  """
+  Throws away this session's map.
+
+  see also: map
+
+  category: commands
+  """
+  exported.get_manager("mapper").clear(ses)
+  exported.write_message("mapclear: map cleared.", ses)
+
+commands_dict["mapclear"] = (mapclear_cmd, "")
+
+
+mm = None
+
+def load():
+  """ Initializes the module by binding all the commands."""
+  global mm
+  modutils.load_commands(commands_dict)
+  mm = MapperManager()
+  exported.add_manager("mapper", mm)
+
+  exported.hook_register("mud_filter_hook", mm.mudfilter, 40)
+  exported.hook_register("to_mud_hook", mm.tomud)
+  exported.hook_register("shutdown_hook", mm.shutdown)
+
+  for mem in exported.get_active_sessions():
+    tc = config.StringConfig("maptitle", "", 1,
+         "Regular expression that matches room titles for the mapper "
+         "(the first group is the title).  Empty turns the mapper off.")
+    exported.add_config("maptitle", tc, mem)
+
+    tc = config.StringConfig("mapfail", "", 1,
+         "Regular expression that matches the mud saying you can't go "
+         "that way.")
+    exported.add_config("mapfail", tc, mem)
+
+def unload():
+  """ Unloads the module by calling any unload/unbind functions."""
+  global mm
+  mm.shutdown({})
+  modutils.unload_commands(commands_dict.keys())
+  exported.remove_manager("mapper")
+
+  exported.hook_unregister("mud_filter_hook", mm.mudfilter)
+  exported.hook_unregister("to_mud_hook", mm.tomud)
+  exported.hook_unregister("shutdown_hook", mm.shutdown)
+
+  for mem in exported.get_active_sessions():
+    exported.remove_config("maptitle", mem)
+    exported.remove_config("mapfail", mem)
+
+# Local variables:
+# mode:python
+# py-indent-offset:2
+# tab-width:2
+# End:
@@ -0,0 +1,211 @@
+#########################################################################
+# This file is part of Lyntin.
+#
+# Lyntin is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# Lyntin is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# copyright (c) Free Software Foundation 2001-2007
+#
+# $Id: logger.py,v 1.9 2007/07/24 00:39:03 willhelm Exp $
+"""
+This module defines the RecorderManager which handles #record.
+
+A recording keeps everything that goes on in a session--the mud data
+(before any gags, substitutes or highlights and with ansi), prompts
+and what gets sent to the mud--with the time each happened, in the
+binary format described in L{lyntin.recording}.  Recordings can be
+read back with L{lyntin.recording.RecordReader}::
+
+  from lyntin import recording
+  reader = recording.RecordReader("3k.rec")
+  for t, rectype, text in reader.records(since=start):
+    ...
+"""
+import os
+from lyntin import manager, config, exported, recording
+from lyntin.modules import modutils
+
+class RecorderManager(manager.Manager):
+  def __init__(self):
+    self._recorders = {}
+
+  def start(self, ses, filename):
+    """
+    Starts recording a session.
+
+    @param ses: the session to record
+    @type  ses: session.Session
+
+    @param filename: the file to write the recording to
+    @type  filename: string
+    """
+    self.stop(ses)
+    self._recorders[ses] = recording.RecordWriter(filename, ses.getName())
+
+  def stop(self, ses):
+    """
+    Stops recording a session.
+
+    @param ses: the session
+    @type  ses: session.Session
+
+    @return: the RecordWriter that was recording the session or None
+    @rtype: recording.RecordWriter
+    """
+    writer = self._recorders.get(ses)
+    if writer:
+      del self._recorders[ses]
+      writer.close()
+    return writer
+
+  def getRecorder(self, ses):
+    return self._recorders.get(ses)
+
+  def clear(self, ses):
+    self.stop(ses)
+
+  def removeSession(self, ses):
+    self.stop(ses)
+
+  def getStatus(self, ses):
+    writer = self._recorders.get(ses)
+    if writer:
+      return writer.getStatus()
+    return "not recording"
+
+  def mudfilter(self, args):
+    """
+    mud_filter_hook function for recording the (unfiltered) data from
+    the mud.
+    """
+    writer = self._recorders.get(args["session"])
+    if writer:
+      writer.write(recording.MUD, args["data"])
+    return args["dataadj"]
+
+  def promptfilter(self, args):
+    """
+    prompt_hook function for recording prompts.
+    """
+    writer = self._recorders.get(args["session"])
+    if writer:
+      writer.write(recording.PROMPT, args["prompt"])
+
+  def tomudfilter(self, args):
+    """
+    to_mud_hook function for recording what gets sent to the mud.
+    """
+    writer = self._recorders.get(args["session"])
+    if writer:
+      writer.write(recording.USER, args["data"])
+    return args["data"]
+
+  def disconnect(self, args):
+    """
+    disconnect_hook function that flushes the session's recording.
+    """
+    writer = self._recorders.get(args["session"])
+    if writer:
+      writer.flush()
+
+  def shutdown(self, args):
+    """
+    shutdown_hook function that closes all the recordings.
+    """
+    for ses in self._recorders.keys():
+      self.stop(ses)
+
+
+commands_dict = {}
+
+def record_cmd(ses, args, input):
+  """
+  Starts or stops recording a session to a file.
+
+  A recording keeps the mud data (unfiltered and with ansi), prompts
+  and everything sent to the mud along with the time each happened.
+  Unlike a log it can be searched by time quickly and read back with
+  the lyntin.recording.RecordReader.  If RECORDFILE doesn't have a 
+  path, it's put in the datadir.
+
+  With no arguments, shows whether the session is being recorded.
+  If the session is being recorded, #record stops it.
+
+  examples:
+    #record 3k.rec
+    #record
+
+  category: commands
+  """
+  recordfile = args["recordfile"]
+
+  rm = exported.get_manager("recorder")
+
+  if ses.getName() == "common":
+    exported.write_error("record: You must have a session to record.", ses)
+    return
+
+  if not recordfile:
+    writer = rm.stop(ses)
+    if writer:
+      exported.write_message("record: stopped recording to '%s' (%d records)." %
+                             (writer.getFileName(), writer.getCount()), ses)
+    else:
+      exported.write_message(rm.getStatus(ses), ses)
+    return
+
+  if os.sep not in recordfile:
+    recordfile = config.options["datadir"] + recordfile
+
+  try:
+    rm.start(ses, recordfile)
+    exported.write_message("record: recording to '%s'." % recordfile, ses)
+  except Exception, e:
+    exported.write_error("record: cannot record to '%s' (%s)." % (recordfile, e), ses)
+
+commands_dict["record"] = (record_cmd, "recordfile=")
+
+
+rm = None
+
+def load():
+  """ Initializes the module by binding all the commands."""
+  global rm
+  modutils.load_commands(commands_dict)
+  rm = RecorderManager()
+  exported.add_manager("recorder", rm)
+
+  exported.hook_register("mud_filter_hook", rm.mudfilter, 5)
+  exported.hook_register("prompt_hook", rm.promptfilter, 5)
+  exported.hook_register("to_mud_hook", rm.tomudfilter)
+  exported.hook_register("disconnect_hook", rm.disconnect)
+  exported.hook_register("shutdown_hook", rm.shutdown)
+
+def unload():
+  """ Unloads the module by calling any unload/unbind functions."""
+  global rm
+  rm.shutdown({})
+  modutils.unload_commands(commands_dict.keys())
+  exported.remove_manager("recorder")
+
+  exported.hook_unregister("mud_filter_hook", rm.mudfilter)
+  exported.hook_unregister("prompt_hook", rm.promptfilter)
+  exported.hook_unregister("to_mud_hook", rm.tomudfilter)
+  exported.hook_unregister("disconnect_hook", rm.disconnect)
+  exported.hook_unregister("shutdown_hook", rm.shutdown)
+
+# Local variables:
+# mode:python
+# py-indent-offset:2
+# tab-width:2
+# End:
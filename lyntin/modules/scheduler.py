@@ -21,17 +21,20 @@
 """
 This module defines the ScheduleManager which manages scheduling 
 events for Lyntin.  It's pretty intense.  It handles both events
-oriented around "lyntin time" (what the current Lyntin tick is)
-as well as "real time" (what time it really is).  Scheduled
-events can be lyntin commands as well as functions with 
-arguments.
+that kick off some number of seconds from when they were scheduled
+(which can be fractions of a second) as well as events at a
+"real time" (what time it really is).  Scheduled events can be 
+lyntin commands as well as functions with arguments.
+
+The scheduler has its own timer thread which sleeps until the next
+event is due and then has the events executed in the event thread.
 
 This module implements the #schedule and #unschedule commands
 as well as the completely re-implemented #tick* suite of
 commands.
 """
-import time
-from lyntin import exported, manager, utils, event
+import time, heapq, threading
+from lyntin import exported, manager, utils, event, config
 from lyntin.modules import modutils
 
 myscheduler = None
@@ -42,6 +45,21 @@ def truncate(text, maxwidth):
     text = text[:maxwidth] + "..."
   return text
 
+def format_seconds(seconds):
+  """
+  Formats a number of seconds without a fractional part if there
+  isn't one and to the millisecond if there is.
+
+  @param seconds: the number of seconds
+  @type  seconds: int or float
+
+  @returns: the formatted seconds
+  @rtype: string
+  """
+  if seconds == int(seconds):
+    return "%d" % seconds
+  return ("%.3f" % seconds).rstrip("0")
+
 class SchedEvent:
   """ 
   Holds event data as well as handles representation of the data.
@@ -59,8 +77,8 @@ class SchedEvent:
 
   def __repr__(self):
     if self._repeat == 0:
-      return truncate("%s [%s] %d {%s}" % (self._id, self._ses._name, self._offset, self._cmd), 60)
-    return truncate("%s [%s] %d(r) {%s}" % (self._id, self._ses._name, self._offset, self._cmd), 60)
+      return truncate("%s [%s] %s {%s}" % (self._id, self._ses._name, format_seconds(self._offset), self._cmd), 60)
+    return truncate("%s [%s] %s(r) {%s}" % (self._id, self._ses._name, format_seconds(self._offset), self._cmd), 60)
 
 class SchedTimeEvent:
   """
@@ -85,30 +103,113 @@ class SchedTimeEvent:
     return truncate("%s [%s] %s {%s}" % (self._id, self._ses._name, time.strftime("%d %b %H:%M:%S", time.localtime(self._offset)), self._cmd), 60)
 
 
+class SchedRunEvent(event.Event):
+  """
+  Runs the scheduler's due events in the event thread.
+  """
+  def __init__(self, scheduler):
+    self._scheduler = scheduler
+
+  def execute(self):
+    """ Execute."""
+    self._scheduler.runEvents()
+
 
 class Scheduler:
   """
   Manages scheduled data.
+
+  Events are kept in a min-heap of (deadline, sequence number, event)
+  where the deadline is in seconds since the epoch.  The sequence
+  number keeps events with the same deadline in the order they were
+  added.  There are also dicts from id, tag and session to events.
+
+  Removing an event only takes it out of the dicts--its heap entry is
+  left where it is and skipped when it comes off the heap (an entry
+  is only live if the event is still in the id dict and the entry's
+  sequence number is the event's current one).  When more than half
+  the heap entries are dead, the heap is rebuilt without them.
+
+  The timer thread waits on a condition until the earliest deadline
+  (or until an event with an earlier one is added) and then enqueues
+  a SchedRunEvent which runs the due events in the event thread.
+  Repeating events are rescheduled from their previous deadline
+  rather than from when they ran so they don't drift.
   """
   def __init__(self):
-    # mapping of tick time -> SchedEvent list
-    self._events = {}
+    # heap of (seconds since epoch, seq, SchedEvent)
+    self._events = []
 
-    # mapping of seconds since epoch -> SchedEvent list
-    self._tevents = {}
+    # id -> SchedEvent, tag -> {id: SchedEvent}, 
+    # session -> {id: SchedEvent}
+    self._byid = {}
+    self._bytag = {}
+    self._bysession = {}
 
-    # the current Lyntin tick
-    self._current_tick = 0
+    # the number of dead entries in the heap
+    self._dead = 0
 
     # the event id index
     self._eid = 0
 
+    # the sequence number for the next heap entry
+    self._seq = 0
+
+    # guards the heap and the dicts and wakes the timer thread
+    self._cond = threading.Condition()
+    self._running = 0
+    self._pending = 0
+    self._thread = None
+
   def startup(self):
-    exported.hook_register("timer_hook", self.timeUpdate)
+    exported.hook_register("shutdown_hook", self.stop)
+
+    # there's no timer in batch mode so runs are repeatable (see
+    # lyntin.batch)--events get scheduled but don't go off
+    if config.options.get("batch"):
+      return
+
+    self._running = 1
+    self._thread = exported.myengine.startthread("scheduler", self._run)
 
   def shutdown(self):
-    exported.hook_unregister("timer_hook", self.timeUpdate)
+    exported.hook_unregister("shutdown_hook", self.stop)
+    self.stop()
+
+  def stop(self, args=None):
+    """
+    Stops the timer thread.
+    """
+    self._cond.acquire()
+    try:
+      self._running = 0
+      self._cond.notifyAll()
+    finally:
+      self._cond.release()
+
+  def __len__(self):
+    return len(self._byid)
  
+  def _run(self):
+    self._cond.acquire()
+    try:
+      while self._running:
+        if self._pending or not self._events:
+          self._cond.wait()
+          continue
+
+        wait = self._events[0][0] - time.time()
+        if wait > 0:
+          self._cond.wait(wait)
+          continue
+
+        # the events get run in the event thread and we don't look
+        # at the heap again until they have been
+        self._pending = 1
+        SchedRunEvent(self).enqueue()
+    finally:
+      self._cond.release()
+
   def getEvents(self, ses):
     """
     Returns a list of the events for a given session.
@@ -119,17 +220,7 @@ class Scheduler:
     @returns: the list of session information
     @rtype: list of strings
     """
-    output = []
-    for listing in self._events.values():
-      for mem in listing:
-        if mem._ses == ses:
-          output.append(repr(mem))
-
-    for listing in self._tevents.values():
-      for mem in listing:
-        if mem._ses == ses:
-          output.append(repr(mem))
-
+    output = [repr(mem) for mem in self._bysession.get(ses, {}).values()]
     output.sort()
     return output
 
@@ -137,7 +228,8 @@ class Scheduler:
     """
     Finds an event by id or by tag.  It returns the event as well
     as adding a _next_tick attribute to the event telling you
-    when the event is next scheduled to execute.  Sneaky, eh?
+    when (in seconds since the epoch) the event is next scheduled 
+    to execute.  Sneaky, eh?
 
     @param id: the id or tag of the event to find
     @type  id: string
@@ -145,21 +237,27 @@ class Scheduler:
     @returns: the SchedEvent instance or None
     @rtype: SchedEvent
     """
-    for key in self._events.keys():
-      listing = self._events[key]
-      for mem in listing:
-        if mem._id == id or mem._tag == id:
-          mem._next_tick = key
-          return mem
-
-    for key in self._tevents.keys():
-      listing = self._tevents[key]
-      for mem in listing:
-        if mem._id == id or mem._tag == id:
-          mem._next_tick = key
-          return mem
-
-    return []
+    mem = self._byid.get(id)
+    if mem == None:
+      tagged = self._bytag.get(id)
+      if not tagged:
+        return []
+      mem = tagged.values()[0]
+
+    mem._next_tick = mem._deadline
+    return mem
+
+  def getEventsByTag(self, tag):
+    """
+    Returns the events with a tag.
+
+    @param tag: the tag
+    @type  tag: string
+
+    @returns: the events
+    @rtype: list of SchedEvents
+    """
+    return self._bytag.get(tag, {}).values()
 
   def removeById(self, id):
     """
@@ -171,85 +269,143 @@ class Scheduler:
     @returns: a list of the events unscheduled
     @rtype: list of strings
     """
-    output = []
-    for listing in self._events.values():
-      for mem in listing:
-        if id == '*' or mem._id == id or mem._tag == id:
-          output.append(repr(mem))
-          listing.remove(mem)
-
-    for listing in self._tevents.values():
-      for mem in listing:
-        if id == '*' or mem._id == id or mem._tag == id:
-          output.append(repr(mem))
-          listing.remove(mem)
+    self._cond.acquire()
+    try:
+      if id == '*':
+        events = self._byid.values()
+      else:
+        events = self._bytag.get(id, {}).values()
+        mem = self._byid.get(id)
+        if mem != None and not mem in events:
+          events.append(mem)
+
+      for mem in events:
+        self._remove(mem)
+
+      if self._dead > 64 and self._dead > len(self._byid):
+        self._compact()
+    finally:
+      self._cond.release()
 
+    output = [repr(mem) for mem in events]
     output.sort()
     return output
 
-  def addEvent(self, tick, sevent, real=0, id=-1):
+  def _remove(self, sevent):
+    """
+    Takes an event out of the indexes.  Its heap entry becomes dead.
+    """
+    del self._byid[sevent._id]
+
+    tagged = self._bytag[sevent._tag]
+    del tagged[sevent._id]
+    if not tagged:
+      del self._bytag[sevent._tag]
+
+    sesevents = self._bysession[sevent._ses]
+    del sesevents[sevent._id]
+    if not sesevents:
+      del self._bysession[sevent._ses]
+
+    self._dead += 1
+
+  def _compact(self):
+    """
+    Rebuilds the heap without the dead entries.
+    """
+    self._events = [mem for mem in self._events if self._isLive(mem)]
+    heapq.heapify(self._events)
+    self._dead = 0
+
+  def _isLive(self, entry):
+    sevent = entry[2]
+    return self._byid.get(sevent._id) is sevent and sevent._seq == entry[1]
+
+  def addEvent(self, deadline, sevent, id=-1):
     """
     Adds an event to the scheduler.
 
-    @param tick: the tick that this event kicks off at
-    @type  tick: int
+    @param deadline: when the event kicks off in seconds since the 
+        epoch
+    @type  deadline: float
 
-    @param sevent: the SchedEvent object
+    @param sevent: the SchedEvent or SchedTimeEvent object
     @type  sevent: SchedEvent
 
-    @param real: whether or not this is a real event (tick is seconds since
-        epoch) or a regular event (tick is an offset of seconds from now)
-    @type  real: int
+    @param id: the id to give the event (-1 to give it the next one)
+    @type  id: string
     """
-    if id == -1:
-      eid = self._eid
-      self._eid += 1
-    else:
-      eid = id
+    self._cond.acquire()
+    try:
+      if id == -1:
+        eid = self._eid
+        self._eid += 1
+      else:
+        eid = id
 
-    sevent._id = str(eid)
+      sevent._id = str(eid)
 
-    if real == 0:
-      eventdict = self._events
-    else:
-      eventdict = self._tevents
+      # an event with this id that's already scheduled is replaced
+      old = self._byid.get(sevent._id)
+      if old != None:
+        self._remove(old)
 
-    if eventdict.has_key(tick):
-      eventdict[tick].append(sevent)
-    else:
-      eventdict[tick] = [sevent]
+      sevent._deadline = deadline
+      sevent._seq = self._seq
+      self._seq += 1
 
-  def timeUpdate(self, args):
-    """
-    This gets called by the timer_hook in the engine every
-    second.  It goes through and executes all the events for this
-    Lyntin tick as well as events who are supposed to execute at
-    this seconds since the epoch or before.
+      self._byid[sevent._id] = sevent
+      self._bytag.setdefault(sevent._tag, {})[sevent._id] = sevent
+      self._bysession.setdefault(sevent._ses, {})[sevent._id] = sevent
 
-    It also handles tossing events back in the schedule if they
-    need repeating.
-    """
-    tick = args["tick"]
+      heapq.heappush(self._events, (deadline, sevent._seq, sevent))
 
-    events = []
+      # the timer thread only needs waking if this is the new 
+      # earliest event
+      if self._events[0][2] is sevent:
+        self._cond.notifyAll()
+    finally:
+      self._cond.release()
 
-    if self._events.has_key(tick):
-      for mem in self._events[tick]:
-        events.append(mem)
+  def _popDue(self, now):
+    """
+    Pops the live events that are due at or before now and takes 
+    them out of the indexes.
+    """
+    events = []
+    heap = self._events
+    while heap and heap[0][0] <= now:
+      entry = heapq.heappop(heap)
+      if self._isLive(entry):
+        self._remove(entry[2])
+        events.append(entry[2])
+      self._dead -= 1
+    return events
+
+  def runEvents(self, now=None):
+    """
+    Executes all the events that are due (including any that were
+    missed).  This gets called in the event thread when the timer
+    thread finds events are due.
 
-      del self._events[tick]
+    It also handles tossing events back in the schedule if they
+    need repeating.  A repeating event's next deadline is its last
+    one plus its offset (skipping any it has completely missed) so
+    it keeps to its schedule however late it ran.
 
-    self._current_tick = tick
+    @param now: the time to run events up to (defaults to now)
+    @type  now: float
+    """
+    if now == None:
+      now = time.time()
 
-    # we want to execute for this second and any previous seconds
-    # that have been missed.
-    sec = int(time.time())
-    keys = self._tevents.keys()
-    keys = [mem for mem in keys if mem < sec]
-    for key in keys:
-      for mem in self._tevents[key]:
-        events.append(mem)
-      del self._tevents[key]
+    self._cond.acquire()
+    try:
+      events = self._popDue(now)
+      self._pending = 0
+      self._cond.notifyAll()
+    finally:
+      self._cond.release()
 
     # go through and execute all the events we've found
     for mem in events:
@@ -265,8 +421,11 @@ class Scheduler:
           exported.write_traceback("exception kicked up while trying to execute event.")
 
       # handles repeating events
-      if mem._repeat == 1:
-        self.addEvent(tick + mem._offset, mem, id=mem._id)
+      if mem._repeat == 1 and mem._offset > 0:
+        deadline = mem._deadline + mem._offset
+        if deadline <= now:
+          deadline += (int((now - deadline) / mem._offset) + 1) * mem._offset
+        self.addEvent(deadline, mem, id=mem._id)
 
 def schedule_cmd(ses, args, input):
   """
@@ -277,7 +436,8 @@ def schedule_cmd(ses, args, input):
 
   First column is the event id.
   Second column is the session it's in.
-  Third column is the tick offset or time it's going to kick off at.
+  Third column is the offset in seconds or time it's going to kick 
+  off at.
   Fourth column is the command to execute.
 
   With arguments it creates a scheduled event to kick off (and 
@@ -288,13 +448,18 @@ def schedule_cmd(ses, args, input):
 
     #schedule {5} {#showme blah}
 
-  will kick off 5 ticks from now (a tick is approx one second) and
-  will execute "#showme blah".
+  will kick off 5 seconds from now and will execute "#showme blah".
 
     #schedule {1m30s} {#showme blah}
 
   will kick off in 1 minute and 30 seconds.
 
+    #schedule {2.5s} {#showme blah}
+    #schedule {250ms} {#showme blah}
+
+  will kick off in 2 and a half seconds and in a quarter of a 
+  second.
+
     #schedule {10} {#showme blah} {true}
 
   will kick off every 10 seconds.
@@ -331,13 +496,12 @@ def schedule_cmd(ses, args, input):
 
   if setimespan != 0:
     sevent = SchedEvent(setimespan, ses, cmd, repeat, quiet)
-    tick = setimespan + myscheduler._current_tick
-    myscheduler.addEvent(tick, sevent)
+    myscheduler.addEvent(time.time() + setimespan, sevent)
 
   else:
     repeat = 0
     sevent = SchedTimeEvent(setime, ses, cmd, repeat, quiet)
-    myscheduler.addEvent(setime, sevent, real=1)
+    myscheduler.addEvent(setime, sevent)
 
   if not quiet:
     exported.write_message("schedule: event scheduled: %r" % sevent)
@@ -426,7 +590,7 @@ def _tickwarnfunc(ses, warnlen):
   if tickaction:
     event.InputEvent(tickaction, internal=1, ses=ses).enqueue()
   else:
-    exported.write_message("ticker: %d seconds to tick!" % warnlen)
+    exported.write_message("ticker: %s seconds to tick!" % format_seconds(warnlen))
 
 
 def _addtickevents(ses):
@@ -447,7 +611,7 @@ def _addtickevents(ses):
   sevent = SchedEvent(ses._ticker["len"], ses, _tickfunc, repeat=1, 
                       quiet=1, tag=tick_tagname)
   sevent._args = [ses]
-  tick = myscheduler._current_tick + ses._ticker["len"]
+  tick = time.time() + ses._ticker["len"]
   myscheduler.addEvent(tick, sevent)
 
   # build the tickwarn event, figure out when it should start,
@@ -506,11 +670,11 @@ def tick_cmd(ses, args, input):
     ses._ticker = DEFAULT_TICKER.copy()
 
   if ses._ticker["enabled"] == 1:
-    tick = myscheduler._current_tick
     sevent = myscheduler.getEventById(ses.getName() + "tick")
-    delta = sevent._next_tick - tick
+    delta = max(sevent._next_tick - time.time(), 0)
 
-    exported.write_message("tick: next tick in %d seconds." % delta, ses)
+    exported.write_message("tick: next tick in %s seconds." % 
+                           format_seconds(round(delta, 1)), ses)
   else:
     exported.write_message("tick: ticker is not enabled.", ses)
 
@@ -572,6 +736,7 @@ def ticksize_cmd(ses, args, input):
     #ticksize
     #ticksize 6
     #ticksize 1h2m30s
+    #ticksize 2.5s
 
   see also: tick, tickon, tickoff, ticksize, tickwarnsize
 
@@ -583,8 +748,8 @@ def ticksize_cmd(ses, args, input):
   size = args["size"]
 
   if size == 0:
-    exported.write_message("ticksize: ticksize is %d seconds." % 
-                           ses._ticker["len"], ses)
+    exported.write_message("ticksize: ticksize is %s seconds." % 
+                           format_seconds(ses._ticker["len"]), ses)
     return
 
   ses._ticker["len"] = size
@@ -618,8 +783,8 @@ def tickwarnsize_cmd(ses, args, input):
   size = args["size"]
 
   if size == 0:
-    exported.write_message("tickwarnsize: tickwarnsize is %d seconds." % 
-                           ses._ticker["warn_len"], ses)
+    exported.write_message("tickwarnsize: tickwarnsize is %s seconds." % 
+                           format_seconds(ses._ticker["warn_len"]), ses)
     return
 
   if size > ses._ticker["len"]:
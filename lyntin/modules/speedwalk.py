@@ -41,13 +41,23 @@ To handle instances where certain combinations will get expanded, but we
 really don't want them to be, we use #swexclude::
 
   #swexclude {news}
+
+Each speedwalk string is compiled once into its list of directions
+(and the list is cached).  If none of the directions is an alias, 
+a command or has variables in it, the whole walk goes to the mud in 
+one socket write--otherwise it goes back through the user filters 
+like anything else the user types.  Setting speedwalkdelay paces 
+the walk for muds that drop commands that come in a burst.
 """
 
 # Originally written 2002 by Sebastian John
 
-import re, string
+import re, string, time
 from lyntin import manager, utils, exported
-from lyntin.modules import modutils
+from lyntin.modules import modutils, scheduler
+
+# the most compiled walks we keep for each session
+MAX_WALKS = 256
 
 class SpeedwalkHash:
   def __init__(self):
@@ -163,19 +173,54 @@ class SpeedwalkHash:
   
   def compileRegexp(self):
     """
-    Compiles the actual speedwalking pattern.
+    Compiles the actual speedwalking pattern and the tokenizer that
+    splits a speedwalk into counts and dirs.
     Also maintains self._aliases the default excludes.
+
+    The dirs are tried shortest first so a speedwalk is split the
+    same way as when we went through it a character at a time.
     """
+    self._walks = {}
     if self._dirs:
-      keys = "|".join(self._dirs.keys())
+      dirs = self._dirs.keys()
+      dirs.sort(lambda x, y: cmp(len(x), len(y)) or cmp(x, y))
+      keys = "|".join([re.escape(mem) for mem in dirs])
       regexp = "^(\\d*(%s))+$" % (keys)
       self._regexp = re.compile(regexp)
+      self._tokenizer = re.compile("(\\d*)(%s)" % (keys))
       self._aliases = self._dirs.values()
       self._dirs_available = self._dirs.keys()
     else:
       self._regexp = None
+      self._tokenizer = None
       self._aliases = []
       self._dirs_available = []
+
+  def compileWalk(self, text):
+    """
+    Expands a speedwalk into its list of directions.  Walks are
+    cached until the dirs change.
+
+    @param text: the speedwalk (it has to match self._regexp)
+    @type  text: string
+
+    @returns: the direction expansions in order
+    @rtype: list of strings
+    """
+    walk = self._walks.get(text)
+    if walk != None:
+      return walk
+
+    walk = []
+    for num, dir in self._tokenizer.findall(text):
+      if num: count = int(num)
+      else: count = 1
+      walk.extend([self._dirs[dir]] * count)
+
+    if len(self._walks) >= MAX_WALKS:
+      self._walks = {}
+    self._walks[text] = walk
+    return walk
   
   def clearExcludes(self):
     """
@@ -271,6 +316,9 @@ class SpeedwalkManager(manager.Manager):
   def __init__(self):
     self._hashes = {}
 
+    # session -> list of lines waiting to be sent by a paced walk
+    self._paced = {}
+
   def clearDirs(self, ses):
     if self._hashes.has_key(ses):
       self._hashes[ses].clearDirs()
@@ -363,6 +411,8 @@ class SpeedwalkManager(manager.Manager):
   def removeSession(self, ses):
     if self._hashes.has_key(ses):
       del self._hashes[ses]
+    if self._paced.has_key(ses):
+      del self._paced[ses]
 
   def persist(self, args):
     """
@@ -386,7 +436,8 @@ class SpeedwalkManager(manager.Manager):
     verbatim = args["verbatim"]
     text = args["dataadj"]
     
-    if not self._hashes.has_key(ses) or exported.get_config("speedwalk", ses) == 0 or verbatim == 1:
+    if not self._hashes.has_key(ses) or verbatim == 1 or \
+        getattr(exported.get_config_snapshot(ses), "speedwalk", 1) == 0:
       return text
 
     sdata = self._hashes[ses]
@@ -395,27 +446,97 @@ class SpeedwalkManager(manager.Manager):
         or text in sdata._aliases or not sdata._regexp.match(text):
       return text
     
-    swdirs = []
-    dir = num = ""
-    for char in text:
-      if char.isdigit():
-        num = num + char
-      else:
-        dir = dir + char
-        if dir in sdata._dirs_available:
-          if num: count = int(num)
-          else: count = 1
-          for i in range(count):
-            swdirs.append(sdata._dirs[dir])
-          dir = num = ""
+    swdirs = sdata.compileWalk(text)
     
-    output = ";".join(swdirs)
-    if output == text:
+    if ";".join(swdirs) == text:
       return text
-    else:
+
+    self.sendWalk(ses, swdirs)
+    return None
+
+  def sendWalk(self, ses, swdirs):
+    """
+    Sends a list of directions to the mud.  If they're all plain 
+    they go out in one write (or paced if speedwalkdelay is set)--
+    otherwise they go through lyntin_command like user input.
+
+    @param ses: the session
+    @type  ses: session.Session
+
+    @param swdirs: the directions
+    @type  swdirs: list of strings
+    """
+    if not swdirs or not self._isPlain(ses, swdirs):
       # anything that gets recursed on should be recursed internally
-      exported.lyntin_command(output, 1, ses)
-      return None
+      exported.lyntin_command(";".join(swdirs), 1, ses)
+      return
+
+    snap = exported.get_config_snapshot(ses)
+    delay = getattr(snap, "speedwalkdelay", 0)
+    if delay > 0 and scheduler.myscheduler != None:
+      self._pace(ses, swdirs, delay, getattr(snap, "speedwalkburst", 1))
+    else:
+      ses.writeSocket("\n".join(swdirs) + "\n")
+
+  def _isPlain(self, ses, swdirs):
+    """
+    Returns whether (1) or not (0) all the directions would go 
+    through the user filters unchanged (so we can write them to the 
+    mud ourselves).  They can't be commands, history references or 
+    aliases and can't have anything in them that gets split or 
+    expanded.
+    """
+    snap = exported.get_config_snapshot()
+    specials = (snap.splitchar, "\\", "$", "%")
+    am = exported.get_manager("alias")
+
+    seen = {}
+    for mem in swdirs:
+      if seen.has_key(mem):
+        continue
+      seen[mem] = 1
+      if not mem or mem.startswith(snap.commandchar) or mem.startswith("!"):
+        return 0
+      for c in specials:
+        if c in mem:
+          return 0
+      if am and am.getAlias(ses, mem) != None:
+        return 0
+    return 1
+
+  def _pace(self, ses, swdirs, delay, burst):
+    """
+    Sends a walk a burst of lines at a time with delay milliseconds
+    between bursts.  A walk that comes in while another one is still
+    being sent goes after it.
+    """
+    # what's sent now isn't the whole walk so it can't be resent as-is
+    exported.myengine.countCommand()
+
+    burst = max(burst, 1)
+    tag = ses.getName() + "speedwalk"
+    if self._paced.has_key(ses) and scheduler.myscheduler.getEventById(tag):
+      self._paced[ses].extend(swdirs)
+      return
+
+    self._paced[ses] = list(swdirs)
+    self._sendPaced(ses, delay / 1000.0, burst)
+
+  def _sendPaced(self, ses, delay, burst):
+    lines = self._paced.get(ses)
+    if not lines:
+      return
+
+    ses.writeSocket("\n".join(lines[:burst]) + "\n")
+    del lines[:burst]
+    if not lines:
+      del self._paced[ses]
+      return
+
+    sevent = scheduler.SchedEvent(delay, ses, self._sendPaced, quiet=1, 
+                                  tag=ses.getName() + "speedwalk")
+    sevent._args = [ses, delay, burst]
+    scheduler.myscheduler.addEvent(time.time() + delay, sevent)
 
 
 commands_dict = {}
@@ -442,6 +563,13 @@ def swdir_cmd(ses, args, input):
   "east;east;east;east;south;south;northeast" and who wants to type all 
   that?
 
+  If the mud drops commands that come in too quickly, set 
+  speedwalkdelay to the number of milliseconds to wait between 
+  sending speedwalkburst directions at a time:
+
+    #config speedwalkdelay 250
+    #config speedwalkburst 2
+
   see also: swexclude
 
   category: commands
@@ -550,6 +678,16 @@ def load():
          "Allows you to turn on and turn off speedwalk handling.")
     exported.add_config("speedwalk", tc, mem)
 
+    tc = config.IntConfig("speedwalkdelay", 0, 1,
+         "Milliseconds to wait between bursts of speedwalk directions.  "
+         "0 sends the whole speedwalk at once.")
+    exported.add_config("speedwalkdelay", tc, mem)
+
+    tc = config.IntConfig("speedwalkburst", 1, 1,
+         "The number of speedwalk directions to send at a time when "
+         "speedwalkdelay is set.")
+    exported.add_config("speedwalkburst", tc, mem)
+
 def unload():
   """ Unloads the module by calling any unload/unbind functions."""
   global sm
@@ -562,6 +700,8 @@ def unload():
   # remove configuration items for every session involved
   for mem in exported.get_active_sessions():
     exported.remove_config("speedwalk", mem)
+    exported.remove_config("speedwalkdelay", mem)
+    exported.remove_config("speedwalkburst", mem)
 
 # Local variables:
 # mode:python
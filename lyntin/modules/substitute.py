@@ -20,15 +20,37 @@
 #########################################################################
 """
 This module defines the SubstituteManager which handles substitutes.
+
+Substitutes are done in a single pass over the line.  All the 
+substitutes of a session are folded into one matcher and we replace
+matches left to right.  Where more than one substitute matches at the
+same place, plain text substitutes win over r[...] regular expression
+substitutes and the longest plain text wins.  Regular expression
+substitutes go in sorted order.  Substituted text is never substituted
+again.
+
+Matching is done against the line with the ansi color codes taken out
+and color codes that were in replaced text are put back after the 
+replacement so the colors after a substitute are the same as they
+would have been.
 """
+import re
 from lyntin import ansi, manager, utils, exported
 from lyntin.modules import modutils
 
+ESC = chr(27)
+
 class SubstituteData:
   def __init__(self):
     self._substitutes = {}
     self._antisubs = []
 
+    # the combined matchers get built the first time we need them
+    # after the substitutes or antisubstitutes change
+    self._subset = None
+    self._compiled = None
+    self._antisubset = None
+
   def addSubstitute(self, item, substitute):
     """
     Adds a substitute to the dict.
@@ -40,10 +62,12 @@ class SubstituteData:
     @type  substitute: string
     """
     self._substitutes[item] = substitute 
+    self._subset = None
 
   def addAntiSubstitute(self, item):
     """ Adds an antisubstitute."""
     self._antisubs.append(item)
+    self._antisubset = None
 
   def clear(self):
     """
@@ -51,6 +75,8 @@ class SubstituteData:
     """
     self._substitutes.clear()
     self._antisubs = []
+    self._subset = None
+    self._antisubset = None
 
   def removeSubstitutes(self, text):
     """
@@ -71,6 +97,7 @@ class SubstituteData:
     for mem in badsubstitutes:
       ret.append((mem, self._substitutes[mem]))
       del self._substitutes[mem]
+    self._subset = None
 
     return ret
 
@@ -87,6 +114,7 @@ class SubstituteData:
     for mem in badsubs:
       ret.append(mem)
       self._antisubs.remove(mem)
+    self._antisubset = None
 
     return ret
 
@@ -110,7 +138,43 @@ class SubstituteData:
     """
     return self._antisubs
 
-  def expand(self, text):
+  def _buildSets(self):
+    """
+    Compiles the substitutes and antisubstitutes into their combined
+    matchers.
+    """
+    if self._subset == None:
+      listing = self._substitutes.keys()
+      listing.sort()
+      self._compiled = {}
+      for mem in listing:
+        if mem:
+          self._compiled[mem] = compile_item(mem)
+      self._subset = utils.RegexpSet([(mem, self._compiled[mem]) 
+                                      for mem in listing if mem])
+
+    if self._antisubset == None:
+      self._antisubset = utils.RegexpSet([(mem, compile_item(mem)) 
+                                          for mem in self._antisubs if mem])
+
+  def _getReplacement(self, item, text, begin):
+    """
+    Figures out the replacement for a substitute that matched at
+    begin.  Regular expression substitutes can refer to groups in
+    the match with \\1 or \\g<1>.
+    """
+    substitute = self._substitutes[item]
+    compiled = self._compiled[item]
+    if compiled.groups > 0:
+      match = compiled.match(text, begin)
+      if match:
+        try:
+          return match.expand(substitute)
+        except (re.error, IndexError):
+          pass
+    return substitute
+
+  def expand(self, text, plaintext=None):
     """
     Looks at mud data and performs any substitutes.
 
@@ -119,21 +183,84 @@ class SubstituteData:
     @param text: the text to expand substitutes in
     @type  text: string
 
+    @param plaintext: the text with ansi color codes filtered out if
+        the caller already has it
+    @type  plaintext: string
+
     @return: the (un)adjusted text
     @rtype: string
     """
-    # FIXME -- this isn't done correctly.
-    if len(text) > 0:
-      # check for antisubs first
-      for mem in self._antisubs:
-        if text.find(mem) != -1:
-          return text
-
-      # check for subs
-      for mem in self._substitutes.keys():
-        text = text.replace(mem, self._substitutes[mem])
-
-    return text 
+    if len(text) == 0 or (not self._substitutes):
+      return text
+
+    self._buildSets()
+
+    hascolor = (text.find(ESC) != -1)
+    if plaintext == None:
+      if hascolor:
+        plaintext = ansi.filter_ansi(text)
+      else:
+        plaintext = text
+
+    # check for antisubs first
+    if self._antisubset.search(plaintext) != None:
+      return text
+
+    # find all the substitutes left to right
+    spans = [(begin, end, self._getReplacement(item, plaintext, begin))
+             for (item, begin, end) in self._subset.findAll(plaintext)]
+
+    if not spans:
+      return text
+
+    if not hascolor:
+      newlist = []
+      place = 0
+      for (begin, end, replacement) in spans:
+        newlist.append(text[place:begin])
+        newlist.append(replacement)
+        place = end
+      newlist.append(text[place:])
+      return "".join(newlist)
+
+    # there's color in the line so we walk the tokens.  color tokens
+    # that fall in replaced text go after the replacement.
+    tokens = ansi.split_ansi_from_text(text)
+    newlist = []
+    place = 0
+    si = 0
+    numspans = len(spans)
+    inspan = 0
+    for mem in tokens:
+      if mem[:1] == ESC and ansi.is_color_token(mem):
+        newlist.append(mem)
+        continue
+
+      i = 0
+      memlength = len(mem)
+      while i < memlength:
+        if inspan:
+          end = spans[si][1] - place
+          if end > memlength:
+            break
+          inspan = 0
+          si = si + 1
+          i = end
+
+        elif si < numspans and spans[si][0] - place < memlength:
+          begin = spans[si][0] - place
+          newlist.append(mem[i:begin])
+          newlist.append(spans[si][2])
+          inspan = 1
+          i = begin
+
+        else:
+          newlist.append(mem[i:])
+          break
+
+      place = place + memlength
+
+    return "".join(newlist)
 
   def getInfo(self, text=''):
     """
@@ -316,11 +443,35 @@ class SubstituteManager(manager.Manager):
     ses = args["session"]
     text = args["dataadj"]
 
-    if exported.get_config("ignoresubs", ses, 0) == 0:
-      text = self.expand(ses, text)
+    if getattr(exported.get_config_snapshot(ses), "ignoresubs", 0) == 0:
+      if self._subs.has_key(ses):
+        # substitute places are figured against the text with ^M in 
+        # it, so we can only use the shared filtered line if there's 
+        # no ^M.
+        if text.find("\r") == -1:
+          text = self._subs[ses].expand(text, utils.filter_line_ansi(args))
+        else:
+          text = self._subs[ses].expand(text)
     return text
 
 
+def compile_item(item):
+  """
+  Compiles a substitute or antisubstitute item.  Items using the
+  r[...] syntax are regular expressions--everything else is plain
+  text.
+
+  @param item: the item to compile
+  @type  item: string
+
+  @return: the compiled regular expression
+  @rtype: Re
+  """
+  if utils.REG_REGEXP.match(item):
+    return utils.compile_regexp(item)
+  return re.compile(re.escape(item))
+
+
 commands_dict = {}
 
 def substitute_cmd(ses, args, input):
@@ -331,6 +482,14 @@ def substitute_cmd(ses, args, input):
 
   Braces are advised around both 'item' and 'substitution'.
 
+  The item can be a regular expression using the r[ ... ] syntax (put 
+  an "i" after the ] to ignore case).  The substitution can then 
+  refer to groups in the match with \\1, \\2 or \\g<1> and so on.
+
+  examples:
+    #substitute {Bob} {Robert}
+    #substitute {r[^(\\w+) tells you]} {\\1 whispers}
+
   category: commands
   """
   item = args["item"]
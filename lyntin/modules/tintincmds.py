@@ -20,7 +20,8 @@
 #########################################################################
 
 import os, os.path
-from lyntin import net, utils, engine, constants, config, exported, event
+from lyntin import net, utils, engine, constants, config, exported, event, \
+     expression
 from lyntin.modules import modutils
 
 """
@@ -165,21 +166,44 @@ def history_cmd(ses, args, input):
 commands_dict["history"] = (history_cmd, "count:int=30")
 
 
+def _evaluate(ses, expr):
+  """
+  Evaluates an #if or #math expression with the expression evaluator
+  or, if the evalexpressions config item is on, as Python code after
+  expanding variables.
+  """
+  if exported.get_config("evalexpressions", ses, 0):
+    return eval(exported.expand_ses_vars(expr, ses))
+  return expression.evaluate(expr, ses.lookupVariable)
+
 def if_cmd(ses, args, input):
   """
-  Allows you to do some boolean logic based on Lyntin variables
-  or any Python expression.  If this expression returns a non-false
-  value, then the action will be performed otherwise the elseaction
-  (if there is one) will be peformed.
+  Allows you to do some boolean logic based on Lyntin variables.
+  If this expression returns a non-false value, then the action 
+  will be performed otherwise the elseaction (if there is one) 
+  will be peformed.
 
   examples:
     #if {$myhpvar < 100} {#showme PANIC!}
     #if {$myhpvar < 100 and $myspvar < 100} {#showme PANIC!}
     #if {'$name' == 'Joe'} {#showme That joe is a jerk.}
 
-  When you're comparing variable values with other strings, make sure 
-  to put them in quotes becuase variable expansion happens before
-  the if command is evaluated.
+  Expressions can use numbers, quoted strings, variables, arithmetic 
+  (+ - * / // % **), comparisons (== != < <= > >=), boolean logic 
+  (and, or, not) and parentheses.  Variables are looked up when the
+  expression is evaluated: ones whose values look like numbers are
+  numbers and the rest are strings.  Variables inside quoted strings 
+  are expanded.
+
+  If you want the old behavior where variables were expanded and 
+  the expression was evaluated as Python code, turn on the 
+  evalexpressions config item:
+
+    #config evalexpressions on
+
+  When you're comparing variable values with other strings in that
+  mode, make sure to put them in quotes becuase variable expansion 
+  happens before the if command is evaluated.
 
   examples:
     WRONG: #if {$name == Joe} {#showme Joe is a jerk.}
@@ -194,7 +218,7 @@ def if_cmd(ses, args, input):
   elseaction = args["elseaction"]
 
   try:
-    if eval(expr):
+    if _evaluate(ses, expr):
       exported.lyntin_command(action, 1, ses)
     elif elseaction:
       exported.lyntin_command(elseaction, 1, ses)
@@ -203,7 +227,7 @@ def if_cmd(ses, args, input):
   except Exception, e:
     exported.write_error("if: exception: %s" % e, ses)
 
-commands_dict["if"] = (if_cmd, "expr action elseaction=")
+commands_dict["if"] = (if_cmd, "expr action elseaction=", "noexpansion")
 
 
 def info_cmd(ses, args, input):
@@ -266,7 +290,9 @@ def loop_cmd(ses, args, input):
 
     #4 {reclaim corpse}
 
-  which will send "reclaim corpse" to the mud 5 times.
+  which will send "reclaim corpse" to the mud 4 times.
+
+  Whatever the iterations send goes to the mud in one write.
 
   category: commands
   """
@@ -305,10 +331,24 @@ def loop_cmd(ses, args, input):
     #   loopcommand = command.replace("%0", repr(i))
     #   exported.lyntin_command(loopcommand, internal=1, session=ses)
 
-  for mem in loopitems:
-    mem = mem.strip()
-    loopcommand = command.replace("%0", mem)
-    exported.lyntin_command(loopcommand, internal=1, session=ses)
+  if not loopitems:
+    return
+
+  # without a %0 every iteration is the same so it's a #N
+  if command.find("%0") == -1:
+    exported.myengine.handleRepeat(command, len(loopitems), ses)
+    return
+
+  # aliases and speedwalks can match on the item so each iteration
+  # goes through the filters--but it all goes to the mud in one write
+  ses.startBatch()
+  try:
+    for mem in loopitems:
+      mem = mem.strip()
+      loopcommand = command.replace("%0", mem)
+      exported.lyntin_command(loopcommand, internal=1, session=ses)
+  finally:
+    ses.endBatch()
 
 commands_dict["loop"] = (loop_cmd, "fromto comm range:boolean=true")
 
@@ -321,14 +361,17 @@ def math_cmd(ses, args, input):
   examples:
     #math {hps} {$hps + 5}
 
+  The operation is evaluated the same way #if expressions are--see
+  the #if help for details.
+
   category: commands
   """
-  var = args["var"]
+  var = exported.expand_ses_vars(args["var"], ses)
   ops = args["operation"]
   quiet = args["quiet"]
 
   try:
-    rvalue = eval(ops)
+    rvalue = _evaluate(ses, ops)
     varman = exported.get_manager("variable")
     if varman:
       varman.addVariable(ses,var, str(rvalue))
@@ -337,7 +380,7 @@ def math_cmd(ses, args, input):
   except Exception, e:
     exported.write_error("math: exception: %s\n%s" % (ops, e), ses)
 
-commands_dict["math"] = (math_cmd, "var operation quiet:boolean=false")
+commands_dict["math"] = (math_cmd, "var operation quiet:boolean=false", "noexpansion")
 
 
 def nop_cmd(ses, args, input):
@@ -696,11 +739,21 @@ def load():
   """ Initializes the module by binding all the commands."""
   modutils.load_commands(commands_dict)
 
+  for mem in exported.get_active_sessions():
+    tc = config.BoolConfig("evalexpressions", 0, 1,
+         "Whether (yes) or not (no) #if and #math expand variables and "
+         "evaluate their expressions as Python code.  Otherwise they use "
+         "the built-in expression evaluator.")
+    exported.add_config("evalexpressions", tc, mem)
+
 
 def unload():
   """ Unloads the module by calling any unload/unbind functions."""
   modutils.unload_commands(commands_dict.keys())
 
+  for mem in exported.get_active_sessions():
+    exported.remove_config("evalexpressions", mem)
+
 # Local variables:
 # mode:python
 # py-indent-offset:2
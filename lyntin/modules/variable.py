@@ -76,9 +76,11 @@ class VariableManager(manager.Manager):
     import os
     if os.environ.has_key("HOME"):
       session.Session.global_vars["HOME"] = os.environ["HOME"]
+    session.Session.global_expander = None
 
   def clear(self, ses):
     ses._vars = {}
+    ses.resetVariableExpanders()
 
   def addVariable(self, ses, var, expansion):
     ses.setVariable(var, expansion)
@@ -124,13 +126,13 @@ class VariableManager(manager.Manager):
     return resolver
 
   def expand(self, ses, text):
-    t = utils.expand_vars(text, session.Session.global_vars)
-    t = utils.expand_vars(t, ses._vars)
-    return utils.denest_vars(t, {})
+    return utils.denest_vars(self.expand_command(ses, text), {})
 
   def expand_command(self, ses, text):
-    t = utils.expand_vars(text, session.Session.global_vars)
-    return utils.expand_vars(t, ses._vars)
+    if not ("%" in text or "$" in text):
+      return text
+    globalexp, sesexp = ses.getVariableExpanders()
+    return sesexp.expand(globalexp.expand(text))
 
   def getInfo(self, ses, text=""):
     data = ses._vars.keys()
@@ -166,6 +168,7 @@ class VariableManager(manager.Manager):
     if basesession:
       for mem in basesession._vars.keys():
         newsession._vars[mem] = basesession._vars[mem]
+      newsession.resetVariableExpanders()
 
   def persist(self, args):
     """
@@ -194,6 +197,23 @@ class VariableManager(manager.Manager):
 
     return utils.denest_vars(text, ses._vars)
 
+  def expandsOwnVariables(self, text):
+    """
+    Returns whether the text is a command that asked (with the
+    noexpansion arg option) to look up variables itself.
+    """
+    commandchar = exported.get_config_snapshot().commandchar
+    if len(text) < 2 or not text.startswith(commandchar):
+      return 0
+
+    cm = exported.get_manager("command")
+    name = cm.findCommand(text[1:].split(" ", 1)[0])
+    if name == None:
+      return 0
+
+    ap = cm.getArgParser(name)
+    return ap != None and ap.getOption("noexpansion") == 1
+
   def userfilter(self, args):
     """
     user_filter_hook for handling incoming user data.
@@ -203,7 +223,7 @@ class VariableManager(manager.Manager):
     verbatim = args["verbatim"]
     text = args["dataadj"]
 
-    if verbatim == 1:
+    if verbatim == 1 or self.expandsOwnVariables(text):
       return text
 
     varexpansion = self.expand_command(ses, text)
@@ -497,7 +497,7 @@ class SocketCommunicator:
     if IAC in data:
       data = self.handleNego(data)
 
-    if not self._config.get("promptdetection") or data.endswith("\n"):
+    if not self._config.getSnapshot().promptdetection or data.endswith("\n"):
       event.MudEvent(self._session, data).enqueue() 
     else:
       event.SpamEvent(hookname="prompt_hook", argmap={"session": self._session, "prompt": data}).enqueue()
@@ -0,0 +1,363 @@
+#########################################################################
+# This file is part of Lyntin.
+#
+# Lyntin is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# Lyntin is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# copyright (c) Free Software Foundation 2001-2007
+#
+#########################################################################
+"""
+Holds the X{recording} file format #record writes and the
+RecordReader for reading it back.
+
+A recording keeps everything that went on in a session--the mud
+data, prompts and what the user sent--with the time it happened and
+what kind of thing it was.  The file is::
+
+  header:   "LYNREC1\\n"  start time (double)  session name length
+            (ushort)  session name
+  records:  time (double)  type (byte)  length (uint)  text
+  trailer:  index entries: time (double)  file offset (ulonglong)
+            footer: index offset (ulonglong)  index entries (uint)
+                    records (uint)  end time (double)  "LYNRIDX\\n"
+
+All numbers are little-endian.  Record times never go backwards
+(if the clock does, the record gets the previous record's time) so
+the records are sorted by time.  Every INDEX_INTERVAL-th record goes
+in the sparse time index which is written as the trailer when the
+recording is closed.  Finding the first record at or after a time
+is a binary search of the index and then a scan of at most
+INDEX_INTERVAL records.
+
+If a recording wasn't closed (Lyntin crashed, say) there's no
+trailer and the RecordReader builds the index by scanning the
+records.  A record that was only partly written is ignored.
+"""
+import struct, time, mmap, os, bisect
+
+MAGIC = "LYNREC1\n"
+INDEX_MAGIC = "LYNRIDX\n"
+
+HEADER = struct.Struct("<dH")
+RECORD = struct.Struct("<dBI")
+INDEX_ENTRY = struct.Struct("<dQ")
+FOOTER = struct.Struct("<QIId8s")
+
+# one index entry every this many records
+INDEX_INTERVAL = 256
+
+# record types
+MUD = 1
+PROMPT = 2
+USER = 3
+
+TYPE_NAMES = { MUD: "mud", PROMPT: "prompt", USER: "user" }
+
+class RecordingException(Exception):
+  pass
+
+
+class RecordWriter:
+  """
+  Writes a recording.
+  """
+  def __init__(self, fileob, sessionname, buffersize=65536):
+    """
+    Writes the header.
+
+    @param fileob: the file to write to (opened "wb") or a filename
+    @type  fileob: File or string
+
+    @param sessionname: the name of the session being recorded
+    @type  sessionname: string
+
+    @param buffersize: the buffer size to use when opening a filename
+    @type  buffersize: int
+    """
+    if isinstance(fileob, str):
+      fileob = open(fileob, "wb", buffersize)
+    self._file = fileob
+    self._name = fileob.name
+    self._start = time.time()
+    self._last = self._start
+    self._count = 0
+
+    # times and offsets of the records in the index
+    self._indextimes = []
+    self._indexoffsets = []
+
+    header = MAGIC + HEADER.pack(self._start, len(sessionname)) + sessionname
+    self._file.write(header)
+    self._offset = len(header)
+
+  def write(self, rectype, text):
+    """
+    Writes a record.
+
+    @param rectype: the record type (MUD, PROMPT or USER)
+    @type  rectype: int
+
+    @param text: the text
+    @type  text: string
+    """
+    now = time.time()
+    if now < self._last:
+      now = self._last
+    self._last = now
+
+    if self._count % INDEX_INTERVAL == 0:
+      self._indextimes.append(now)
+      self._indexoffsets.append(self._offset)
+    self._count += 1
+
+    self._file.write(RECORD.pack(now, rectype, len(text)) + text)
+    self._offset += RECORD.size + len(text)
+
+  def flush(self):
+    """
+    Flushes the records written so far to disk.
+    """
+    self._file.flush()
+
+  def close(self):
+    """
+    Writes the index and closes the file.
+    """
+    if self._file == None:
+      return
+    index = []
+    for i in range(len(self._indextimes)):
+      index.append(INDEX_ENTRY.pack(self._indextimes[i], self._indexoffsets[i]))
+    index.append(FOOTER.pack(self._offset, len(self._indextimes),
+                             self._count, self._last, INDEX_MAGIC))
+    self._file.write("".join(index))
+    self._file.close()
+    self._file = None
+
+  def getFileName(self):
+    """
+    Returns the name of the file we're writing to.
+
+    @rtype: string
+    """
+    return self._name
+
+  def getCount(self):
+    """
+    Returns the number of records written.
+
+    @rtype: int
+    """
+    return self._count
+
+  def getStatus(self):
+    """
+    Returns a one-liner describing the recording.
+
+    @rtype: string
+    """
+    return "recording to '%s': %d record(s), %d byte(s)" % \
+           (self._name, self._count, self._offset)
+
+
+class RecordReader:
+  """
+  Reads a recording.  Records are (time, type, text) tuples.
+  """
+  def __init__(self, filename):
+    """
+    Opens the recording and reads (or builds) its index.
+
+    @param filename: the recording to read
+    @type  filename: string
+
+    @raise RecordingException: if the file isn't a recording
+    """
+    self._file = open(filename, "rb")
+    size = os.fstat(self._file.fileno()).st_size
+    if size < len(MAGIC) + HEADER.size:
+      self._file.close()
+      raise RecordingException("%s is not a recording" % filename)
+    self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    if self._map[:len(MAGIC)] != MAGIC:
+      self.close()
+      raise RecordingException("%s is not a recording" % filename)
+    self._start, namelength = HEADER.unpack_from(self._map, len(MAGIC))
+    pos = len(MAGIC) + HEADER.size
+    self._session = self._map[pos:pos + namelength]
+    self._first = pos + namelength
+
+    self._indextimes = []
+    self._indexoffsets = []
+    if not self._readIndex(size):
+      self._buildIndex(size)
+
+  def _readIndex(self, size):
+    if size < self._first + FOOTER.size:
+      return 0
+    indexoffset, entries, count, end, magic = \
+        FOOTER.unpack_from(self._map, size - FOOTER.size)
+    if magic != INDEX_MAGIC or \
+       indexoffset + entries * INDEX_ENTRY.size + FOOTER.size != size:
+      return 0
+
+    for i in range(entries):
+      t, offset = INDEX_ENTRY.unpack_from(self._map,
+                                          indexoffset + i * INDEX_ENTRY.size)
+      self._indextimes.append(t)
+      self._indexoffsets.append(offset)
+    self._end = indexoffset
+    self._count = count
+    self._endtime = end
+    return 1
+
+  def _buildIndex(self, size):
+    count = 0
+    endtime = self._start
+    pos = self._first
+    while pos + RECORD.size <= size:
+      t, rectype, length = RECORD.unpack_from(self._map, pos)
+      if pos + RECORD.size + length > size:
+        break
+      if count % INDEX_INTERVAL == 0:
+        self._indextimes.append(t)
+        self._indexoffsets.append(pos)
+      count += 1
+      endtime = t
+      pos += RECORD.size + length
+
+    self._end = pos
+    self._count = count
+    self._endtime = endtime
+
+  def close(self):
+    """
+    Closes the recording.
+    """
+    self._map.close()
+    self._file.close()
+
+  def __len__(self):
+    return self._count
+
+  def __iter__(self):
+    return self.records()
+
+  def getSessionName(self):
+    """
+    Returns the name of the session that was recorded.
+
+    @rtype: string
+    """
+    return self._session
+
+  def getStartTime(self):
+    """
+    Returns the time the recording was started.
+
+    @rtype: float
+    """
+    return self._start
+
+  def getEndTime(self):
+    """
+    Returns the time of the last record (or the start time if there
+    aren't any records).
+
+    @rtype: float
+    """
+    return self._endtime
+
+  def seek(self, timestamp):
+    """
+    Finds the first record at or after a time.
+
+    @param timestamp: the time (seconds since the epoch)
+    @type  timestamp: float
+
+    @return: the file offset of the record (which can be handed to
+        records) or the offset of the end of the records if there
+        isn't one
+    @rtype: int
+    """
+    i = bisect.bisect_left(self._indextimes, timestamp) - 1
+    if i < 0:
+      return self._first
+
+    # the record at index i is before timestamp and the record at
+    # index i+1 (if any) is at or after it
+    pos = self._indexoffsets[i]
+    while pos < self._end:
+      t, rectype, length = RECORD.unpack_from(self._map, pos)
+      if t >= timestamp:
+        break
+      pos += RECORD.size + length
+    return pos
+
+  def records(self, since=None, until=None, types=None, offset=None):
+    """
+    Returns an iterator over the records in order.
+
+    @param since: only records at or after this time
+    @type  since: float
+
+    @param until: only records before this time
+    @type  until: float
+
+    @param types: only records of these types
+    @type  types: list of ints
+
+    @param offset: start at this file offset (from seek)
+    @type  offset: int
+
+    @return: iterator of (time, type, text) tuples
+    @rtype: iterator
+    """
+    if offset != None:
+      pos = offset
+    elif since != None:
+      pos = self.seek(since)
+    else:
+      pos = self._first
+
+    m = self._map
+    end = self._end
+    unpack = RECORD.unpack_from
+    size = RECORD.size
+    while pos < end:
+      t, rectype, length = unpack(m, pos)
+      if until != None and t >= until:
+        return
+      pos += size
+      if types == None or rectype in types:
+        yield (t, rectype, m[pos:pos + length])
+      pos += length
+
+  def getStatus(self):
+    """
+    Returns a one-liner describing the recording.
+
+    @rtype: string
+    """
+    return "recording of session %s: %d record(s) from %s to %s" % \
+           (self._session, self._count,
+            time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self._start)),
+            time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self._endtime)))
+
+# Local variables:
+# mode:python
+# py-indent-offset:2
+# tab-width:2
+# End:
@@ -103,9 +103,14 @@ X{mud_filter_hook}::
    data - the original raw data from the mud
 
    dataadj - the latest adjusted data from the mud
+
+   The argmap also carries a "linecache" which holds the ^M and ansi
+   filtered forms of the dataadj.  Don't touch it directly--use
+   utils.filter_line_cm and utils.filter_line_ansi which compute
+   those forms once per line and share them between the filters.
 """
 import re, copy, string, os
-from lyntin import exported, utils, ansi, config, event
+from lyntin import exported, utils, ansi, config, event, databuffer
 
 ESC = chr(27)
 
@@ -119,6 +124,9 @@ class Session:
   """
   global_vars = {}
 
+  # compiled expander for global_vars--rebuilt when the names change
+  global_expander = None
+
   def __init__(self, engine_instance):
     """
     Initialize.
@@ -130,14 +138,20 @@ class Session:
     self._port = 0
     self._colorbuffer = ''
 
-    self._databuffer = []
-    self._databuffersize = 10000
+    self._databuffer = databuffer.DataBuffer()
+
+    # while a batch is open writeSocket collects the messages here and
+    # they go to the socket in one write when the batch is ended
+    self._batch = None
+    self._batchdepth = 0
 
     # register with the shutdown hook 
     self._engine.hookRegister("shutdown_hook", self.shutdown)
+    self._engine.hookRegister("config_change_hook", self._configChange)
 
     # session variables
     self._vars = {}
+    self._expander = None
 
   def __repr__(self):
     return "session.Session %s" % self._name
@@ -159,6 +173,38 @@ class Session:
           "straight to the mud without massaging it.")
     c.add("verbatim", tc, self)
 
+    tc = config.IntConfig("databuffersize", 10000, 0,
+          "The number of lines of mud data each session keeps in its "
+          "scrollback (which #grep searches).")
+    c.add("databuffersize", tc, self)
+
+    tc = config.IntConfig("databufferbytes", 0, 0,
+          "The number of bytes of mud data each session keeps in its "
+          "scrollback or 0 for no limit.  The oldest lines are dropped "
+          "when either this or databuffersize is reached.")
+    c.add("databufferbytes", tc, self)
+
+    tc = config.BoolConfig("databufferspill", 0, 0,
+          "Whether lines that get dropped from the scrollback are written "
+          "to a compressed file so that #grep can still search them.  The "
+          "file goes in the datadir and is removed when Lyntin exits.")
+    c.add("databufferspill", tc, self)
+
+  def _configChange(self, args):
+    """
+    config_change_hook function that applies the databuffer limits
+    when they change for this session.
+    """
+    if args["session"] != self:
+      return
+
+    if args["name"] == "databuffersize":
+      self.resizeDataBuffer(args["newvalue"])
+    elif args["name"] == "databufferbytes":
+      self.resizeDataBuffer(self._databuffer.getLimits()[0], args["newvalue"])
+    elif args["name"] == "databufferspill":
+      self.setDataBufferSpill(args["newvalue"])
+
   def getName(self):
     """
     Returns the name of the session.
@@ -217,6 +263,7 @@ class Session:
     
     data.append("Session name: %s" % self._name)
     data.append("   socket: %s" % repr(self._socket))
+    data.append("   databuffer: %s" % self._databuffer.getStatus())
 
     return data
 
@@ -229,7 +276,7 @@ class Session:
     for mem in self._engine._managers.values():
       mem.clear(self)
 
-    self._databuffer = []
+    self._databuffer.clear()
 
 
   ### ------------------------------------------------
@@ -278,6 +325,13 @@ class Session:
     for line in message.strip().split("\n"):
       exported.hook_spam("to_mud_hook", {"session": self, "data": line, "tag": tag})
 
+    if self._batch != None:
+      self._batch.append(message)
+      return
+
+    self._write(message)
+
+  def _write(self, message):
     if self._socket:
       retval = self._socket.write(str(message))
       if retval:
@@ -289,17 +343,61 @@ class Session:
       exported.write_error("No connection.  Create a session.\n(See also: #help, #help session)")
       return
 
+  def startBatch(self):
+    """
+    Starts a batch.  Until the batch is ended, writeSocket still
+    spams the to_mud_hook for every line but keeps the messages and
+    they're sent to the mud in one write by endBatch.  Batches nest--
+    only ending the outermost one writes.
+    """
+    self._batchdepth += 1
+    if self._batch == None:
+      self._batch = []
+
+  def endBatch(self):
+    """
+    Ends a batch started with startBatch and if it's the outermost
+    one, sends everything written during it to the mud.
+    """
+    self._batchdepth -= 1
+    if self._batchdepth > 0:
+      return
+
+    batch = self._batch
+    self._batch = None
+    if batch:
+      self._write("".join(batch))
+
+  def getBatch(self):
+    """
+    Returns the messages written to the socket so far in the current
+    batch.
+
+    @returns: the messages or None if there's no batch
+    @rtype: list of strings
+    """
+    return self._batch
+
 
   ### ------------------------------------------------
   ### Data buffer stuff
   ### ------------------------------------------------
   def getDataBuffer(self):
     """
-    Returns the DataBuffer instance for this session.
+    Returns the lines in the data buffer for this session.
 
     @returns: list of strings
     @rtype: list of strings
     """
+    return self._databuffer.getLines()
+
+  def getScrollback(self):
+    """
+    Returns the DataBuffer instance for this session.
+
+    @returns: the data buffer
+    @rtype: databuffer.DataBuffer
+    """
     return self._databuffer
 
   def addToDataBuffer(self, text):
@@ -311,31 +409,57 @@ class Session:
     @type  text: string
     """
     text = ansi.filter_ansi(utils.filter_cm(text))
-    lines = text.splitlines(1)
+    self._appendToDataBuffer(text.splitlines(1))
 
-    for mem in lines:
-      if len(self._databuffer) == 0 or self._databuffer[-1].endswith("\n"):
-        self._databuffer.append(mem)
-      else:
-        self._databuffer[-1] += mem
+  def _appendToDataBuffer(self, lines):
+    """
+    Adds lines that have already been filtered of ^M and ansi color
+    codes to the buffer.  The last line in the buffer gets extended
+    if it was a partial line.
 
-    if len(self._databuffer) > self._databuffersize:
-      self._databuffer[:-self._databuffersize] = []
+    @param lines: the filtered lines to add to the buffer
+    @type  lines: list of strings
+    """
+    self._databuffer.append(lines)
 
   def clearDataBuffer(self):
     """ 
     Clears the databuffer.
     """
-    self._databuffer = []
+    self._databuffer.clear()
   
-  def resizeDataBuffer(self, newsize=10000):
+  def setDataBufferSpill(self, spill):
+    """
+    Turns on or off writing lines that get dropped from the data
+    buffer to a temporary file.  The file is removed when it's 
+    closed so turning this off throws away the lines in it.
+
+    @param spill: 1 to spill lines to a file, 0 to drop them
+    @type  spill: boolean
+    """
+    buffer = self._databuffer
+    if spill and buffer.getSpillFile() == None:
+      import tempfile
+      datadir = config.options["datadir"]
+      if not datadir or not os.path.isdir(datadir):
+        datadir = None
+      buffer.setSpillFile(tempfile.TemporaryFile(prefix="lyntin-scrollback-", 
+                                                 dir=datadir))
+    elif not spill and buffer.getSpillFile() != None:
+      buffer.setSpillFile(None)
+
+  def resizeDataBuffer(self, newsize=10000, maxbytes=None):
     """ 
     Changes the buffer max.
 
-    @param newsize: the new buffer max size
+    @param newsize: the new buffer max size in lines
     @type  newsize: int
+
+    @param maxbytes: the new buffer max size in bytes (0 for no limit)
+        or None to leave it alone
+    @type  maxbytes: int
     """
-    self._databuffersize = newsize
+    self._databuffer.resize(newsize, maxbytes)
 
 
   ### ------------------------------------------------
@@ -367,6 +491,8 @@ class Session:
       d = self._vars
 
     oldvalue = d.get(var, None)
+    if not d.has_key(var):
+      self.resetVariableExpanders()
     d[var] = expansion
 
     self._varChangeHook(var, oldvalue, expansion)
@@ -387,6 +513,7 @@ class Session:
     if d.has_key(var):
       oldvalue = d[var]
       del d[var]
+      self.resetVariableExpanders()
       self._varChangeHook(var, oldvalue, None)
 
   def getVariable(self, var, default=None):
@@ -397,6 +524,47 @@ class Session:
 
     return d.get(var, default)
 
+  def lookupVariable(self, var):
+    """
+    Returns the value $var would expand to: global variables (which
+    include $TIMESTAMP and friends) first and then this session's
+    variables.
+
+    @param var: the variable name
+    @type  var: string
+
+    @return: the value of the variable or None if there isn't one
+    @rtype: string (or a class with a __str__ method)
+    """
+    value = Session.global_vars.get(var)
+    if value == None:
+      value = self._vars.get(var)
+    return value
+
+  def getVariableExpanders(self):
+    """
+    Returns the compiled expanders for the global variables and for
+    this session's variables.  They're built the first time they're
+    asked for after the set of variable names changes.
+
+    @returns: the global and session variable expanders
+    @rtype: tuple of (utils.VariableExpander, utils.VariableExpander)
+    """
+    if Session.global_expander == None:
+      Session.global_expander = utils.VariableExpander(Session.global_vars)
+    if self._expander == None:
+      self._expander = utils.VariableExpander(self._vars)
+    return (Session.global_expander, self._expander)
+
+  def resetVariableExpanders(self):
+    """
+    Throws away the compiled variable expanders.  Anything that adds
+    or removes variables without going through setVariable and
+    removeVariable needs to call this.
+    """
+    Session.global_expander = None
+    self._expander = None
+
   ### ------------------------------------------------
   ### User input functions
   ### ------------------------------------------------
@@ -422,7 +590,7 @@ class Session:
     # this is the point of much recursion.  everything is registered
     # as a filter and recurses accordingly.
     spamargs = {"session": self, "internal": internal, 
-                "verbatim": exported.get_config("verbatim", self), 
+                "verbatim": exported.get_config_snapshot(self).verbatim, 
                 "data": input, "dataadj": input}
     spamargs = exported.filter_mapper_hook_spam("user_filter_hook", spamargs)
 
@@ -464,19 +632,18 @@ class Session:
       self._colorbuffer = input[index:]
       input = input[:index]
 
-    # we add the new input to the databuffer
-    self.addToDataBuffer(input)
-
     # we split the input into a series of lines and operate on
     # those
     inputlines = input.splitlines(1)
+    arglist = [{"session": self, "data": mem, "dataadj": mem} for mem in inputlines]
+
+    # we add the new input to the databuffer--the filtered lines
+    # stay cached on the argmaps for the filters to use
+    self._appendToDataBuffer([utils.filter_line_ansi(m) for m in arglist])
 
     for i in range(0, len(inputlines)):
-      mem = inputlines[i]
       # call the pre-filter hook
-      spamargs = {"session": self, "data": mem, "dataadj": mem}
-
-      spamargs = exported.filter_mapper_hook_spam("mud_filter_hook", spamargs)
+      spamargs = exported.filter_mapper_hook_spam("mud_filter_hook", arglist[i])
       if spamargs != None:
         mem = spamargs["dataadj"]
       else:
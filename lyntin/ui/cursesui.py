@@ -45,9 +45,11 @@ earlier MUD output.
 The keys are:
 - Left, Right, Home, End, C-E, C-A, C-B, C-F - to navigate in input line;
 - C-U - kill input line contents;
-- Up, Down - history navigation;
+- Up, Down - history navigation (through lines starting with what's typed);
 - C-L - force screen to redraw;
-- PageUp, PageDown - scroll back ang forth in history window;
+- PageUp, PageDown - scroll back ang forth in history window; scrolling
+  back past the oldest line the window has pages in older lines from the
+  current session's data buffer (including lines it has spilled to disk);
 - Escape - shut the scrollback window if opened (double escape will do also).
 
 You can configure several cursesui parameters with "config" lyntin command;
@@ -258,17 +260,34 @@ def get_ui_instance():
   return myui
 
 
+# number of lines paged in from the data buffer at a time when the
+# scrollback window goes past the lines it has
+PAGE_LINES = 500
+
 # 
 # Window-like object that can "scroll"
 #
 class scroller:
-  def __init__(self, window, lines):
+  def __init__(self, window, lines, older=None):
+    #
+    # older, if given, is called for the lines before the first of
+    # lines when scrolling goes past it--it returns [] when there
+    # aren't any more.
+    #
     self.window_ = window
     self.lines_ = lines
+    self.older_ = older
     (self.h_, self.w_) = window.getmaxyx()
     self._set_startline(1000000)
     
   def _set_startline(self, startline):
+    while startline < 0 and self.older_:
+      more = self.older_()
+      if not more:
+        self.older_ = None
+        break
+      self.lines_[0:0] = more
+      startline += len(more)
     self.startline_ = max(0, min( len(self.lines_)-self.h_, startline))
    
   def redraw(self, scroll=0, **kargs):
@@ -420,8 +439,7 @@ class inputbox:
       # search the history back
       #
       if not self.history_:
-        self.history_ = filter( lambda x: x.find(self.string_) != -1,
-                                exported.get_history(1000) )
+        self.history_ = exported.find_history(self.string_, 1000)
       if self.history_:
         found = self.history_[0]
         self.history_[0:1] = []
@@ -482,6 +500,10 @@ class Cursesui(base.BaseUI):
     self.lines_ = [ self.prompt_ ]
     self.prompt_index_ = 0
 
+    # the time each of lines_ was added--the scrollback window uses
+    # the oldest to find where to start paging in the data buffer
+    self.times_ = [ time() ]
+
     self.running_ = 1
 
     self.cfg_lazy_ = exported.get_config("curses.lazy")
@@ -537,13 +559,35 @@ class Cursesui(base.BaseUI):
     #
     lines = self.lines_
     lines.append(line)
+    self.times_.append(time())
     llen = len(lines) - self.cfg_maxscrollback_
     if llen > 0:
       lines[0:llen] = []
+      self.times_[0:llen] = []
       self.prompt_index_ -= llen
     os.write(self.output_[1], '0') 
       
     
+  def _scrollback_pager(self):
+    #
+    # Returns a function that pages in the current session's data
+    # buffer (a PAGE_LINES chunk at a time, going back) from the lines
+    # that came before the oldest line we've got.
+    #
+    ses = exported.get_current_session()
+    buffer = ses.getScrollback()
+    state = [ buffer.getLineNumberAt(self.times_[0]) ]
+
+    def older():
+      end = state[0]
+      start = max(buffer.getOldestLineNumber(), end - PAGE_LINES)
+      if start >= end:
+        return []
+      state[0] = start
+      return [ [ (line, curses.A_NORMAL) ] 
+               for line in buffer.getLines(start, end) ]
+    return older
+
   def _decode_colors(self, ses, default_attr, line, pretext=[]):
     if self.unfinished_.has_key(ses):
       (currentcolor, leftover) = self.unfinished_[ses]
@@ -591,6 +635,7 @@ class Cursesui(base.BaseUI):
               # Remove the identical prompt from previous output buffer:
               #
               lines[self.prompt_index_:self.prompt_index_+1] = []
+              self.times_[self.prompt_index_:self.prompt_index_+1] = []
             else:
               self.prompt_ = current
             self.prompt_index_ = len(lines)
@@ -706,7 +751,7 @@ class Cursesui(base.BaseUI):
             scroll_h = screen_h/3*2
             out_h = (screen_h - 2) - scroll_h 
             scrollback = scroller(curses.newwin(scroll_h, screen_w, 0, 0),
-                                  lines[:])
+                                  lines[:], self._scrollback_pager())
             scrollback.redraw()
             wborder = curses.newwin(1, screen_w, scroll_h, 0)
             wborder.bkgd(curses.ACS_HLINE)
@@ -30,7 +30,10 @@ import ansi, constants
 SPLIT = ";"
 SPLIT_REGEXP = re.compile(r'(?<!\\);')
 
-TIMESPAN_REGEXP = re.compile(r"^(?P<days>\d+d)?(?P<hours>\d+h)?(?P<minutes>\d+m)?(?P<seconds>\d+s?)?$")
+# for walking through the split points and braces in one go
+SPLIT_TOKEN_REGEXP = re.compile(r'(?<!\\)(?:(;)|[{}])')
+
+TIMESPAN_REGEXP = re.compile(r"^(?P<days>\d+d)?(?P<hours>\d+h)?(?P<minutes>\d+m(?!s))?(?P<seconds>\d+(\.\d+)?(s|$))?(?P<milliseconds>\d+(\.\d+)?ms)?$")
 TIME_REGEXP1=re.compile(r"^(?P<hour>[1-9]|1[0-2])(?P<ampm>a|p)$")
 TIME_REGEXP2=re.compile(r"^(?P<hour>[1-9]|1[0-2]):(?P<minute>[0-5][0-9])(:(?P<second>[0-5]\d))?(?P<ampm>a|p)?$")
 TIME_REGEXP3=re.compile(r"^(?P<hour>0|1[3-9]|2[0-3]):(?P<minute>[0-5][0-9])(:(?P<second>[0-5]\d))?$")
@@ -93,6 +96,22 @@ class PriorityQueue:
 
     self._dirty = 1
 
+  def getPriorities(self):
+    """
+    Returns the functions with their priorities in call order.
+
+    @return: list of (priority, function) tuples
+    @rtype: list of (int, function)
+    """
+    priorities = self._prioritymap.keys()
+    priorities.sort()
+
+    ret = []
+    for priority in priorities:
+      for mem in self._prioritymap[priority]:
+        ret.append((priority, mem))
+    return ret
+
   def remove(self, func):
     """
     Removes a func from the priority map.
@@ -139,6 +158,63 @@ def filter_cm(text):
   return text.replace("\r", "")
 
 
+def _line_cache(argmap):
+  """
+  Returns the cache of stripped forms of argmap["dataadj"] held on
+  the argmap, starting a fresh one if a filter has changed dataadj
+  since the cache was built.
+
+  @param argmap: the filter hook argmap
+  @type  argmap: dict
+
+  @returns: list of [dataadj, cm-filtered text, ansi-filtered text]
+      where the filtered forms are None until someone asks for them
+  @rtype: list
+  """
+  text = argmap["dataadj"]
+  cache = argmap.get("linecache")
+  if cache == None or cache[0] is not text:
+    cache = [text, None, None]
+    argmap["linecache"] = cache
+  return cache
+
+def filter_line_cm(argmap):
+  """
+  Returns the dataadj of a mud_filter_hook argmap with ^M filtered
+  out.  The result is computed once per line and shared by all the
+  filters on the hook until one of them changes the dataadj.
+
+  @param argmap: the filter hook argmap
+  @type  argmap: dict
+
+  @returns: dataadj without ^M stuff
+  @rtype: string
+  """
+  cache = _line_cache(argmap)
+  if cache[1] == None:
+    cache[1] = filter_cm(cache[0])
+  return cache[1]
+
+def filter_line_ansi(argmap):
+  """
+  Returns the dataadj of a mud_filter_hook argmap with ^M and ansi
+  color codes filtered out.  Like filter_line_cm, this is computed
+  once per line and shared.
+
+  @param argmap: the filter hook argmap
+  @type  argmap: dict
+
+  @returns: dataadj without ^M stuff and ansi color codes
+  @rtype: string
+  """
+  cache = _line_cache(argmap)
+  if cache[2] == None:
+    if cache[1] == None:
+      cache[1] = filter_cm(cache[0])
+    cache[2] = ansi.filter_ansi(cache[1])
+  return cache[2]
+
+
 CHOMP_EOL = re.compile("[\r\n]+$")
 
 def chomp(text):
@@ -326,6 +402,215 @@ def compile_regexp(text, anchors=0, stars=0):
   return re.compile("".join(pieces), flags_bitmask)
 
 
+# patterns with these in them can't be folded into an alternation
+# with other patterns: back references and conditionals count groups,
+# group names can't be used twice and inline flags apply to the whole
+# regular expression.
+UNCOMBINABLE_REGEXP = re.compile(r"\\[1-9]|\(\?P[=<]|\(\?\(|\(\?[iLmsux]+\)")
+
+# matches patterns that are plain (escaped) text--what compile_regexp
+# builds for gags and such that don't have wildcards in them
+LITERAL_REGEXP = re.compile(r"^\^?(?:\\[^0-9A-Za-z]|[^\\.^$*+?{}\[\]|()])*$")
+UNESCAPE_REGEXP = re.compile(r"\\(.)", re.DOTALL)
+
+# python's re module only handles 100 groups in a regular expression
+MAX_GROUPS = 99
+
+class RegexpSet:
+  """
+  Holds a series of compiled regular expressions folded into as few 
+  regular expressions as we can manage so that checking a line 
+  against all of them takes a search or two rather than one search 
+  per regular expression.
+
+  Plain text patterns (with or without a ^ anchor) are folded into
+  a trie-shaped regular expression which the re module can run through
+  in one pass no matter how many patterns there are.  Everything else
+  goes into alternations.
+
+  The set is built once--when the regular expressions change, build
+  a new one.
+  """
+  def __init__(self, items):
+    """
+    Initialize.
+
+    @param items: the (key, compiled regexp) pairs to combine.  on a
+        search the key of a regexp that matched gets returned.
+    @type  items: list of (anything, Re)
+    """
+    self._matchers = []
+
+    literals = {}
+    anchored = {}
+    others = []
+    for (key, compiled) in items:
+      pattern = compiled.pattern
+      if compiled.flags == 0 and LITERAL_REGEXP.match(pattern):
+        if pattern.startswith("^"):
+          anchored[UNESCAPE_REGEXP.sub(r"\1", pattern[1:])] = key
+        else:
+          literals[UNESCAPE_REGEXP.sub(r"\1", pattern)] = key
+      else:
+        others.append((key, compiled))
+
+    if literals:
+      self._matchers.append((re.compile(trie_regexp(literals.keys())), literals, None))
+    if anchored:
+      self._matchers.append((re.compile("^" + trie_regexp(anchored.keys())), anchored, None))
+
+    pieces = []
+    keys = {}
+    groups = 0
+    flags = None
+    for (key, compiled) in others:
+      pattern = compiled.pattern
+      if UNCOMBINABLE_REGEXP.search(pattern) or compiled.groups >= MAX_GROUPS:
+        self._addMatcher(pieces, keys, flags)
+        pieces, keys, groups = [], {}, 0
+        self._matchers.append((compiled, None, key))
+        continue
+
+      if flags != compiled.flags or groups + compiled.groups + 1 > MAX_GROUPS:
+        self._addMatcher(pieces, keys, flags)
+        pieces, keys, groups = [], {}, 0
+        flags = compiled.flags
+
+      keys[groups + 1] = key
+      pieces.append("(" + pattern + ")")
+      groups = groups + compiled.groups + 1
+
+    self._addMatcher(pieces, keys, flags)
+
+  def _addMatcher(self, pieces, keys, flags):
+    if pieces:
+      self._matchers.append((re.compile("|".join(pieces), flags), keys, 0))
+
+  def search(self, text):
+    """
+    Searches the text with all the regular expressions in the set.
+
+    @param text: the text to search
+    @type  text: string
+
+    @returns: the key of a regular expression that matched or None
+        if nothing matched
+    @rtype: anything
+    """
+    for (compiled, keys, key) in self._matchers:
+      match = compiled.search(text)
+      if match:
+        return self._getKey(keys, key, match)
+    return None
+
+  def findAll(self, text):
+    """
+    Finds all the non-overlapping matches of the regular expressions
+    in the set going left to right.  When more than one matches at the
+    same place, plain text (longest first) beats ^ anchored plain text
+    which beats the other regular expressions, which go in the order 
+    they were given.  Empty matches are skipped.
+
+    @param text: the text to search
+    @type  text: string
+
+    @returns: list of (key, begin, end) of the matches
+    @rtype: list of (anything, int, int)
+    """
+    # we hold on to the next match of every matcher and only search
+    # again when a match we picked runs over it
+    matches = [m[0].search(text) for m in self._matchers]
+    ret = []
+    pos = 0
+    length = len(text)
+    while pos <= length:
+      best = None
+      for i in range(len(matches)):
+        match = matches[i]
+        if match != None and match.start() < pos:
+          match = self._matchers[i][0].search(text, pos)
+          matches[i] = match
+        if match != None and (best == None or match.start() < best[1].start()):
+          best = (i, match)
+
+      if best == None:
+        break
+
+      (i, match) = best
+      begin, end = match.span()
+      if begin == end:
+        pos = begin + 1
+        continue
+
+      (compiled, keys, key) = self._matchers[i]
+      ret.append((self._getKey(keys, key, match), begin, end))
+      pos = end
+
+    return ret
+
+  def _getKey(self, keys, key, match):
+    if keys == None:
+      # a regexp we couldn't combine
+      return key
+    if key == None:
+      # a trie of plain text--the match is the text
+      return keys[match.group(0)]
+    return keys[match.lastindex]
+
+def get_literal(compiled):
+  """
+  If a compiled regular expression only matches a plain piece of text
+  (no wildcards, anchors or flags), returns that text.  This lets us
+  use string methods rather than the regular expression where it's
+  faster.
+
+  @param compiled: the compiled regular expression
+  @type  compiled: Re
+
+  @returns: the plain text or None if the regular expression isn't
+      plain text
+  @rtype: string
+  """
+  pattern = compiled.pattern
+  if compiled.flags != 0 or pattern.startswith("^") or \
+     not LITERAL_REGEXP.match(pattern):
+    return None
+  return UNESCAPE_REGEXP.sub(r"\1", pattern)
+
+def trie_regexp(strings):
+  """
+  Builds a regular expression that matches any of the given strings
+  with the alternations nested by common prefix.  ("abc", "abd" and
+  "b" become "(?:ab(?:c|d)|b)".)
+
+  @param strings: the strings to match
+  @type  strings: list of strings
+
+  @returns: the regular expression
+  @rtype: string
+  """
+  trie = {}
+  for mem in strings:
+    node = trie
+    for c in mem:
+      node = node.setdefault(c, {})
+    node[""] = None
+  return _trie_node_regexp(trie)
+
+def _trie_node_regexp(node):
+  keys = [m for m in node.keys() if m]
+  keys.sort()
+  alts = [re.escape(c) + _trie_node_regexp(node[c]) for c in keys]
+
+  if not alts:
+    return ""
+  if len(alts) == 1 and not node.has_key(""):
+    return alts[0]
+  if node.has_key(""):
+    return "(?:" + "|".join(alts) + ")?"
+  return "(?:" + "|".join(alts) + ")"
+
+
 def expand_text(filter, fulllist):
   """
   Returns a subset of the list that matches the given string.
@@ -367,13 +652,110 @@ def expand_text(filter, fulllist):
 
   return ret
 
+class LRUCache:
+  """
+  A dict-like cache that holds on to at most size items and throws
+  away the least recently used one when it's full.  It keeps track
+  of hits and misses so we can tell how much good it's doing.
+
+  Entries are kept in a circular doubly linked list of
+  [prev, next, key, value] nodes with the most recently used entry
+  right after the root node.
+  """
+  def __init__(self, size=500):
+    """
+    @param size: the maximum number of items to hold on to
+    @type  size: int
+    """
+    self._size = size
+    self._map = {}
+    self._root = root = [None, None, None, None]
+    root[0] = root[1] = root
+    self.hits = 0
+    self.misses = 0
+
+  def __len__(self):
+    return len(self._map)
+
+  def get(self, key, default=None):
+    """
+    Returns the value for key (marking it as recently used) or
+    default if we don't have it.
+    """
+    node = self._map.get(key)
+    if node == None:
+      self.misses += 1
+      return default
+
+    self.hits += 1
+    root = self._root
+    if root[1] is not node:
+      node[0][1] = node[1]
+      node[1][0] = node[0]
+      node[0] = root
+      node[1] = root[1]
+      root[1][0] = node
+      root[1] = node
+    return node[3]
+
+  def put(self, key, value):
+    """
+    Adds key to the cache, throwing away the least recently used
+    item if the cache is full.
+    """
+    root = self._root
+    node = self._map.get(key)
+    if node != None:
+      node[0][1] = node[1]
+      node[1][0] = node[0]
+    elif len(self._map) >= self._size:
+      last = root[0]
+      last[0][1] = root
+      root[0] = last[0]
+      del self._map[last[2]]
+
+    node = [root, root[1], key, value]
+    root[1][0] = node
+    root[1] = node
+    self._map[key] = node
+
+  def clear(self):
+    """
+    Removes everything from the cache.  The hit and miss counts are
+    kept.
+    """
+    self._map.clear()
+    root = self._root
+    root[0] = root[1] = root
+
+  def getStatus(self):
+    """
+    Returns a one liner describing how full the cache is and how
+    often lookups find something.
+
+    @returns: the status of the cache
+    @rtype: string
+    """
+    lookups = self.hits + self.misses
+    if lookups:
+      rate = self.hits * 100.0 / lookups
+    else:
+      rate = 0.0
+    return "%d/%d entries, %d hits, %d misses (%.1f%% hit rate)" % \
+           (len(self._map), self._size, self.hits, self.misses, rate)
+
+# split_commands results keyed on (splitchar, text)
+split_cache = LRUCache(500)
+
 def __change_command_split(newsplit):
-  global SPLIT, SPLIT_REGEXP
+  global SPLIT, SPLIT_REGEXP, SPLIT_TOKEN_REGEXP
 
   if not newsplit:
     SPLIT_REGEXP = None
+    SPLIT_TOKEN_REGEXP = None
   else:
     SPLIT_REGEXP = re.compile(r'(?<!\\)' + re.escape(newsplit))
+    SPLIT_TOKEN_REGEXP = re.compile(r'(?<!\\)(?:(' + re.escape(newsplit) + r')|[{}])')
 
   SPLIT = newsplit
 
@@ -389,6 +771,9 @@ def split_commands(splitchar, text):
   If SPLIT_REGEXP is empty string or None, then this doesn't split the
   command.
 
+  Results are kept in split_cache since the same action responses
+  and alias expansions get split over and over again.
+
   @param text: the text to split
   @type  text: string
 
@@ -403,32 +788,29 @@ def split_commands(splitchar, text):
   if not SPLIT_REGEXP:
     return [text]
 
+  ret = split_cache.get((splitchar, text))
+  if ret != None:
+    return list(ret)
+
+  # we walk through the unescaped split points and braces once keeping
+  # track of how deep in braces we are--a split point only counts if
+  # the braces since the last split point are balanced.
   marker = 0
+  depth = 0
   ret = []
 
-  matchob = SPLIT_REGEXP.search(text)
-  while (matchob):
-    (b, e) = matchob.span()
-    # we count braces--this is a bit interesting since if the entire 
-    # segment we're looking at doesn't have a full set of matched 
-    # braces, we ignore this semi-colon as a split point.
-    left = 0
-    right = 0
-    for i in range(marker, b):
-      if text[i] == '{' and (i == 0 or text[i-1] != "\\"):
-        left += 1
-      if text[i] == '}' and (i == 0 or text[i-1] != "\\"):
-        right += 1 
-
-    count = left - right
-
-    if count == 0:
-      ret.append(text[marker:b])
-      marker = e
-
-    matchob = SPLIT_REGEXP.search(text, e)
+  for matchob in SPLIT_TOKEN_REGEXP.finditer(text):
+    if matchob.group(1) != None:
+      if depth == 0:
+        ret.append(text[marker:matchob.start()])
+        marker = matchob.end()
+    elif matchob.group(0) == "{":
+      depth += 1
+    else:
+      depth -= 1
 
   ret.append(text[marker:])
+  split_cache.put((splitchar, text), tuple(ret))
   return ret
 
 
@@ -695,13 +1077,16 @@ def columnize(textlist, screenwidth=72, indent=0):
 
 def parse_timespan(timespan):
   """
-  Parses a timsspan into a number of seconds.  
+  Parses a timsspan into a number of seconds.  Seconds can have a
+  fractional part ("1.25s") and milliseconds can be given with 
+  "ms" ("250ms", "1s500ms").
 
   @param timespan: the timespan string to parse
   @type  timespan: string
 
-  @returns: the number of seconds in the timespan
-  @rtype: int
+  @returns: the number of seconds in the timespan--an int unless
+      there's a fraction of a second
+  @rtype: int or float
 
   @raises ValueError: if the timespan is unparseable
   """
@@ -712,7 +1097,7 @@ def parse_timespan(timespan):
     
   timespec = match.groupdict()
 
-  if not timespec["days"] and not timespec["hours"] and not timespec["minutes"] and not timespec["seconds"]:
+  if not timespec["days"] and not timespec["hours"] and not timespec["minutes"] and not timespec["seconds"] and not timespec["milliseconds"]:
     raise ValueError("Invalid timespan string.")
 
   days = timespec["days"]
@@ -741,9 +1126,19 @@ def parse_timespan(timespan):
     seconds="0"
   elif seconds.endswith("s"):
     seconds=seconds[:-1]
-  seconds=int(seconds)
+  seconds=float(seconds)
+
+  milliseconds = timespec["milliseconds"]
+  if not milliseconds:
+    milliseconds="0"
+  else:
+    milliseconds=milliseconds[:-2]
+  milliseconds=float(milliseconds)
       
-  return days * 24 * 60 * 60 + hours * 60 * 60 + minutes * 60 + seconds
+  total = days * 24 * 60 * 60 + hours * 60 * 60 + minutes * 60 + seconds + milliseconds / 1000
+  if total == int(total):
+    return int(total)
+  return total
 
 
 def parse_time(timearg):
@@ -817,6 +1212,40 @@ def parse_time(timearg):
     raise ValueError("Invalid time string: %s" % e)
 
 
+def parse_past_time(timearg):
+  """
+  Parses a time into the number of seconds since the epoch looking
+  backwards from now rather than forwards like parse_time does.
+  Timespans are that long before now and times of day are the most
+  recent time it was that time.
+
+  @param timearg: the time string to parse
+  @type  timearg: string
+
+  @return: the number of seconds
+  @rtype: float
+
+  @raises ValueError: if the time string was unparseable
+  """
+  now = time.time()
+  if TIMESPAN_REGEXP.match(timearg):
+    return now - parse_timespan(timearg)
+
+  ret = parse_time(timearg)
+
+  # parse_time moves 12 hours at a time when it's not clear whether 
+  # it's am or pm and 24 hours otherwise
+  match = TIME_REGEXP1.match(timearg) or TIME_REGEXP2.match(timearg)
+  if match and not match.group("ampm"):
+    increment = 12 * 60 * 60
+  else:
+    increment = 24 * 60 * 60
+
+  while ret > now:
+    ret = ret - increment
+  return ret
+
+
 def convert_boolean(text):
   """
   Returns 1 if true, 0 if false, or -1 if it's not a boolean.
@@ -912,64 +1341,85 @@ def expand_vars(text, varmap):
   if not ("%" in text or "$" in text) or len(text) == 0:
     return text
 
-  varmapkeys = varmap.keys()
-  # we want to sort them in order of longest first
-  varmapkeys.sort(lambda x,y: cmp(len(y), len(x)))
-  i = 0
+  return VariableExpander(varmap).expand(text)
 
-  # we go through the text expanding things one at a time.
-  while (i < len(text)):
-    mem = text[i]
-    if i != 0:
-      memm1 = text[i-1]
-    else:
-      memm1 = None
+# a run of $ or % that isn't escaped with a \
+VARRUN_REGEXP = re.compile(r"(?<!\\)(?:\$+|%+)")
 
-    if (mem == "%" or mem == "$") and memm1 != "\\":
-      j = i
-      ccount = 0
+# set of variable names -> compiled name regexp so expand_vars doesn't
+# rebuild the regexp for a varmap it's seen before
+_names_cache = {}
 
-      # count the $/% thingies first
-      while j < len(text) and text[j] == mem:
-        ccount += 1
-        j += 1
- 
-      if ccount == 1 and j < len(text):
-        closure = -1
-
-        # if we're looking at a variable in the form of ${blah} then
-        # we have this wonderful set of closures to play with.
-        if text[j] == "{":
-          closure = text.find("}", j)
-          # if we didn't find a closure, then we set it to the end of
-          # the text.
-          if closure == -1:
-            closure = len(text)-1
-
-          # we found a { and a }, so the textfragment exists between
-          # them.
-          textfragment = text[j+1:closure]
-
-          if textfragment in varmapkeys:
-            repl = str(varmap[textfragment])
-            text = text[:i] + repl + text[closure+1:]
-            break
+class VariableExpander:
+  """
+  Does what expand_vars does for a given varmap, but compiles the
+  variable names into a single longest-match regular expression once
+  rather than sorting and scanning all the names on every call.
 
-        else:
-          textfragment = text[j:]
+  The expander holds on to the varmap and looks values up when
+  expanding, so it only needs rebuilding when the set of variable
+  names changes.
+  """
+  def __init__(self, varmap):
+    """
+    @param varmap: the varname to expansion mapping
+    @type  varmap: dict
+    """
+    self._varmap = varmap
+    self._names = None
+    if varmap:
+      key = frozenset(varmap)
+      self._names = _names_cache.get(key)
+      if self._names == None:
+        if len(_names_cache) >= 100:
+          _names_cache.clear()
+        self._names = re.compile(trie_regexp(varmap.keys()))
+        _names_cache[key] = self._names
+
+  def expand(self, text):
+    """
+    Expands variables in the text the same way expand_vars does.
 
-          for mem in varmapkeys:
-            if textfragment.find(mem) == 0:
-              repl = str(varmap[mem])
-              text = text[:i] + repl + text[i+len(mem)+ccount:]
-              break
-      else:
-        i += ccount
+    @param text: the text to expand variables in
+    @type  text: string
 
-    i += 1
+    @return: the text with all variables expanded
+    @rtype: string
+    """
+    if not ("%" in text or "$" in text):
+      return text
 
-  #exported.write_message("utils.lyntin_expand_vars output: %s" % (text,))
-  return text
+    varmap = self._varmap
+    names = self._names
+    search = VARRUN_REGEXP.search
+    i = 0
+
+    while 1:
+      m = search(text, i)
+      if m == None:
+        return text
+      i, j = m.span()
+
+      # multiple $/% get denested later and a lone one at the end
+      # of the line has nothing to expand
+      if j - i != 1 or j == len(text):
+        i = j + 1
+        continue
+
+      if text[j] == "{":
+        closure = text.find("}", j)
+        if closure == -1:
+          closure = len(text) - 1
+
+        if varmap.has_key(text[j+1:closure]):
+          return text[:i] + str(varmap[text[j+1:closure]]) + text[closure+1:]
+
+      elif names != None:
+        n = names.match(text, j)
+        if n != None:
+          text = text[:i] + str(varmap[n.group(0)]) + text[n.end():]
+
+      i += 1
 
 
 # --------------------------------------
@@ -1143,6 +1593,91 @@ def expand_placement_vars(input, expansion):
 
   return expansion
 
+def compile_placement_vars(expansion):
+  """
+  Compiles an alias expansion into a template that 
+  expand_placement_template can fill in without having to look for
+  the placement variables again.  Placement variables work the same
+  as in expand_placement_vars.
+
+  @param expansion: the alias expansion
+  @type  expansion: string
+
+  @return: list of strings and (start, end) word ranges where end is
+      None for "to the end of the input".  if the expansion has no
+      placement variables, the list ends with None which means the
+      arguments go on the end.
+  @rtype: list of strings and (int, int) tuples
+
+  @raises ValueError: if a placement variable doesn't make sense
+  """
+  template = []
+  hasvars = 0
+  i = 0
+  match = PVAR_REGEXP.search(expansion)
+  while match:
+    (b, e) = match.span()
+    mem = match.groups()[0]
+    if expansion[b+1] == "%":
+      # %%1 isn't a placement variable--the denesting turns it into %1
+      template.append(expansion[i:e])
+    else:
+      if mem.find(':') < 0:
+        start = int(mem)
+        if start == -1:
+          end = None
+        else:
+          end = start + 1
+      else:
+        startmem, endmem = mem.split(':')
+        start = 0
+        end = None
+        if startmem:
+          start = int(startmem)
+        if endmem:
+          end = int(endmem)
+      template.append(expansion[i:b])
+      template.append((start, end))
+      hasvars = 1
+    i = e
+    match = PVAR_REGEXP.search(expansion, e)
+
+  if not hasvars:
+    return [expansion, None]
+
+  template.append(expansion[i:])
+  return template
+
+def expand_placement_template(template, inputsplit):
+  """
+  Fills in a template built by compile_placement_vars.
+
+  @param template: the compiled template
+  @type  template: list of strings and (int, int) tuples
+
+  @param inputsplit: the words of the input--the first of which is
+      the alias
+  @type  inputsplit: list of strings
+
+  @return: the filled in expansion with nested variables denested
+  @rtype: string
+  """
+  ret = []
+  for mem in template:
+    if type(mem) == types.StringType:
+      ret.append(mem)
+    elif mem == None:
+      if len(inputsplit) > 1:
+        ret.append(' ')
+        ret.append(' '.join(inputsplit[1:]))
+    else:
+      start, end = mem
+      if end == None:
+        end = max(len(inputsplit), start)
+      ret.append(' '.join(inputsplit[start:end]))
+
+  return _denest_vars_worker("%", "".join(ret))
+
 
 # Local variables:
 # mode:python
@@ -1,7 +1,14 @@
 #!/usr/bin/env python
 
 from distutils.core import setup
-import re, sys, lyntin
+import re, sys
+
+# lyntin uses collections.deque, set, struct.Struct and
+# struct.unpack_from which need Python 2.5.
+if sys.version_info < (2, 5):
+  sys.exit("Lyntin requires Python 2.5 or later.")
+
+import lyntin
 
 from ez_setup import use_setuptools
 use_setuptools()
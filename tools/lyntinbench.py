@@ -0,0 +1,644 @@
+#######################################################################
+# This file is part of Lyntin.
+# copyright (c) Free Software Foundation 2001-2007
+#
+# Lyntin is distributed under the GNU General Public License license.  See the
+# file LICENSE for distribution details.
+#######################################################################
+"""
+Micro-benchmarks for the hot paths in Lyntin: the mud data filters,
+user input handling and the like.  Run it from the tools/ directory:
+
+  python lyntinbench.py            -- runs all the benchmarks
+  python lyntinbench.py ansi       -- runs the benchmarks with "ansi"
+                                      in their name
+
+Numbers are wall-clock and only mean something when compared to
+other runs on the same machine.
+"""
+# we kind of assume this is being run in ./lyntin/tools/
+import sys, time, os, tempfile
+sys.path.insert(0, "../")
+
+_engine = None
+
+def get_engine():
+  """
+  Builds (once) an Engine with the common session and the usual
+  modules loaded without a ui or a network connection.
+  """
+  global _engine
+  if _engine == None:
+    from lyntin import engine, exported
+    from lyntin.modules import action, alias, gag, highlight, substitute, \
+         variable, logger
+    _engine = engine.Engine()
+    engine.Engine.instance = _engine
+    exported.myengine = _engine
+    _engine._setupConfiguration()
+    for mod in (variable, alias, action, gag, highlight, substitute, logger):
+      mod.load()
+  return _engine
+
+def timeit(func, count):
+  """
+  Calls func count times and returns the seconds it took.
+  """
+  start = time.time()
+  for i in xrange(count):
+    func()
+  return time.time() - start
+
+def report(name, seconds, count, unit="call"):
+  print "  %-40s %10.2f usec/%s" % (name, seconds * 1000000.0 / count, unit)
+
+def make_lines(count):
+  """
+  Returns a list of ansi-heavy mud lines.
+  """
+  e = chr(27)
+  lines = []
+  for i in xrange(count):
+    lines.append("%s[1;32mHero%d%s[0m tells you '%s[33mthe %d orcs%s[0m are " \
+                 "coming from the %s[1;34mnorth%s[0m'\r\n" % \
+                 (e, i, e, e, i, e, e, e))
+  return lines
+
+# -------------------------------------------------------------------
+# benchmarks
+# -------------------------------------------------------------------
+def bench_ansi_filter_calls():
+  """counts filter_ansi calls per mud line through mud_filter_hook"""
+  from lyntin import ansi, exported
+  e = get_engine()
+  ses = e.getSession("common")
+
+  for i in range(50):
+    exported.get_manager("gag").getGagData(ses).addGag("gagged%d" % i)
+    exported.get_manager("action").getActionData(ses).addAction(
+          "^nomatch%d" % i, "#showme hi")
+    exported.get_manager("highlight").addHighlight(ses, "red", "orcs%d" % i)
+
+  logfile = tempfile.mktemp()
+  exported.get_manager("logger").getLogData(ses).setLogFile(open(logfile, "w"), 1)
+
+  calls = [0]
+  orig = ansi.filter_ansi
+  def counting_filter_ansi(text):
+    calls[0] = calls[0] + 1
+    return orig(text)
+  ansi.filter_ansi = counting_filter_ansi
+
+  lines = make_lines(1000)
+  try:
+    seconds = timeit(lambda: ses.handleMudData("".join(lines)), 1)
+  finally:
+    ansi.filter_ansi = orig
+    exported.get_manager("logger").getLogData(ses).closeLogFile()
+    os.remove(logfile)
+    exported.get_manager("gag").clear(ses)
+    exported.get_manager("action").clear(ses)
+    exported.get_manager("highlight").clear(ses)
+
+  report("mud line (50 gags/actions/highlights)", seconds, len(lines), "line")
+  print "  %-40s %10.2f" % ("filter_ansi calls per line",
+                             float(calls[0]) / len(lines))
+
+def bench_argparser():
+  """parses arguments for built-in commands"""
+  import copy
+  from lyntin.modules import lyntincmds, tintincmds
+  e = get_engine()
+  ses = e.getSession("common")
+  lyntincmds.load()
+  tintincmds.load()
+  cm = e.getManager("command")
+
+  inputs = [("showme", "{HP: 100/120 SP: 50/80}"),
+            ("math", "{hp} {100 - 5}"),
+            ("action", "{^%0 tells you '%1'} {say %0 said %1} priority=10"),
+            ("alias", "{k} {kill %1;get all from corpse}"),
+            ("highlight", "{bold red} {tells you}"),
+            ("if", "{$hp < 50} {quaff heal} {nop}"),
+            ("variable", "{hp} {100} quiet=true")]
+
+  count = 1000
+  for name, input in inputs:
+    ap = cm.getArgParser(name)
+    resolver = cm.getResolver(ses, name)
+    nocache = copy.copy(ap)
+    nocache._cache = None
+    report("%s (uncached)" % name, 
+           timeit(lambda: nocache.parse(input, resolver), count), count)
+    report("%s (cached)" % name, 
+           timeit(lambda: ap.parse(input, resolver), count), count)
+
+def bench_commands():
+  """dispatches #commands with all the usual modules loaded"""
+  from lyntin import exported
+  from lyntin.modules import lyntincmds, tintincmds
+  e = get_engine()
+  ses = e.getSession("common")
+  lyntincmds.load()
+  tintincmds.load()
+  cm = e.getManager("command")
+  cm.addCommand("zzbench", lambda ses, args, input: None, "arg= count:int=1")
+
+  lines = ["#zzbench hello %d" % (i % 5) for i in range(200)]
+  def run():
+    for mem in lines:
+      cm.filter({"session": ses, "internal": 1, "verbatim": 0, "dataadj": mem})
+  count = 10
+  report("command dispatch (%d commands)" % len(cm.getCommands()),
+         timeit(run, count), count * len(lines), "line")
+  cm.removeCommand("zzbench")
+
+def bench_config():
+  """reads the config values the user input and mud data paths use"""
+  e = get_engine()
+  ses = e.getSession("common")
+  cm = e.getConfigManager()
+
+  # what the hot paths read for each line of user input and each
+  # line of mud data
+  def run():
+    cm.get("debugmode"); cm.get("splitchar"); cm.get("commandchar")
+    cm.get("verbatim", ses); cm.get("commandchar"); cm.get("mudecho")
+    cm.get("promptdetection"); cm.get("ignoresubs", ses, 0)
+    cm.get("ignoresubs", ses, 0); cm.get("ignoreactions", ses, 0)
+  count = 100000
+  report("ConfigManager.get", timeit(run, count), count, "line")
+
+  def run():
+    snap = cm.getSnapshot()
+    snap.debugmode; snap.splitchar; snap.commandchar
+    cm.getSnapshot(ses).verbatim; cm.getSnapshot().commandchar; snap.mudecho
+    cm.getSnapshot().promptdetection
+    getattr(cm.getSnapshot(ses), "ignoresubs", 0)
+    getattr(cm.getSnapshot(ses), "ignoresubs", 0)
+    getattr(cm.getSnapshot(ses), "ignoreactions", 0)
+  report("ConfigSnapshot", timeit(run, count), count, "line")
+
+def bench_databuffer():
+  """adds mud lines to full data buffers"""
+  e = get_engine()
+  ses = e.getSession("common")
+  batches = [["line %d of mud data\n" % i for i in range(j, j + 10)]
+             for j in range(0, 1000, 10)]
+
+  for size in (10000, 100000):
+    ses.clearDataBuffer()
+    ses.resizeDataBuffer(size)
+    ses._appendToDataBuffer(["line %d of mud data\n" % i for i in range(size)])
+    def run():
+      for mem in batches:
+        ses._appendToDataBuffer(mem)
+    count = 20
+    report("append 10 lines (%d line buffer)" % size, timeit(run, count), 
+           count * len(batches))
+
+  ses.clearDataBuffer()
+  ses.resizeDataBuffer(10000)
+
+def bench_expressions():
+  """evaluates #if expressions as hp changes"""
+  from lyntin import expression
+  e = get_engine()
+  ses = e.getSession("common")
+  vm = e.getManager("variable")
+  ses.setVariable("maxhp", "500")
+
+  exprs = ["$hp < 100 and $hp * 100 / $maxhp < 20", "'$name' == 'Joe'"]
+  values = [str(i) for i in range(500)]
+  def run():
+    for mem in values:
+      ses.setVariable("hp", mem)
+      ses.setVariable("name", mem)
+      for expr in exprs:
+        eval(vm.expand(ses, expr))
+  count = 10
+  report("expand + eval", timeit(run, count), count * len(values) * len(exprs))
+
+  def run():
+    for mem in values:
+      ses.setVariable("hp", mem)
+      ses.setVariable("name", mem)
+      for expr in exprs:
+        expression.evaluate(expr, ses.lookupVariable)
+  report("expression.evaluate", timeit(run, count), count * len(values) * len(exprs))
+  vm.clear(ses)
+
+def bench_gags():
+  """checks lines against 800 gags and 20 antigags"""
+  from lyntin.modules import gag
+  gd = gag.GagData()
+  for i in range(800):
+    gd.addGag("channel%d:" % i)
+  for i in range(20):
+    gd.addAntiGag("^[friend%d]" % i)
+
+  lines = make_lines(200)
+  def run():
+    for mem in lines:
+      gd.expand(mem)
+  count = 10
+  report("gag check", timeit(run, count), count * len(lines), "line")
+
+def bench_grep():
+  """greps a 100000 line data buffer for 100 tells"""
+  import re
+  from lyntin import databuffer
+  db = databuffer.DataBuffer(100000)
+  lines = []
+  for i in range(100000):
+    if i % 1000 == 0:
+      lines.append("Hero%d tells you 'the orcs are coming'\n" % i)
+    else:
+      lines.append("A goblin %d hits you with its rusty sword.\n" % i)
+  db.append(lines)
+  c = re.compile("^(\\w+) tells you '(.*)'")
+
+  def run():
+    [m for m in db.getLines() if c.search(m)]
+  report("linear scan", timeit(run, 1), 1, "grep")
+  report("first grep (starts the index)", timeit(lambda: db.search(c), 1), 
+         1, "grep")
+
+  # the index catches up as lines come in--the buffer is full so as
+  # many lines get dropped from the index as get added to it
+  appends = [0]
+  def run():
+    while db._index.getNextLineNumber() < db.getNextLineNumber():
+      db.append(lines[:100])
+      appends[0] += 1
+  elapsed = timeit(run, 1)
+  report("append 100 lines while catching up", elapsed, appends[0], "append")
+
+  count = 100
+  report("indexed", timeit(lambda: db.search(c), count), count, "grep")
+
+  def run():
+    db.append(lines[:100])
+    db.search(c)
+  report("append 100 lines and grep", timeit(run, count), count, "grep")
+  print "  %-40s %10d" % ("text bytes", db._bytes)
+  print "  %-40s %10d" % ("index bytes", db._index.getByteCount())
+
+def bench_highlights():
+  """highlights ansi-heavy lines with 200 highlights"""
+  from lyntin.modules import highlight
+  hd = highlight.HighlightData()
+  for i in range(196):
+    hd.addHighlight("red", "monster%d" % i)
+  hd.addHighlight("bold blue", "north")
+  hd.addHighlight("green", "Hero*")
+  hd.addHighlight("yellow", "%1 orcs")
+  hd.addHighlight("red", "tells you")
+
+  lines = make_lines(200)
+  def run():
+    for mem in lines:
+      hd.expand(mem)
+  count = 10
+  report("highlight", timeit(run, count), count * len(lines), "line")
+
+  plain = ["nothing to see on line %d\n" % i for i in range(200)]
+  def run():
+    for mem in plain:
+      hd.expand(mem)
+  report("highlight (no matches)", timeit(run, count), count * len(plain), "line")
+
+def bench_history():
+  """records 20000 commands and looks up !prefix in a full history"""
+  from lyntin import history
+  hm = history.HistoryManager(get_engine())
+  hm._journalname = ""
+  commands = ["kill goblin %d" % i for i in range(20000)]
+  def record():
+    for mem in commands:
+      hm.recordHistory(mem)
+  report("recordHistory", timeit(record, 1), len(commands), "command")
+  hm.recordHistory("cast fireball")
+  for mem in commands[:1000]:
+    hm.recordHistory(mem)
+  report("!prefix", timeit(lambda: hm.getHistoryItem("!cast"), 1000), 1000)
+
+def bench_logger():
+  """logs 100000 mud lines with write+flush per line and buffered"""
+  from lyntin.modules import logger
+  ses = get_engine().getSession("common")
+  lines = make_lines(100000)
+  name = tempfile.mktemp()
+
+  def sync():
+    f = open(name, "w")
+    for mem in lines:
+      f.write(mem)
+      f.flush()
+    f.close()
+  report("write+flush per line", timeit(sync, 1), len(lines), "line")
+
+  ld = logger.LoggerData(ses)
+  ld.setLogFile(open(name, "w"), 0)
+  def run():
+    for mem in lines:
+      ld.log(mem, 1)
+  report("buffered log (caller)", timeit(run, 1), len(lines), "line")
+  ld.flushLogFile()
+  print "  %s" % ld.getStatus()
+  report("buffered log (caller+flush)", timeit(lambda: (run(), ld.flushLogFile()), 1), 
+         len(lines), "line")
+  ld.closeLogFile()
+  os.remove(name)
+
+def bench_mapper(size=142):
+  """finds routes on a 20000 room map"""
+  import random, StringIO
+  from lyntin.modules import mapper
+  roommap = mapper.RoomMap()
+  area = roommap.newArea()
+  rooms = size * size
+  def build():
+    for y in range(size):
+      for x in range(size):
+        roommap.addRoom("room %d,%d" % (x, y), area, x, y)
+    for room in range(rooms):
+      if room % size + 1 < size:
+        roommap.addExit(room, "east", room + 1)
+        roommap.addExit(room + 1, "west", room)
+      if room + size < rooms:
+        roommap.addExit(room, "north", room + size)
+        roommap.addExit(room + size, "south", room)
+  report("build %d rooms" % rooms, timeit(build, 1), rooms, "room")
+
+  targets = [[random.randrange(rooms)] for i in range(1000)]
+  report("first route (whole map)", 
+         timeit(lambda: roommap.findPath(0, [rooms - 1]), 1), 1, "query")
+  report("cached routes", 
+         timeit(lambda: roommap.findPath(0, targets.pop()), 1000), 1000, 
+         "query")
+
+  roommap.setCost(size + 1, 5)
+  report("first route with costs (whole map)",
+         timeit(lambda: roommap.findPath(0, [rooms - 1]), 1), 1, "query")
+
+  roommap._changed()
+  near = [[random.randrange(size * 10)] for i in range(100)]
+  def nearby():
+    roommap._changed()
+    roommap.findPath(0, near.pop())
+  report("uncached routes within 10 rows", timeit(nearby, 100), 100, "query")
+
+  f = StringIO.StringIO()
+  report("write", timeit(lambda: roommap.write(f), 1), rooms, "room")
+  report("read", timeit(lambda: mapper.RoomMap().read(
+                        StringIO.StringIO(f.getvalue())), 1), rooms, "room")
+
+def bench_recording():
+  """records 200000 mud lines and seeks through the recording"""
+  import random
+  from lyntin import recording
+  lines = make_lines(200000)
+  name = tempfile.mktemp()
+
+  writer = recording.RecordWriter(name, "bench")
+  def run():
+    for mem in lines:
+      writer.write(recording.MUD, mem)
+  report("record line", timeit(run, 1), len(lines), "line")
+  writer.close()
+
+  reader = recording.RecordReader(name)
+  start, end = reader.getStartTime(), reader.getEndTime()
+  times = [random.uniform(start, end) for i in range(1000)]
+  def seek():
+    for mem in times:
+      reader.seek(mem)
+  report("seek (indexed)", timeit(seek, 1), len(times), "seek")
+
+  def scan():
+    for mem in reader.records(since=None, until=times[0]):
+      pass
+  report("seek (scan)", timeit(scan, 10), 10, "seek")
+  report("read all records", timeit(lambda: list(reader), 1), len(reader), "record")
+  reader.close()
+  os.remove(name)
+
+def bench_scheduler(count=100000):
+  """schedules, cancels and runs 100000 events"""
+  import random
+  from lyntin.modules import scheduler
+  ses = get_engine().getSession("common")
+  sched = scheduler.Scheduler()
+  ticks = [random.randint(1, 1000) for i in range(count)]
+  def noop():
+    pass
+
+  def add():
+    for mem in ticks:
+      sched.addEvent(mem, scheduler.SchedEvent(mem, ses, noop, quiet=1))
+  report("addEvent", timeit(add, 1), count, "event")
+
+  ids = [str(mem) for mem in random.sample(xrange(count), count / 2)]
+  def remove():
+    for mem in ids:
+      sched.removeById(mem)
+  report("removeById", timeit(remove, 1), len(ids), "event")
+
+  def run():
+    for tick in range(1001):
+      sched.runEvents(tick)
+  report("runEvents (1000 deadlines)", timeit(run, 1), count - len(ids), "event")
+
+def bench_spill():
+  """spills 500000 lines from a 10000 line data buffer to disk"""
+  import re
+  from lyntin import databuffer
+  batches = [["A goblin %d hits you with its rusty sword.\n" % i 
+              for i in range(j, j + 10)] for j in range(0, 500000, 10)]
+  for i in range(0, len(batches), 500):
+    batches[i][0] = "Hero%d tells you 'the orcs are coming'\n" % i
+
+  db = databuffer.DataBuffer(10000)
+  def run():
+    for mem in batches:
+      db.append(mem)
+  report("append (no spill)", timeit(run, 1), 500000, "line")
+
+  db = databuffer.DataBuffer(10000)
+  db.setSpillFile(tempfile.TemporaryFile())
+  report("append (spill)", timeit(run, 1), 500000, "line")
+  print "  %s" % db.getSpillFile().getStatus()
+
+  c = re.compile("^(\\w+) tells you '(.*)'")
+  count = 5
+  report("search 500000 lines", timeit(lambda: db.search(c, 0), count), count, "search")
+  report("read 100 spilled lines", 
+         timeit(lambda: db.getLines(250000, 250100), 1000), 1000)
+  db.setSpillFile(None)
+
+def bench_speedwalk():
+  """expands speedwalks and sends them to the mud"""
+  from lyntin import exported
+  from lyntin.modules import speedwalk
+  e = get_engine()
+  if not exported.get_manager("speedwalk"):
+    speedwalk.load()
+  ses = e.createSession("speedwalk")
+
+  class Sink:
+    writes = 0
+    def write(self, data):
+      self.writes += 1
+  sink = Sink()
+  ses._socket = sink
+
+  sm = exported.get_manager("speedwalk")
+  for alias, dir in (("n", "north"), ("s", "south"), ("e", "east"), 
+                     ("w", "west"), ("u", "up"), ("d", "down")):
+    sm.addDir(ses, alias, dir)
+
+  walk = "3n2e4sw2ud3enws"
+  count = 2000
+  report("handleUserData %s" % walk, 
+         timeit(lambda: e.handleUserData(walk, 1, ses), count), count, "walk")
+  print "  %-40s %10.2f" % ("socket writes per walk", sink.writes / float(count))
+  ses._socket = None
+  e.closeSession(ses)
+
+def bench_repeat():
+  """runs #N and #loop repeats through the user filters"""
+  from lyntin.modules import tintincmds
+  e = get_engine()
+  if "loop" not in e.getManager("command").getCommands():
+    tintincmds.load()
+  ses = e.createSession("repeat")
+
+  class Sink:
+    writes = 0
+    def write(self, data):
+      self.writes += 1
+  sink = Sink()
+  ses._socket = sink
+
+  ad = e.getManager("alias").getAliasData(ses)
+  for i in range(200):
+    ad.addAlias("alias%d" % i, "say %d" % i)
+
+  count = 20
+  for text in ("#500 {buy arrow}", "#loop {1,500} {get %0.arrow}"):
+    sink.writes = 0
+    report(text, timeit(lambda: e.handleUserData(text, 1, ses), count), 
+           count * 500, "iteration")
+    print "  %-40s %10.2f" % ("socket writes per repeat", sink.writes / float(count))
+  ses._socket = None
+  e.closeSession(ses)
+
+def bench_split_commands():
+  """splits command strings with many split characters in braces"""
+  from lyntin import utils
+  lines = ["#action {^%d} {" % i + ";".join(["say %d" % j for j in range(100)]) + "}"
+           for i in range(50)]
+  def run():
+    utils.split_cache.clear()
+    for mem in lines:
+      utils.split_commands(";", mem)
+  count = 10
+  report("split_commands (uncached)", timeit(run, count), count * len(lines), "line")
+
+  def run():
+    for mem in lines:
+      utils.split_commands(";", mem)
+  report("split_commands (cached)", timeit(run, count), count * len(lines), "line")
+
+def bench_substitutes():
+  """substitutes on ansi-heavy lines with 300 substitutes"""
+  from lyntin.modules import substitute
+  sd = substitute.SubstituteData()
+  for i in range(290):
+    sd.addSubstitute("monster%d" % i, "critter%d" % i)
+  for i in range(10):
+    sd.addSubstitute("r[^(\\w+)%d says]" % i, "\\1 mumbles")
+  sd.addSubstitute("orcs", "goblins")
+  sd.addSubstitute("north", "N")
+
+  lines = make_lines(200)
+  def run():
+    for mem in lines:
+      sd.expand(mem)
+  count = 10
+  report("substitute", timeit(run, count), count * len(lines), "line")
+
+  plain = ["nothing to see on line %d\n" % i for i in range(200)]
+  def run():
+    for mem in plain:
+      sd.expand(mem)
+  report("substitute (no matches)", timeit(run, count), count * len(plain), "line")
+
+def bench_aliases():
+  """expands user input with 1000 aliases"""
+  from lyntin import utils
+  from lyntin.modules import alias
+  ad = alias.AliasData()
+  for i in range(1000):
+    ad.addAlias("a%d" % i, "kill %%1;get all from corpse %d" % i)
+
+  lines = ["a%d orc" % i for i in range(0, 1000, 5)] + \
+          ["say hello %d" % i for i in range(200)]
+  def run():
+    for mem in lines:
+      exp = ad.expand(mem)
+      if exp:
+        utils.expand_placement_vars(mem, exp)
+  count = 10
+  report("expand + expand_placement_vars", timeit(run, count), count * len(lines), "line")
+
+  def run():
+    for mem in lines:
+      ad.expandInput(mem)
+  report("expandInput", timeit(run, count), count * len(lines), "line")
+
+def bench_variables():
+  """expands user input with 400 session variables"""
+  from lyntin import utils
+  e = get_engine()
+  ses = e.getSession("common")
+  vm = e.getManager("variable")
+  for i in range(400):
+    ses.setVariable("var%d" % i, "value %d" % i)
+
+  lines = ["say $var%d and ${var%d} and $$var3" % (i, i + 1) for i in range(0, 398, 2)] + \
+          ["kill orc %d" % i for i in range(200)]
+  def run():
+    for mem in lines:
+      utils.expand_vars(mem, ses._vars)
+  count = 10
+  report("utils.expand_vars", timeit(run, count), count * len(lines), "line")
+
+  def run():
+    for mem in lines:
+      vm.expand_command(ses, mem)
+  report("VariableManager.expand_command", timeit(run, count), count * len(lines), "line")
+
+  vm.clear(ses)
+
+
+def main(args):
+  names = [m for m in globals().keys() if m.startswith("bench_")]
+  names.sort()
+  if args:
+    names = [m for m in names if [a for a in args if m.find(a) != -1]]
+
+  for mem in names:
+    func = globals()[mem]
+    print "%s: %s" % (mem[6:], func.__doc__)
+    func()
+
+if __name__ == '__main__':
+  main(sys.argv[1:])
+
+# Local variables:
+# mode:python
+# py-indent-offset:2
+# tab-width:2
+# End:
@@ -25,16 +25,301 @@ class TestSplitCommands(unittest.TestCase):
      ("#alias t3k #ses a localhost 3000", ["#alias t3k #ses a localhost 3000"]),
      ("#alias gv {put vx;get all}", ["#alias gv {put vx;get all}"]),
      ("#alias sv {put vx;get all};test", ["#alias sv {put vx;get all}", "test"]),
-     (r"#sh \{ blah;#sh another }", [r"#sh \{ blah", r"#sh another }"])
+     (r"#sh \{ blah;#sh another }", [r"#sh \{ blah", r"#sh another }"]),
+     (r"say a\;b;#sh {x};}c;d", [r"say a\;b", "#sh {x}", "}c;d"]),
+     ("{a;b}{c;d};e;", ["{a;b}{c;d}", "e", ""])
   )
 
   def testSplit(self):
     """Tests lyntin.utils.split_commands"""
     for i in range(0, len(self.t)):
       c, s = self.t[i]
-      result = lyntin.utils.split_commands(c)
+      result = lyntin.utils.split_commands(";", c)
       self.assertEquals(s, result, "test %d" % i)
 
+  def testSplitChar(self):
+    """Tests lyntin.utils.split_commands with another split character"""
+    self.assertEquals(lyntin.utils.split_commands("|", "a;b|c"), ["a;b", "c"])
+    self.assertEquals(lyntin.utils.split_commands(";", "a;b|c"), ["a", "b|c"])
+
+  def testCache(self):
+    """Tests lyntin.utils.split_commands hands out copies of cached results"""
+    result = lyntin.utils.split_commands(";", "n;n;e")
+    result.append("w")
+    self.assertEquals(lyntin.utils.split_commands(";", "n;n;e"), ["n", "n", "e"])
+
+class TestLRUCache(unittest.TestCase):
+  def testEviction(self):
+    """Tests lyntin.utils.LRUCache throws away the least recently used item"""
+    cache = lyntin.utils.LRUCache(3)
+    for mem in "abc":
+      cache.put(mem, mem.upper())
+    self.assertEquals(cache.get("a"), "A")
+    cache.put("d", "D")
+    self.assertEquals(cache.get("b"), None)
+    self.assertEquals(len(cache), 3)
+    cache.put("c", "C2")
+    cache.put("e", "E")
+    self.assertEquals(cache.get("a"), None)
+    self.assertEquals([cache.get(m) for m in "cde"], ["C2", "D", "E"])
+    self.assertEquals((cache.hits, cache.misses), (4, 2))
+    cache.clear()
+    self.assertEquals((len(cache), cache.get("e")), (0, None))
+
+class TestDataBuffer(unittest.TestCase):
+  def model(self, lines, maxlines, maxbytes, buffer=None):
+    """the old list based data buffer plus the byte limit"""
+    if buffer == None:
+      buffer = []
+    for mem in lines:
+      if len(buffer) == 0 or buffer[-1].endswith("\n"):
+        buffer.append(mem)
+      else:
+        buffer[-1] += mem
+    if len(buffer) > maxlines:
+      buffer[:-maxlines] = []
+    while maxbytes and len("".join(buffer)) > maxbytes and len(buffer) > 1:
+      del buffer[0]
+    return buffer
+
+  def testAgainstList(self):
+    """tests the ring buffer holds what the old list did"""
+    import random
+    from lyntin import databuffer
+    r = random.Random(5)
+    for maxlines, maxbytes in ((1, 0), (3, 0), (7, 0), (10, 40), (50, 100)):
+      db = databuffer.DataBuffer(maxlines, maxbytes)
+      buffer = []
+      for i in range(200):
+        lines = [r.choice(["a\n", "bb\n", "ccc", "dddd\n", "e" * 30 + "\n"])
+                 for j in range(r.randint(0, 5))]
+        db.append(lines, i)
+        self.model(lines, maxlines, maxbytes, buffer)
+        self.assertEquals(db.getLines(), buffer)
+        self.assertEquals(len(db), len(buffer))
+        self.assertEquals(db.getByteCount(), len("".join(buffer)))
+        if buffer:
+          self.assertEquals(db[-1], buffer[-1])
+          self.assertEquals(db[0], buffer[0])
+          self.assertEquals(db[1:-1], buffer[1:-1])
+          self.assertEquals(db.getLine(db.getNextLineNumber() - 1), buffer[-1])
+
+      if buffer:
+        newsize = r.randint(1, 8)
+        db.resize(newsize)
+        self.model([], newsize, maxbytes, buffer)
+        self.assertEquals(db.getLines(), buffer)
+        db.append(["x\n", "y\n"])
+        self.assertEquals(db.getLines(), self.model(["x\n", "y\n"], newsize, 
+                                                    maxbytes, buffer))
+
+  def testTimesAndNumbers(self):
+    """tests timestamps and line numbers stay with their lines"""
+    from lyntin import databuffer
+    db = databuffer.DataBuffer(3)
+    for i in range(5):
+      db.append(["line %d\n" % i], 100.0 + i)
+    self.assertEquals(db.getFirstLineNumber(), 2)
+    self.assertEquals(db.getNextLineNumber(), 5)
+    self.assertEquals(db.getLine(3), "line 3\n")
+    self.assertEquals(db.getTime(3), 103.0)
+    self.assertRaises(IndexError, db.getLine, 1)
+    self.assertEquals(db.getLines(3, 4), ["line 3\n"])
+
+    db.append(["partial"], 200.0)
+    db.append([" line\n"], 300.0)
+    self.assertEquals(db[-1], "partial line\n")
+    self.assertEquals(db.getTime(5), 200.0)
+
+    db.clear()
+    self.assertEquals(len(db), 0)
+    self.assertEquals(db.getFirstLineNumber(), 6)
+
+  def testRequiredLiterals(self):
+    """tests we pull the right literal text out of regexps"""
+    import re
+    from lyntin import databuffer
+    for pattern, literals in (("says:", ["says:"]),
+                              ("^(\\w+) tells you '(.*)'", [" tells you '", "'"]),
+                              ("(?:loot)+ bag", ["loot", " bag"]),
+                              ("a|bcd", []),
+                              ("(abc)?def", ["def"]),
+                              ("(?!foo)bar", ["bar"]),
+                              ("x[yz]w", ["x", "w"])):
+      self.assertEquals(databuffer.required_literals(re.compile(pattern)), literals)
+
+  def testSearch(self):
+    """tests the indexed search finds what a linear search does"""
+    import random, re
+    from lyntin import databuffer
+    r = random.Random(7)
+    words = ["orc", "tells", "you", "Loot", "bag", "gold", "says:", "sword"]
+    patterns = ["tells you", "says:", "(?i)loot bag", "^orc", "gold|sword", 
+                "sw.rd", "bag\n", "xyzzy", "o"]
+    db = databuffer.DataBuffer(300)
+    for i in range(40):
+      lines = [" ".join([r.choice(words) for j in range(r.randint(1, 6))]) + "\n"
+               for k in range(r.randint(1, 30))]
+      if r.randint(0, 3) == 0:
+        lines[-1] = lines[-1][:-1]
+      db.append(lines, i)
+
+      first, next = db.getFirstLineNumber(), db.getNextLineNumber()
+      start = r.randint(first - 10, next)
+      end = r.randint(start, next + 10)
+      for mem in patterns:
+        c = re.compile(mem)
+        expected = [n for n in range(max(start, first), min(end, next))
+                    if c.search(db.getLine(n))]
+        self.assertEquals(db.search(c, start, end), expected, mem)
+
+  def testIndexMaintained(self):
+    """tests the index is started by a search and caught up as lines come"""
+    import re
+    from lyntin import databuffer
+    db = databuffer.DataBuffer(2000)
+    db.append(["orc %d\n" % i for i in range(1200)] + ["partial orc"])
+    self.assertEquals(db.getIndexStatus(), "not built")
+    c = re.compile("orc 11")
+    expected = [11] + range(110, 120) + range(1100, 1200)
+    self.assertEquals(db.search(c), expected)
+    self.assertEquals(db._index.getNextLineNumber(), 0)
+
+    # each append indexes up to INDEX_LINES more
+    db.append([" line\n"])
+    self.assertEquals(db._index.getNextLineNumber(), databuffer.INDEX_LINES)
+    self.assertEquals(db.search(c), expected)
+    db.append([])
+    db.append(["orc\n"])
+    db.append(["orc\n"])
+    self.assertEquals(db._index.getNextLineNumber(), 1203)
+    self.assertEquals(db.search(c), expected)
+
+    # dropped lines are taken out of the index as they go
+    for i in range(30):
+      db.append(["goblin %d\n" % j for j in range(100)])
+      fresh = databuffer.TrigramIndex(db.getFirstLineNumber())
+      fresh.update(db)
+      self.assertEquals(db._index._entries, fresh._entries)
+      self.assertEquals(db._index.getByteCount(), fresh.getByteCount())
+    self.assertEquals(db.search(re.compile("orc")), [])
+    self.assertEquals(len(db.search(re.compile("goblin 1"))), 11 * 20)
+
+    # and the index counts towards the byte limit
+    db = databuffer.DataBuffer(1000, 50000)
+    db.append(["goblin %d hits you\n" % i for i in range(1000)])
+    self.assertEquals(len(db), 1000)
+    c = re.compile("goblin 99")
+    self.assertEquals(len(db.search(c)), 11)
+    db.append(["goblin hits you\n"] * 100)
+    self.assert_(db.getByteCount() <= 50000)
+    self.assert_(len(db) < 1000)
+    self.assertEquals(db.search(c), [n for n in range(db.getFirstLineNumber(), 
+                                                      db.getNextLineNumber())
+                                     if c.search(db.getLine(n))])
+
+  def testThreads(self):
+    """tests lines can be read while another thread adds and spills them"""
+    import tempfile, threading
+    from lyntin import databuffer
+    db = databuffer.DataBuffer(50)
+    db.setSpillFile(tempfile.TemporaryFile())
+    db.getSpillFile()._blocklines = 20
+    errors = []
+
+    def read():
+      try:
+        for i in range(300):
+          end = db.getNextLineNumber()
+          start = db.getLineNumberAt(0)
+          lines = db.getLines(start, end)
+          self.assertEquals(lines, ["line %d\n" % n for n in range(start, end)])
+      except Exception, e:
+        errors.append(e)
+
+    t = threading.Thread(target=read)
+    t.start()
+    for i in range(1000):
+      db.append(["line %d\n" % (i * 3 + j) for j in range(3)], i)
+    t.join()
+    self.assertEquals(errors, [])
+    db.setSpillFile(None)
+
+  def testLineNumberAt(self):
+    """tests finding lines by time"""
+    from lyntin import databuffer
+    db = databuffer.DataBuffer(5)
+    for i in range(8):
+      db.append(["line %d\n" % i], 100.0 + i)
+    self.assertEquals(db.getLineNumberAt(0), 3)
+    self.assertEquals(db.getLineNumberAt(104), 4)
+    self.assertEquals(db.getLineNumberAt(104.5), 5)
+    self.assertEquals(db.getLineNumberAt(200), 8)
+
+  def testSpill(self):
+    """tests lines dropped from the buffer can be read from the spill file"""
+    import random, re, tempfile
+    from lyntin import databuffer
+    r = random.Random(11)
+    db = databuffer.DataBuffer(50)
+    db.setSpillFile(tempfile.TemporaryFile())
+    db.getSpillFile()._blocklines = 20
+    words = ["orc", "tells", "you", "loot", "bag", "gold"]
+
+    alllines = []
+    for i in range(60):
+      lines = [" ".join([r.choice(words) for j in range(r.randint(1, 5))]) + "\n"
+               for k in range(r.randint(1, 70))]
+      db.append(lines, i)
+      alllines.extend(lines)
+
+      self.assertEquals(db.getOldestLineNumber(), 0)
+      self.assertEquals(db.getLines(0), alllines)
+      lineno = r.randint(0, len(alllines) - 1)
+      self.assertEquals(db.getLine(lineno), alllines[lineno])
+
+    times = [db.getTime(i) for i in range(len(alllines))]
+    for mem in (-1, 0, 10.5, 30, 59, 100):
+      expected = len([m for m in times if m < mem])
+      self.assertEquals(db.getLineNumberAt(mem), expected)
+
+    for mem in ("tells you", "^loot", "(?i)GOLD BAG", "orc|bag"):
+      c = re.compile(mem)
+      for start, end in ((0, None), (10, 500), (len(alllines) - 60, None)):
+        expected = [i for i in range(start, end or len(alllines)) 
+                    if c.search(alllines[i])]
+        self.assertEquals(db.search(c, start, end), expected)
+
+    db.clear()
+    self.assertEquals(db.getOldestLineNumber(), len(alllines))
+    db.append(["x\n"])
+    self.assertEquals(db.getLines(0), ["x\n"])
+    db.setSpillFile(None)
+
+  def testSessionConfig(self):
+    """tests the databuffer config items resize the buffer"""
+    e = get_engine()
+    ses = e.createSession("zzbuffer")
+    cm = e.getConfigManager()
+    try:
+      cm.change("databuffersize", "5", ses)
+      cm.change("databufferbytes", "12", ses)
+      self.assertEquals(ses.getScrollback().getLimits(), (5, 12))
+      ses.addToDataBuffer("abcd\n" * 10)
+      self.assertEquals(ses.getDataBuffer(), ["abcd\n"] * 2)
+
+      cm.change("databufferspill", "on", ses)
+      ses.addToDataBuffer("efgh\n" * 3)
+      buffer = ses.getScrollback()
+      self.assertEquals(buffer.getLines(buffer.getNextLineNumber() - 5), 
+                        ["abcd\n"] * 2 + ["efgh\n"] * 3)
+      cm.change("databufferspill", "off", ses)
+      self.assertEquals(buffer.getSpillFile(), None)
+      self.assertEquals(e.getSession("common").getScrollback().getLimits(), 
+                        (10000, 0))
+    finally:
+      e.closeSession(ses)
+
 class TestSplitAnsiFromText(unittest.TestCase):
   t = (
      ( "This is some text.", ["This is some text."]),
@@ -122,7 +407,12 @@ class TestParseTimespan(unittest.TestCase):
     ("1s", 1),
     ("1h2m3s", 3723),
     ("17", 17),
-    ("5h", 3600 * 5)
+    ("5h", 3600 * 5),
+    ("1.25s", 1.25),
+    ("2.5", 2.5),
+    ("250ms", 0.25),
+    ("2500ms", 2.5),
+    ("1m500ms", 60.5)
   )
 
   def testParseTimespam(self):
@@ -149,6 +439,21 @@ class TestExpandPlacementVars(unittest.TestCase):
       c, s = self.t[i]
       self.assertEquals(expand_placement_vars(self.c, c), s, "test %d" % i)
 
+class TestPlacementTemplate(unittest.TestCase):
+  c = "#test 1 2 3"
+  t = TestExpandPlacementVars.t + (
+    ("a %%1 %1%2 100%% %1:", "a %1 12 100% 1 2 3"),
+    ("x %2:5 %9", "x 2 3 "),
+  )
+
+  def testPlacementTemplate(self):
+    """tests lyntin.utils.compile_placement_vars matches expand_placement_vars"""
+    from lyntin.utils import compile_placement_vars, expand_placement_template
+    for i in range(0, len(self.t)):
+      c, s = self.t[i]
+      template = compile_placement_vars(c)
+      self.assertEquals(expand_placement_template(template, self.c.split(" ")), s, "test %d" % i)
+
 class TestExpandVars(unittest.TestCase):
   varmap = {"var1": "value1", "var2": "value2", "var3": "value3"}
   t = (
@@ -168,6 +473,1044 @@ class TestExpandVars(unittest.TestCase):
       c, s = self.t[i]
       self.assertEquals(expand_vars(c, self.varmap), s, "test %d" % i)
 
+class TestVariableExpander(unittest.TestCase):
+  def testLongestName(self):
+    """tests lyntin.utils.VariableExpander picks the longest name"""
+    from lyntin.utils import VariableExpander
+    varmap = {"hp": "10", "hpmax": "20"}
+    ve = VariableExpander(varmap)
+    self.assertEquals(ve.expand("$hp/$hpmax $hpx $$hp"), "10/20 10x $$hp")
+    self.assertEquals(ve.expand("${hp}max \\$hp"), "10max \\$hp")
+    varmap["hp"] = "15"
+    self.assertEquals(ve.expand("$hp"), "15")
+
+  def testSessionVariables(self):
+    """tests session expanders follow setVariable and removeVariable"""
+    ses = get_engine().getSession("common")
+    vm = get_engine().getManager("variable")
+    ses.setVariable("foo", "bar")
+    self.assertEquals(vm.expand(ses, "$foo $$foo"), "bar $foo")
+    ses.setVariable("foobaz", "qux")
+    self.assertEquals(vm.expand(ses, "$foobaz"), "qux")
+    ses.setVariable("_glob", "al")
+    self.assertEquals(vm.expand(ses, "$_glob"), "al")
+    ses.removeVariable("foobaz")
+    ses.removeVariable("_glob")
+    self.assertEquals(vm.expand(ses, "$foobaz $_glob"), "barbaz $_glob")
+    vm.clear(ses)
+    self.assertEquals(vm.expand(ses, "$foo"), "$foo")
+
+class TestFilterLine(unittest.TestCase):
+  def testSharedFilter(self):
+    """tests lyntin.utils.filter_line_ansi caches until dataadj changes"""
+    from lyntin import utils
+    text = "\33[1;37mThis is\33[0m text.\r\n"
+    args = {"data": text, "dataadj": text}
+    self.assertEquals(utils.filter_line_cm(args), "\33[1;37mThis is\33[0m text.\n")
+    self.assertEquals(utils.filter_line_ansi(args), "This is text.\n")
+    self.assert_(utils.filter_line_ansi(args) is args["linecache"][2])
+
+    args["dataadj"] = "\33[1;37mOther\33[0m text.\n"
+    self.assertEquals(utils.filter_line_ansi(args), "Other text.\n")
+    self.assertEquals(args["linecache"][0], args["dataadj"])
+
+class TestRegexpSet(unittest.TestCase):
+  def testSearch(self):
+    """tests lyntin.utils.RegexpSet finds which regexp matched"""
+    from lyntin.utils import RegexpSet, compile_regexp
+    items = [(m, compile_regexp(m, 1)) for m in
+             ["^You are hungry", "%1 tells you %2", "r[(a)b\\1]", "r[shout]i"]]
+    rs = RegexpSet(items)
+    self.assertEquals(rs.search("You are hungry."), "^You are hungry")
+    self.assertEquals(rs.search("Joe: You are hungry."), None)
+    self.assertEquals(rs.search("Joe tells you hi"), "%1 tells you %2")
+    self.assertEquals(rs.search("xxabcy"), None)
+    self.assertEquals(rs.search("xxabaz"), "r[(a)b\\1]")
+    self.assertEquals(rs.search("Joe SHOUTS"), "r[shout]i")
+    self.assertEquals(rs.search("nothing here"), None)
+
+  def testNamedGroups(self):
+    """tests lyntin.utils.RegexpSet with patterns using the same group name"""
+    from lyntin.utils import RegexpSet, compile_regexp
+    names = ["r[(?P<who>\\w+) tells]", "r[(?P<who>\\w+) says]", "r[shouts]"]
+    rs = RegexpSet([(m, compile_regexp(m, 1)) for m in names])
+    self.assertEquals(rs.search("Joe tells you hi"), names[0])
+    self.assertEquals(rs.search("Joe says hi"), names[1])
+    self.assertEquals(rs.search("Joe shouts hi"), names[2])
+    self.assertEquals(rs.search("Joe waves"), None)
+
+  def testLiterals(self):
+    """tests lyntin.utils.RegexpSet with plain text patterns"""
+    from lyntin.utils import RegexpSet, compile_regexp
+    words = ["abc", "abd", "q", "a.b", "^ab", "chan[1]"]
+    rs = RegexpSet([(m, compile_regexp(m, 1)) for m in words])
+    self.assertEquals(rs.search("xxabdxx"), "abd")
+    self.assertEquals(rs.search("xxaq"), "q")
+    self.assertEquals(rs.search("ab"), "^ab")
+    self.assertEquals(rs.search("a.b"), "a.b")
+    self.assertEquals(rs.search("axc"), None)
+    self.assertEquals(rs.search("on chan[1]: hi"), "chan[1]")
+
+  def testManyGroups(self):
+    """tests lyntin.utils.RegexpSet with more than 100 groups"""
+    from lyntin.utils import RegexpSet, compile_regexp
+    items = [(i, compile_regexp("^foo%d %%1 bar %%2$" % i, 1)) for i in range(300)]
+    rs = RegexpSet(items)
+    self.assertEquals(rs.search("foo250 a bar b"), 250)
+    self.assertEquals(rs.search("foo0 a bar b"), 0)
+    self.assertEquals(rs.search("foo300 a bar b"), None)
+
+class TestGags(unittest.TestCase):
+  def testGags(self):
+    """tests gags and antigags"""
+    from lyntin.modules import gag
+    gd = gag.GagData()
+    gd.addGag("chats")
+    gd.addGag("^[newbie]")
+    self.assertEquals(gd.expand("Joe chats 'hi'\n"), "")
+    self.assertEquals(gd.expand("\33[1;37mJoe chats\33[0m\n"), "\33[1;37m\33[0m")
+    self.assertEquals(gd.expand("Joe says 'hi'\n"), "Joe says 'hi'\n")
+    self.assertEquals(gd.expand("[newbie] Joe: hi\n"), "")
+
+    gd.addAntiGag("Bob")
+    self.assertEquals(gd.expand("Bob chats 'hi'\n"), "Bob chats 'hi'\n")
+    gd.removeAntiGags("Bob")
+    self.assertEquals(gd.expand("Bob chats 'hi'\n"), "")
+    gd.removeGags("chats")
+    self.assertEquals(gd.expand("Bob chats 'hi'\n"), "Bob chats 'hi'\n")
+
+class TestHighlight(unittest.TestCase):
+  def setUp(self):
+    from lyntin.modules import highlight
+    self.hd = highlight.HighlightData()
+
+  def testHighlight(self):
+    """tests highlighting plain and colored text"""
+    self.hd.addHighlight("red", "orcs")
+    self.assertEquals(self.hd.expand("three orcs and two orcs\n"),
+        "three \33[31morcs\33[0m\33[0m and two \33[31morcs\33[0m\33[0m\n")
+    self.assertEquals(self.hd.expand("\33[33mthe orcs\33[0m come\n"),
+        "\33[33mthe \33[31morcs\33[0m\33[33m\33[0m come\n")
+    self.assertEquals(self.hd.expand("nothing here\n"), "nothing here\n")
+
+  def testSpanningColors(self):
+    """tests a highlight that spans color codes"""
+    self.hd.addHighlight("red", "big orcs")
+    self.assertEquals(self.hd.expand("the big \33[1mor\33[0mcs\n"),
+        "the \33[31mbig orcs\33[0m\33[0m\n")
+
+  def testOverlap(self):
+    """tests overlapping highlights--the one that sorts first wins"""
+    self.hd.addHighlight("red", "big orc")
+    self.hd.addHighlight("blue", "orcs")
+    self.assertEquals(self.hd.expand("big orcs\n"),
+        "\33[31mbig orc\33[0m\33[0m\33[34ms\33[0m\33[0m\n")
+
+  def testPrefixes(self):
+    """tests plain text highlights that start in the same place"""
+    self.hd.addHighlight("red", "orc")
+    self.hd.addHighlight("blue", "orcs")
+    self.assertEquals(self.hd.expand("orcs\n"),
+        "\33[31morc\33[0m\33[0m\33[34ms\33[0m\33[0m\n")
+
+class TestSubstitute(unittest.TestCase):
+  def setUp(self):
+    from lyntin.modules import substitute
+    self.sd = substitute.SubstituteData()
+
+  def testPlain(self):
+    """tests plain text substitutes"""
+    self.sd.addSubstitute("Bob", "Robert")
+    self.sd.addSubstitute("a", "b")
+    self.sd.addSubstitute("b", "c")
+    text = "nothing here\n"
+    self.assert_(self.sd.expand(text) is text)
+    # substituted text doesn't get substituted again
+    self.assertEquals(self.sd.expand("Bob ab\n"), "Robert bc\n")
+
+  def testPrecedence(self):
+    """tests longer plain text wins, then regexps in sorted order"""
+    self.sd.addSubstitute("orc", "goblin")
+    self.sd.addSubstitute("orcs", "trolls")
+    self.sd.addSubstitute("r[o\\w+]", "X")
+    self.sd.addSubstitute("r[ox?r]", "Y")
+    self.assertEquals(self.sd.expand("orc orcs ogre or\n"), "goblin trolls X X\n")
+
+  def testRegexp(self):
+    """tests regular expression substitutes with group references"""
+    self.sd.addSubstitute("r[^(\\w+) tells you]", "\\1 whispers")
+    self.sd.addSubstitute("r[^%1 shouts]i", "\\1 yells")
+    self.assertEquals(self.sd.expand("Bob tells you hi\n"), "Bob whispers hi\n")
+    self.assertEquals(self.sd.expand("Joe SHOUTS hi\n"), "Joe yells hi\n")
+    self.assertEquals(self.sd.expand("Joe: Bob tells you hi\n"), "Joe: Bob tells you hi\n")
+
+  def testColor(self):
+    """tests substitutes keep the color codes"""
+    self.sd.addSubstitute("Bob", "Robert")
+    self.assertEquals(self.sd.expand("\33[1mBob\33[0m says\n"), 
+                      "\33[1mRobert\33[0m says\n")
+    self.assertEquals(self.sd.expand("B\33[1mob says\33[0m\n"), 
+                      "Robert\33[1m says\33[0m\n")
+
+  def testAntiSubstitute(self):
+    """tests antisubstitutes"""
+    self.sd.addSubstitute("Bob", "Robert")
+    self.sd.addAntiSubstitute("tells")
+    self.assertEquals(self.sd.expand("Bob tells you\n"), "Bob tells you\n")
+    self.assertEquals(self.sd.expand("Bob says\n"), "Robert says\n")
+    self.sd.removeAntiSubstitutes("tells")
+    self.assertEquals(self.sd.expand("Bob tells you\n"), "Robert tells you\n")
+
+class TestAlias(unittest.TestCase):
+  def setUp(self):
+    from lyntin.modules import alias
+    self.ad = alias.AliasData()
+
+  def testExact(self):
+    """tests first word aliases"""
+    self.ad.addAlias("k", "kill %1")
+    self.ad.addAlias("gg", "get gold")
+    self.assertEquals(self.ad.expandInput("k orc"), ("k", "kill orc"))
+    self.assertEquals(self.ad.expandInput("gg from corpse"), ("gg", "get gold from corpse"))
+    self.assertEquals(self.ad.expandInput("kk orc"), None)
+    self.assertEquals(self.ad.expand("k orc"), "kill %1")
+
+  def testLongestPrefix(self):
+    """tests aliases with spaces in the name"""
+    self.ad.addAlias("get", "take")
+    self.ad.addAlias("get all", "get all;put all in bag")
+    self.ad.addAlias("get all from", "get all from %1;put all in bag")
+    self.assertEquals(self.ad.expandInput("get all"), ("get all", "get all;put all in bag"))
+    self.assertEquals(self.ad.expandInput("get all from corpse"), 
+                      ("get all from", "get all from corpse;put all in bag"))
+    self.assertEquals(self.ad.expandInput("get sword"), ("get", "take sword"))
+    self.ad.removeAliases("get all*")
+    self.assertEquals(self.ad.expandInput("get all from corpse"), ("get", "take all from corpse"))
+
+  def testPattern(self):
+    """tests regular expression aliases"""
+    self.ad.addAlias("r[^k(ill)? (\\S+)$]", "kill %2;cackle")
+    self.ad.addAlias("k", "kick %1")
+    self.assertEquals(self.ad.expandInput("kill orc"), ("r[^k(ill)? (\\S+)$]", "kill orc;cackle"))
+    # plain aliases go first
+    self.assertEquals(self.ad.expandInput("k orc"), ("k", "kick orc"))
+    self.assertEquals(self.ad.expandInput("kill big orc"), None)
+
+  def testRecursion(self):
+    """tests an alias in its own expansion goes as is unless a command runs it"""
+    from lyntin import exported
+    ses = get_engine().getSession("common")
+    ad = exported.get_manager("alias").getAliasData(ses)
+    ad.addAlias("go", "#if {$n > 0} {#math {n} {$n - 1};north;go}")
+    ad.addAlias("r[^k(ill)? (\\S+)$]", "kill %2;cackle")
+    ad.addAlias("ping", "pong")
+    ad.addAlias("pong", "ping")
+    sent = []
+    def tomud(args):
+      sent.append(args["data"])
+    exported.hook_register("to_mud_hook", tomud)
+    try:
+      ses.setVariable("n", "3")
+      exported.lyntin_command("go", internal=1, session=ses)
+      self.assertEquals(sent, ["north"] * 3)
+
+      del sent[:]
+      exported.lyntin_command("k orc", internal=1, session=ses)
+      self.assertEquals(sent, ["kill orc", "cackle"])
+
+      # aliases that expand to each other stop at the depth limit
+      del sent[:]
+      exported.lyntin_command("ping", internal=1, session=ses)
+      self.assertEquals(sent, [])
+      self.assertEquals(exported.get_manager("alias")._expanding, [])
+    finally:
+      exported.hook_unregister("to_mud_hook", tomud)
+      ses.removeVariable("n")
+      ad.clear()
+
+_engine = None
+
+def get_engine():
+  """
+  Builds (once) an Engine with the common session and the filter
+  modules loaded so we can test the module data classes without
+  a ui or a network connection.
+  """
+  global _engine
+  if _engine == None:
+    from lyntin import engine, exported
+    from lyntin.modules import action, alias, gag, highlight, substitute, \
+         variable, tintincmds
+    _engine = engine.Engine()
+    engine.Engine.instance = _engine
+    exported.myengine = _engine
+    _engine._setupConfiguration()
+    for mod in (variable, alias, action, gag, highlight, substitute, tintincmds):
+      mod.load()
+  return _engine
+
+class TestLogger(unittest.TestCase):
+  def setUp(self):
+    import tempfile
+    from lyntin.modules import logger
+    self.ses = get_engine().getSession("common")
+    self.name = tempfile.mktemp()
+    self.ld = logger.LoggerData(self.ses)
+
+  def tearDown(self):
+    import os
+    self.ld.closeLogFile()
+    if os.path.exists(self.name):
+      os.remove(self.name)
+
+  def read(self):
+    return open(self.name).read()
+
+  def testFlush(self):
+    """tests logged lines get written by flush and close"""
+    self.ld.openLogFile(self.name, 1, "", 60.0, 1000000)
+    self.ld.log("line one\n")
+    self.ld.log("line \33[1;32mtwo\33[0m\n")
+    self.ld.flushLogFile()
+    self.assertEquals(self.read(), "line one\nline two\n")
+
+    self.ld.log("line three\n")
+    self.ld.closeLogFile()
+    self.assertEquals(self.read(), "line one\nline two\nline three\n")
+    self.assertEquals(self.ld.isLogging(), 0)
+
+  def testFlushSize(self):
+    """tests a full queue gets written without waiting for the interval"""
+    import time
+    self.ld.openLogFile(self.name, 1, "", 60.0, 100)
+    for i in range(20):
+      self.ld.log("line %d\n" % i)
+    end = time.time() + 5
+    while len(self.read()) < 100 and time.time() < end:
+      time.sleep(0.01)
+    self.assert_(len(self.read()) >= 100)
+    self.assert_(self.ld.getStatus().find("queue depth") != -1)
+
+  def testWriteFails(self):
+    """tests logging stops without hanging when the file can't be written"""
+    import threading
+
+    class BadFile:
+      name = "bad"
+      def write(self, text):
+        raise IOError, "disk full"
+      def flush(self):
+        pass
+      def close(self):
+        pass
+
+    self.ld.setLogFile(BadFile())
+    self.ld.log_mud("line one\n")
+    self.ld.flushLogFile()
+
+    t = threading.Thread(target=self.ld.log_mud, args=("line two\n",))
+    t.setDaemon(1)
+    t.start()
+    t.join(5.0)
+    self.assertEquals(t.isAlive(), 0)
+    self.assertEquals(self.ld.isLogging(), 0)
+
+    self.ld.log_user("look")
+    self.ld.closeLogFile()
+
+class TestLogRotation(unittest.TestCase):
+  def setUp(self):
+    import tempfile
+    from lyntin.modules import logger
+    self.dir = tempfile.mkdtemp()
+    self.ld = logger.LoggerData(get_engine().getSession("common"))
+
+  def tearDown(self):
+    import shutil
+    self.ld.closeLogFile()
+    shutil.rmtree(self.dir)
+
+  def testSize(self):
+    """tests segments are rotated by size and gzipped"""
+    import os, time, gzip
+    from lyntin.modules import logger
+    name = os.path.join(self.dir, "log.txt")
+    rotator = logger.LogRotator(name, 100, 0, 1)
+    self.ld.openLogFile(name, 1, "", 60.0, 1000000, rotator)
+    lines = []
+    for i in range(30):
+      lines.append("line %d\n" % i)
+      self.ld.log(lines[-1])
+      self.ld.flushLogFile()
+    self.ld.closeLogFile()
+
+    end = time.time() + 5
+    while [mem for mem in os.listdir(self.dir) if not mem.endswith(".gz") 
+           and mem != "log.txt"] and time.time() < end:
+      time.sleep(0.01)
+
+    names = os.listdir(self.dir)
+    names.remove("log.txt")
+    self.assert_(len(names) > 1)
+    text = ""
+    for i in range(1, len(names) + 1):
+      self.assert_("log.txt.%d.gz" % i in names)
+      text += gzip.open(os.path.join(self.dir, "log.txt.%d.gz" % i)).read()
+      self.assert_(len(text) <= 100 * i)
+    text += open(name).read()
+    self.assertEquals(text, "".join(lines))
+
+  def testTemplate(self):
+    """tests filenames are filled in and time rotation lines up"""
+    import os, time
+    from lyntin.modules import logger
+    name = os.path.join(self.dir, "log-%Y.txt")
+    rotator = logger.LogRotator(name, 0, 3600)
+    self.assertEquals(rotator.getFileName(0), 
+                      os.path.join(self.dir, "log-%d.txt" % time.localtime(0)[0]))
+    f = rotator.open()
+    self.assert_(os.path.exists(time.strftime(name)))
+    now = time.time()
+    self.failIf(rotator.isDue(1, now))
+    self.assert_(rotator.isDue(1, now + 3600))
+    self.assertEquals(time.localtime(rotator._deadline)[4:6], (0, 0))
+    f.close()
+
+  def testParseSize(self):
+    from lyntin.modules import logger
+    self.assertEquals(logger.parse_size("500"), 500)
+    self.assertEquals(logger.parse_size("2k"), 2048)
+    self.assertEquals(logger.parse_size("100M"), 100 * 1024 * 1024)
+    self.assertRaises(ValueError, logger.parse_size, "lots")
+
+class TestRecording(unittest.TestCase):
+  def setUp(self):
+    import tempfile
+    self.name = tempfile.mktemp()
+
+  def tearDown(self):
+    import os
+    if os.path.exists(self.name):
+      os.remove(self.name)
+
+  def write(self, times, close=1):
+    """writes a record at each of the times with a fake clock"""
+    from lyntin import recording
+    class Clock:
+      def __init__(self, times):
+        self.times = list(times)
+      def time(self):
+        return self.times.pop(0)
+
+    oldtime = recording.time
+    recording.time = Clock([times[0]] + list(times))
+    try:
+      writer = recording.RecordWriter(self.name, "3k")
+      for i in range(len(times)):
+        writer.write(i % 3 + 1, "line %d" % i)
+    finally:
+      recording.time = oldtime
+    if close:
+      writer.close()
+    else:
+      writer.flush()
+    return writer
+
+  def testReadAndSeek(self):
+    """tests records come back in order and seek finds the right one"""
+    import random
+    from lyntin import recording
+    times = [1000.0 + i // 3 for i in range(2000)]
+    times[100] = 900.0
+    self.write(times)
+
+    reader = recording.RecordReader(self.name)
+    self.assertEquals(reader.getSessionName(), "3k")
+    self.assertEquals(len(reader), 2000)
+    records = list(reader)
+    self.assertEquals(records[100], (times[99], recording.PROMPT, "line 100"))
+    self.assertEquals(records[1999][2], "line 1999")
+    self.assertEquals(reader.getEndTime(), times[-1])
+
+    for i in range(200):
+      t = random.uniform(990, 1700)
+      expected = [mem for mem in records if mem[0] >= t]
+      self.assertEquals(list(reader.records(since=t))[:5], expected[:5])
+    self.assertEquals(list(reader.records(since=1010, until=1011, 
+                                          types=[recording.MUD])), 
+                      [(1010.0, recording.MUD, "line 30")])
+    reader.close()
+
+  def testUnclosed(self):
+    """tests a recording without an index gets indexed by scanning"""
+    from lyntin import recording
+    writer = self.write([1000.0 + i for i in range(1000)], 0)
+    reader = recording.RecordReader(self.name)
+    self.assertEquals(len(reader), 1000)
+    self.assertEquals(list(reader.records(since=1500.5))[0][2], "line 501")
+    reader.close()
+    writer.close()
+
+  def testNotRecording(self):
+    from lyntin import recording
+    open(self.name, "w").write("not a recording at all")
+    self.assertRaises(recording.RecordingException, 
+                      recording.RecordReader, self.name)
+
+class TestBatch(unittest.TestCase):
+  def setUp(self):
+    import tempfile
+    self.dir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    import shutil
+    shutil.rmtree(self.dir)
+
+  def testReadInput(self):
+    """tests logs and recordings are read in chunks of mud data"""
+    import os
+    from lyntin import batch, recording
+    name = os.path.join(self.dir, "fight.log")
+    open(name, "w").write("".join(["line %d\n" % i for i in range(7)]))
+    self.assertEquals(list(batch.read_input(name, 3)), 
+                      [(recording.MUD, "line 0\nline 1\nline 2\n"),
+                       (recording.MUD, "line 3\nline 4\nline 5\n"),
+                       (recording.MUD, "line 6\n")])
+
+    name = os.path.join(self.dir, "fight.rec")
+    writer = recording.RecordWriter(name, "3k")
+    for rectype, text in [(recording.MUD, "a\n"), (recording.MUD, "b\n"), 
+                          (recording.PROMPT, "hp> "), (recording.USER, "kill"),
+                          (recording.MUD, "c\n")]:
+      writer.write(rectype, text)
+    writer.close()
+    self.assertEquals(list(batch.read_input(name, 50)), 
+                      [(recording.MUD, "a\nb\n"), (recording.PROMPT, "hp> "),
+                       (recording.MUD, "c\n")])
+
+  def testRun(self):
+    """tests actions fire and what's sent to the mud is captured"""
+    import os, sys, StringIO
+    from lyntin import batch
+    eng = get_engine()
+    common = eng.getSession("common")
+    ad = eng.getManager("action").getActionData(common)
+    ad.addAction("^%0 attacks you", "kill %0")
+
+    name = os.path.join(self.dir, "fight.log")
+    output = os.path.join(self.dir, "sent.txt")
+    open(name, "w").write("orc attacks you\nthe orc misses\n" * 100)
+
+    stdout = sys.stdout
+    sys.stdout = StringIO.StringIO()
+    try:
+      batch.run(eng, name, output, "batchtest")
+      report = sys.stdout.getvalue()
+    finally:
+      sys.stdout = stdout
+      ad.clear()
+
+    self.assertEquals(open(output).read(), "kill orc\n" * 100)
+    self.assert_(report.find("actions fired:    100") != -1)
+    self.assert_(report.find("commands sent:    100") != -1)
+    self.assert_(report.find("action.mudfilter") != -1)
+    self.assertEquals(eng.getSession("batchtest"), None)
+
+  def testSchedule(self):
+    """tests scheduled events don't go off so batch runs are repeatable"""
+    import os, sys, time, StringIO
+    from lyntin import batch, config
+    from lyntin.modules import scheduler
+    eng = get_engine()
+    common = eng.getSession("common")
+    name = os.path.join(self.dir, "fight.log")
+    open(name, "w").write("the orc misses\n" * 5000)
+
+    old = scheduler.myscheduler
+    config.options["batch"] = name
+    scheduler.myscheduler = scheduler.Scheduler()
+    try:
+      scheduler.myscheduler.startup()
+      sevent = scheduler.SchedEvent(0.005, common, "#batchtest say tick", 
+                                    repeat=1)
+      deadline = time.time() + 0.005
+      scheduler.myscheduler.addEvent(deadline, sevent)
+
+      outputs = []
+      for i in range(2):
+        output = os.path.join(self.dir, "sent%d.txt" % i)
+        stdout = sys.stdout
+        sys.stdout = StringIO.StringIO()
+        try:
+          batch.run(eng, name, output, "batchtest")
+        finally:
+          sys.stdout = stdout
+        outputs.append(open(output).read())
+    finally:
+      scheduler.myscheduler.shutdown()
+      scheduler.myscheduler = old
+      del config.options["batch"]
+
+    self.assertEquals(outputs, ["", ""])
+    self.assertEquals(sevent._deadline, deadline)
+
+class WriteCounter:
+  def __init__(self):
+    self.writes = []
+
+  def write(self, data):
+    self.writes.append(data)
+
+  def shutdown(self):
+    pass
+
+class TestSpeedwalk(unittest.TestCase):
+  def setUp(self):
+    from lyntin import exported
+    from lyntin.modules import speedwalk
+    self.eng = get_engine()
+    if not exported.get_manager("speedwalk"):
+      speedwalk.load()
+    self.ses = self.eng.createSession("swtest")
+    self.sock = WriteCounter()
+    self.ses._socket = self.sock
+    self.sent = []
+    exported.hook_register("to_mud_hook", self.tomud)
+
+    sm = exported.get_manager("speedwalk")
+    for alias, dir in (("n", "north"), ("s", "south"), ("NE", "northeast"),
+                       ("e", "east")):
+      sm.addDir(self.ses, alias, dir)
+
+  def tearDown(self):
+    from lyntin import exported
+    exported.hook_unregister("to_mud_hook", self.tomud)
+    self.ses._socket = None
+    self.eng.closeSession(self.ses)
+
+  def tomud(self, args):
+    if args["session"] == self.ses:
+      self.sent.append(args["data"])
+
+  def testBatched(self):
+    """tests a speedwalk goes out in one write with to_mud_hook per line"""
+    self.eng.handleUserData("3n2sNE", 1, self.ses)
+    self.assertEquals(self.sock.writes, 
+                      ["north\nnorth\nnorth\nsouth\nsouth\nnortheast\n"])
+    self.assertEquals(self.sent, ["north", "north", "north", "south", 
+                                  "south", "northeast"])
+
+  def testAlias(self):
+    """tests directions that are aliases still go through the alias"""
+    self.eng.getManager("alias").getAliasData(self.ses).addAlias("east", 
+                                                        "open door;east")
+    self.eng.handleUserData("2en", 1, self.ses)
+    self.assertEquals(self.sent, ["open door", "east", "open door", "east",
+                                  "north"])
+    self.assertEquals(len(self.sock.writes), 5)
+
+  def testPaced(self):
+    """tests speedwalkdelay sends bursts through the scheduler"""
+    import time
+    from lyntin import exported
+    from lyntin.modules import scheduler
+    old = scheduler.myscheduler
+    scheduler.myscheduler = scheduler.Scheduler()
+    cm = exported.get_manager("config")
+    try:
+      cm.change("speedwalkdelay", 100, self.ses)
+      cm.change("speedwalkburst", 2, self.ses)
+      self.eng.handleUserData("3n", 1, self.ses)
+      self.eng.handleUserData("2s", 1, self.ses)
+      self.assertEquals(self.sock.writes, ["north\nnorth\n"])
+      scheduler.myscheduler.runEvents(time.time() + 0.15)
+      self.assertEquals(self.sock.writes[1:], ["north\nsouth\n"])
+      scheduler.myscheduler.runEvents(time.time() + 0.3)
+      self.assertEquals(self.sock.writes[2:], ["south\n"])
+      self.assertEquals(len(scheduler.myscheduler), 0)
+    finally:
+      scheduler.myscheduler = old
+
+class TestRepeat(unittest.TestCase):
+  def setUp(self):
+    from lyntin import exported
+    self.eng = get_engine()
+    self.ses = self.eng.createSession("reptest")
+    self.sock = WriteCounter()
+    self.ses._socket = self.sock
+    self.sent = []
+    exported.hook_register("to_mud_hook", self.tomud)
+
+  def tearDown(self):
+    from lyntin import exported
+    exported.hook_unregister("to_mud_hook", self.tomud)
+    self.ses._socket = None
+    self.eng.closeSession(self.ses)
+
+  def tomud(self, args):
+    if args["session"] == self.ses:
+      self.sent.append(args["data"])
+
+  def testRepeat(self):
+    """tests #N sends everything in one write with to_mud_hook per line"""
+    self.eng.handleUserData("#5 {buy arrow}", 1, self.ses)
+    self.assertEquals(self.sock.writes, ["buy arrow\n" * 5])
+    self.assertEquals(self.sent, ["buy arrow"] * 5)
+
+  def testAlias(self):
+    """tests #N goes through aliases"""
+    self.eng.getManager("alias").getAliasData(self.ses).addAlias("buy", 
+                                                        "buy %1;say bought")
+    self.eng.handleUserData("#3 {buy arrow}", 1, self.ses)
+    self.assertEquals(self.sent, ["buy arrow", "say bought"] * 3)
+    self.assertEquals(len(self.sock.writes), 1)
+
+  def testCommands(self):
+    """tests #N runs everything each time when there are commands"""
+    self.eng.handleUserData("#variable {n} {a}", 1, self.ses)
+    self.eng.handleUserData("#3 {say $n;#variable {n} {$n.}}", 1, self.ses)
+    self.assertEquals(self.sent, ["say a", "say a.", "say a.."])
+    self.assertEquals(len(self.sock.writes), 1)
+
+  def testLoop(self):
+    """tests #loop sends everything in one write"""
+    self.eng.handleUserData("#loop {1,3} {get %0.arrow}", 1, self.ses)
+    self.assertEquals(self.sent, ["get 1.arrow", "get 2.arrow", "get 3.arrow"])
+    self.assertEquals(len(self.sock.writes), 1)
+
+    self.eng.handleUserData("#loop {a,b} {buy arrow} range=false", 1, self.ses)
+    self.assertEquals(self.sent[3:], ["buy arrow", "buy arrow"])
+    self.assertEquals(self.sock.writes[1:], ["buy arrow\nbuy arrow\n"])
+
+class TestMapper(unittest.TestCase):
+  def grid(self, size):
+    from lyntin.modules import mapper
+    roommap = mapper.RoomMap()
+    area = roommap.newArea()
+    for y in range(size):
+      for x in range(size):
+        roommap.addRoom("room %d,%d" % (x, y), area, x, y)
+    for y in range(size):
+      for x in range(size):
+        room = y * size + x
+        if x + 1 < size:
+          roommap.addExit(room, "east", room + 1)
+          roommap.addExit(room + 1, "west", room)
+        if y + 1 < size:
+          roommap.addExit(room, "north", room + size)
+          roommap.addExit(room + size, "south", room)
+    return roommap
+
+  def testWalk(self):
+    """tests walking around a loop comes back to the same room"""
+    from lyntin.modules import mapper
+    data = mapper.MapperData()
+    data.arrived("Square")
+    for dir, title in (("north", "Road"), ("east", "Corner"), 
+                       ("south", "Alley"), ("west", "Square")):
+      data.moved(dir)
+      data.arrived(title)
+    self.assertEquals(len(data.getMap()), 4)
+    self.assertEquals(data.getCurrent(), 0)
+    self.assertEquals(data.getMap().getExits(0), 
+                      {"north": 1, "east": 3})
+
+    # a move the mud refused and a look don't go anywhere
+    data.moved("down")
+    data.failed()
+    data.arrived("Square")
+    self.assertEquals(data.getCurrent(), 0)
+
+    dest, path = data.findPath("corner")
+    self.assertEquals(dest, 2)
+    self.assertEquals(len(path), 2)
+
+  def testPath(self):
+    """tests routes, costs and that the cached searches are thrown away"""
+    roommap = self.grid(10)
+    path = roommap.findPath(0, [99])[1]
+    self.assertEquals(len(path), 18)
+    room = 0
+    for mem in path:
+      room = roommap.getExits(room)[mem]
+    self.assertEquals(room, 99)
+    self.assertEquals(roommap.findPath(0, [9])[1], ["east"] * 9)
+
+    # the nearest of several rooms
+    self.assertEquals(roommap.findPath(0, [99, 22, 5])[0], 22)
+
+    # a wall of expensive rooms with a gap at the top
+    for y in range(9):
+      roommap.setCost(y * 10 + 5, 100)
+    dest, path = roommap.findPath(0, [9])
+    self.assertEquals(len(path), 9 + 9 + 9)
+
+    roommap.setCost(45, 1)
+    self.assertEquals(len(roommap.findPath(0, [9])[1]), 4 + 9 + 4)
+
+  def testSaveLoad(self):
+    """tests a map comes back from its file the same"""
+    import StringIO
+    from lyntin.modules import mapper
+    roommap = self.grid(5)
+    roommap.setCost(12, 3)
+    roommap.setLabel("bank", 24)
+    f = StringIO.StringIO()
+    roommap.write(f)
+
+    loaded = mapper.RoomMap()
+    loaded.read(StringIO.StringIO(f.getvalue()))
+    self.assertEquals(len(loaded), 25)
+    self.assertEquals(loaded.getStatus(), roommap.getStatus())
+    for room in range(25):
+      self.assertEquals(loaded.getTitle(room), roommap.getTitle(room))
+      self.assertEquals(loaded.getExits(room), roommap.getExits(room))
+    self.assertEquals(loaded.getCost(12), 3)
+    self.assertEquals(loaded.findRooms("bank"), [24])
+    self.assertRaises(ValueError, loaded.read, StringIO.StringIO("junk\n"))
+
+  def testSession(self):
+    """tests the mapper follows a session and #path walks through speedwalk"""
+    from lyntin import exported
+    from lyntin.modules import mapper, speedwalk
+    eng = get_engine()
+    if not exported.get_manager("speedwalk"):
+      speedwalk.load()
+    if not exported.get_manager("mapper"):
+      mapper.load()
+    ses = eng.createSession("maptest")
+    sock = WriteCounter()
+    ses._socket = sock
+    try:
+      exported.get_manager("config").change("maptitle", "^\\[(.+)\\]$", ses)
+      ses.handleMudData("[Temple]\nA big temple.\n")
+      for dir, title in (("n", "Road"), ("n", "Gate"), ("e", "Bank")):
+        eng.handleUserData(dir, 1, ses)
+        ses.handleMudData("[%s]\nSome room.\n" % title)
+      data = exported.get_manager("mapper").getMapperData(ses)
+      self.assertEquals(len(data.getMap()), 4)
+
+      del sock.writes[:]
+      eng.handleUserData("#path {temple} {true} {true}", 1, ses)
+      self.assertEquals(sock.writes, ["west\nsouth\nsouth\n"])
+    finally:
+      ses._socket = None
+      eng.closeSession(ses)
+
+class TestHistory(unittest.TestCase):
+  def setUp(self):
+    import tempfile
+    from lyntin import history
+    self.name = tempfile.mktemp()
+    self.hm = history.HistoryManager(get_engine())
+    self.hm.setJournal("")
+
+  def tearDown(self):
+    import os
+    self.hm.setJournal("")
+    if os.path.exists(self.name):
+      os.remove(self.name)
+
+  def testHistoryItem(self):
+    hm = self.hm
+    for mem in ["north", "kill orc", "south", "kill goblin", "look"]:
+      hm.recordHistory(mem)
+    self.assertEquals(hm.getHistory(3), ["look", "kill goblin", "south"])
+    self.assertEquals(hm.getHistoryItem("!"), "look")
+    self.assertEquals(hm.getHistoryItem("!1"), "kill goblin")
+    self.assertEquals(hm.getHistoryItem("!-1"), "north")
+    self.assertEquals(hm.getHistoryItem("!kill"), "kill goblin")
+    self.assertEquals(hm.getHistoryItem("!1 goblin=troll"), "kill troll")
+    self.assertEquals(hm.getHistoryItem("!cast"), None)
+    self.assertEquals(hm.findHistory("kill", 5), ["kill goblin", "kill orc"])
+
+  def testPrefixIndex(self):
+    """tests the prefix index against a scan of the history"""
+    import random
+    hm = self.hm
+    hm.setHistorySize(50)
+    history = []
+    for i in range(2000):
+      mem = random.choice(["kill", "k", "cast", "c"]) + " %d" % random.randint(0, 30)
+      hm.recordHistory(mem)
+      history.insert(0, mem)
+      del history[50:]
+
+      prefix = random.choice(["k", "kill", "c", "cast", "x", ""])
+      expected = [mem for mem in history if mem.startswith(prefix)]
+      if expected:
+        self.assertEquals(hm.getHistoryItem("!" + prefix), expected[0])
+    self.assertEquals(hm.getHistory(100), history)
+    self.assertEquals(len(hm._sorted), len(dict.fromkeys(history)))
+
+  def testJournal(self):
+    """tests history is saved and read back lazily"""
+    from lyntin import history
+    self.hm.setJournal(self.name)
+    for i in range(10):
+      self.hm.recordHistory("say %d" % i)
+    self.hm.setJournal("")
+
+    hm = history.HistoryManager(get_engine())
+    hm._journalname = self.name
+    self.assertEquals(hm._loaded, 0)
+    self.assertEquals(hm.getHistoryItem("!"), "say 9")
+    hm.setHistorySize(3)
+    self.assertEquals(hm.getHistory(10), ["say 9", "say 8", "say 7"])
+    hm.setJournal("")
+
+    # the journal gets compacted when it's over twice historysize
+    cm = get_engine().getConfigManager()
+    cm.change("historysize", 3)
+    try:
+      hm = history.HistoryManager(get_engine())
+      hm._journalname = self.name
+      hm._load()
+      self.assertEquals(open(self.name).read().splitlines(), 
+                        ["say 7", "say 8", "say 9"])
+      hm.setJournal("")
+    finally:
+      cm.change("historysize", 1000)
+
+class TestScheduler(unittest.TestCase):
+  def setUp(self):
+    from lyntin.modules import scheduler
+    self.ses = get_engine().getSession("common")
+    self.sched = scheduler.Scheduler()
+    self.fired = []
+
+  def add(self, tick, name, tag="none", repeat=0):
+    from lyntin.modules import scheduler
+    sevent = scheduler.SchedEvent(tick, self.ses, self.fired.append, 
+                                  repeat=repeat, quiet=1, tag=tag)
+    sevent._args = [name]
+    self.sched.addEvent(tick, sevent)
+    return sevent._id
+
+  def testOrder(self):
+    """tests events fire in tick order and in the order they were added"""
+    self.add(3, "c")
+    self.add(1, "a")
+    self.add(3, "d")
+    self.add(2, "b", repeat=1)
+    for tick in range(1, 7):
+      self.sched.runEvents(tick)
+    self.assertEquals(self.fired, ["a", "b", "c", "d", "b", "b"])
+
+  def testSubSecond(self):
+    """tests fractional deadlines and that repeating events don't drift"""
+    self.add(0.25, "a")
+    self.add(0.5, "b", repeat=1)
+    self.sched.runEvents(0.3)
+    self.assertEquals(self.fired, ["a"])
+
+    # running late doesn't push the next deadline back...
+    self.sched.runEvents(0.6)
+    self.assertEquals(self.sched.getEventById("1")._next_tick, 1.0)
+
+    # ...and periods that were missed completely are skipped
+    self.sched.runEvents(2.7)
+    self.assertEquals(self.fired, ["a", "b", "b"])
+    self.assertEquals(self.sched.getEventById("1")._next_tick, 3.0)
+
+  def testRemove(self):
+    """tests removing by id, tag and * (including neighbours of removed events)"""
+    ids = [self.add(5, "e%d" % i, tag="t%d" % (i % 2)) for i in range(6)]
+    self.assertEquals(len(self.sched.removeById(ids[0])), 1)
+    self.assertEquals(len(self.sched.removeById("t1")), 3)
+    self.assertEquals(self.sched.getEventById("t1"), [])
+    self.assertEquals(self.sched.getEventById("t0")._next_tick, 5)
+    self.assertEquals(len(self.sched.getEvents(self.ses)), 2)
+    self.sched.runEvents(5)
+    self.assertEquals(self.fired, ["e2", "e4"])
+    self.assertEquals(self.sched.removeById("*"), [])
+
+  def testStress(self):
+    """schedules 100000 events, cancels most of them and runs the rest"""
+    import random, time
+    start = time.time()
+    expected = []
+    ids = []
+    for i in range(100000):
+      tick = random.randint(1, 1000)
+      name = (tick, i)
+      ids.append((self.add(tick, name, tag="tag%d" % (i % 100)), name))
+    self.assertEquals(len(self.sched), 100000)
+
+    removed = {}
+    for id, name in random.sample(ids, 50000):
+      self.sched.removeById(id)
+      removed[name] = 1
+    for i in range(0, 100, 10):
+      for mem in self.sched.getEventsByTag("tag%d" % i):
+        removed[mem._args[0]] = 1
+      self.sched.removeById("tag%d" % i)
+
+    expected = [name for id, name in ids if not removed.has_key(name)]
+    expected.sort()
+    self.assertEquals(len(self.sched), len(expected))
+    self.assert_(len(self.sched._events) < 2 * len(expected) + 100)
+
+    for tick in range(0, 1001, 7):
+      self.sched.runEvents(tick)
+    self.sched.runEvents(1000)
+    self.assertEquals(self.fired, expected)
+    self.assertEquals(len(self.sched), 0)
+    self.assert_(time.time() - start < 30)
+
+class TestActionOrdering(unittest.TestCase):
+  def setUp(self):
+    from lyntin.modules import action
+    self.ses = get_engine().getSession("common")
+    self.ad = action.ActionData(self.ses)
+
+  def _triggers(self):
+    return [m[2][0] for m in self.ad._actionlist]
+
+  def testPriorityOrder(self):
+    """tests actions are checked by priority then trigger"""
+    self.ad.addAction("c", "x", color=1, priority=5)
+    self.ad.addAction("b", "x", color=0, priority=1)
+    self.ad.addAction("a", "x", color=0, priority=5)
+    self.ad.addAction("d", "x", color=1, priority=0)
+    self.assertEquals(self._triggers(), ["d", "b", "a", "c"])
+
+  def testReplaceAction(self):
+    """tests re-adding a trigger moves it to its new priority"""
+    self.ad.addAction("a", "x", priority=1)
+    self.ad.addAction("b", "x", priority=2)
+    self.ad.addAction("a", "y", priority=3)
+    self.assertEquals(self._triggers(), ["b", "a"])
+    self.assertEquals(self.ad._actionlist[1][2][2], "y")
+
+  def testEnableDisable(self):
+    """tests disabling and enabling tags keeps priority order"""
+    self.ad.addAction("a", "x", priority=1, tag="combat")
+    self.ad.addAction("b", "x", priority=2, tag="peace")
+    self.ad.addAction("c", "x", priority=3, tag="combat")
+    self.ad.addAction("d", "x", priority=4)
+
+    self.ad.disable("combat")
+    self.assertEquals(self._triggers(), ["b", "d"])
+
+    # adding to a disabled tag doesn't make it active
+    self.ad.addAction("e", "x", priority=0, tag="combat")
+    self.assertEquals(self._triggers(), ["b", "d"])
+
+    self.ad.enable("combat")
+    self.assertEquals(self._triggers(), ["e", "a", "b", "c", "d"])
+
+  def testRemoveActions(self):
+    """tests removing actions by text and by tag"""
+    self.ad.addAction("a", "x", priority=1, tag="combat")
+    self.ad.addAction("b", "x", priority=2, tag="peace")
+    self.ad.addAction("c", "x", priority=3, tag="combat")
+    self.ad.removeActions("b")
+    self.assertEquals(self._triggers(), ["a", "c"])
+    self.ad.removeActions("", "combat")
+    self.assertEquals(self._triggers(), [])
+    self.assertEquals(self.ad._buckets, {})
+
 """
 # FIXME - these always fail because we don't get the precision right.
 # not sure what to do about that.
@@ -179,6 +1522,182 @@ _pass_fail("parse_time 4", int(parse_time("1:17:34a")), 1029824254)
 """
 
 
+class TestArgumentParser(unittest.TestCase):
+  def testSplit(self):
+    """tests lyntin.argparser.ArgumentParser.split with and without escapes"""
+    from lyntin.argparser import ArgumentParser
+    ap = ArgumentParser("a b* c**")
+    self.assertEquals(ap.split("  x {y  z} {a{b}c}\t"), 
+                      [("x", None), ("{y  z}", None), ("{a{b}c}", None)])
+    self.assertEquals(ap.split("x\\ y q=r"), [("x y", None), ("q", "r")])
+    self.assertRaises(Exception, ap.split, "{x")
+    self.assertRaises(Exception, ap.split, "x}")
+
+  def testCache(self):
+    """tests parse results are cached per input and defaults"""
+    from lyntin.argparser import ArgumentParser
+    ap = ArgumentParser("var rest* quiet:boolean=false")
+    first = ap.parse("hp a b")
+    first["rest"].append("c")
+    self.assertEquals(ap.parse("hp a b"), {"var": "hp", "rest": ["a", "b"], "quiet": 0})
+    self.assertEquals(ap.parse("hp", lambda x: x == "quiet" and "true" or None)["quiet"], 1)
+    self.assertEquals(ap.parse("hp")["quiet"], 0)
+
+  def testNoCache(self):
+    """tests commands can opt out of the parse cache"""
+    from lyntin.argparser import ArgumentParser
+    self.assertEquals(ArgumentParser("a b", "nocache").getCacheStatus(), None)
+    self.assertEquals(ArgumentParser("a:eval").getCacheStatus(), None)
+    self.assertEquals(ArgumentParser("a:time").getCacheStatus(), None)
+    self.assertNotEquals(ArgumentParser("a:int").getCacheStatus(), None)
+
+class TestExpression(unittest.TestCase):
+  varmap = {"hp": "95", "maxhp": "120", "name": "Joe", "ratio": "0.5", 
+            "default.x": "3"}
+  t = (
+    ("1 + 2 * 3", 7),
+    ("(1 + 2) * 3", 9),
+    ("-2 ** 2", -4),
+    ("7 / 2", 3),
+    ("7 // 2.0", 3.0),
+    ("$hp < 100", True),
+    ("$hp < 100 and $maxhp < 100", False),
+    ("90 < $hp <= 95", True),
+    ("not $hp > 100 or 1 / 0", True),
+    ("$hp * 100 / $maxhp", 79),
+    ("$ratio * 2", 1.0),
+    ("${default.x} + $default.x", 6),
+    ("'$name' == 'Joe'", True),
+    ("$name == 'Joe'", True),
+    ("'${name}s $nothere'", "Joes $nothere"),
+    ("'a\\'b' + \"c\"", "a'bc"),
+    ("$hp % 10 == 5 != False", True),
+  )
+
+  def testEvaluate(self):
+    """tests lyntin.expression.evaluate"""
+    from lyntin import expression
+    for i in range(len(self.t)):
+      c, s = self.t[i]
+      self.assertEquals(expression.evaluate(c, self.varmap.get), s, "test %d: %s" % (i, c))
+
+  def testErrors(self):
+    """tests lyntin.expression rejects things it shouldn't run"""
+    from lyntin import expression
+    for mem in ("__import__('os')", "$hp +", "(1", "1 2", "$hp.__class__", 
+                "open('x')", "1 ; 2"):
+      self.assertRaises(expression.ExpressionException, expression.evaluate, 
+                        mem, self.varmap.get)
+    self.assertRaises(expression.ExpressionException, expression.evaluate, 
+                      "$nothere > 1", self.varmap.get)
+
+  def testCache(self):
+    """tests compiled expressions are reused with new variable values"""
+    from lyntin import expression
+    varmap = {"hp": "10"}
+    expr = expression.compile_expression("$hp - 5")
+    self.assert_(expression.compile_expression("$hp - 5") is expr)
+    self.assertEquals(expr.evaluate(varmap.get), 5)
+    varmap["hp"] = "50"
+    self.assertEquals(expr.evaluate(varmap.get), 45)
+
+  def testCommands(self):
+    """tests #math and #if look variables up themselves"""
+    from lyntin import exported
+    ses = get_engine().getSession("common")
+    ses.setVariable("hp", "100")
+    ses.setVariable("target", "hp")
+    exported.lyntin_command("#math {$target} {$hp - 5} quiet=true", 1, ses)
+    self.assertEquals(ses.getVariable("hp"), "95")
+    exported.lyntin_command("#if {$hp < 100} {#variable {low} {$hp}} {#variable {low} {no}}", 1, ses)
+    self.assertEquals(ses.getVariable("low"), "95")
+
+    get_engine().getConfigManager().change("evalexpressions", "on", ses)
+    exported.lyntin_command("#math {hp} {len('$target') * $hp} quiet=true", 1, ses)
+    self.assertEquals(ses.getVariable("hp"), "190")
+    get_engine().getConfigManager().change("evalexpressions", "off", ses)
+    for mem in ("hp", "target", "low"):
+      ses.removeVariable(mem)
+
+class TestCommandManager(unittest.TestCase):
+  def setUp(self):
+    self.cm = get_engine().getManager("command")
+    self.func = lambda ses, args, input: None
+    for mem in ("zzfoo", "zzfoobar", "^zzq+$", "^zzfoo.x"):
+      self.cm.addCommand(mem, self.func, "")
+
+  def tearDown(self):
+    for mem in ("zzfoo", "zzfoobar", "^zzq+$", "^zzfoo.x"):
+      self.cm.removeCommand(mem)
+
+  def testFindCommand(self):
+    """tests the command index finds the first command in sorted order"""
+    import re
+    def linear(word):
+      commands = self.cm.getCommands()
+      commands.sort()
+      for mem in commands:
+        if mem.startswith("^"):
+          if re.compile(mem).search(word):
+            return mem
+        elif mem.startswith(word):
+          return mem
+      return None
+
+    for mem in ("zzf", "zzfoo", "zzfoob", "zzfooax", "zzqqq", "zzqz", "a", 
+                "al", "alias", "var", "unv", "zz", "zzz", "", "~"):
+      self.assertEquals(self.cm.findCommand(mem), linear(mem), mem)
+    self.assertEquals(self.cm.findCommand("zzfoob"), "zzfoobar")
+    self.assertEquals(self.cm.findCommand("zzqq"), "^zzq+$")
+
+    self.cm.removeCommand("zzfoo")
+    self.assertEquals(self.cm.findCommand("zzfoo"), "zzfoobar")
+    self.assertEquals(self.cm.findCommand("zzfooax"), "^zzfoo.x")
+    self.assertEquals(self.cm.findCommand("zzfo"), "zzfoobar")
+
+  def testResolverCache(self):
+    """tests default resolvers are cached until a variable changes"""
+    ses = get_engine().getSession("common")
+    resolver = self.cm.getResolver(ses, "zzfoo")
+    self.assert_(self.cm.getResolver(ses, "zzfoo") is resolver)
+    ses.setVariable("default.zzfoo.bar", "baz")
+    resolver2 = self.cm.getResolver(ses, "zzfoo")
+    self.assert_(resolver2 is not resolver)
+    self.assertEquals(resolver2("bar"), "baz")
+    ses.removeVariable("default.zzfoo.bar")
+
+class TestConfigSnapshot(unittest.TestCase):
+  def testSnapshot(self):
+    """tests the snapshot follows config items as they change"""
+    from lyntin import config
+    cm = get_engine().getConfigManager()
+    ses = get_engine().getSession("common")
+    snap = cm.getSnapshot(ses)
+    self.assert_(cm.getSnapshot(ses) is snap)
+    self.assertEquals(snap.verbatim, cm.get("verbatim", ses))
+    self.assertEquals(cm.getSnapshot().commandchar, cm.get("commandchar"))
+
+    cm.add("zzsnap", config.BoolConfig("zzsnap", 0, 0, "test"), ses)
+    self.assertEquals(snap.zzsnap, 0)
+    cm.change("zzsnap", "on", ses)
+    self.assertEquals(snap.zzsnap, 1)
+    self.assert_(not hasattr(cm.getSnapshot(), "zzsnap"))
+
+    cm.remove("zzsnap", ses)
+    self.assert_(not hasattr(snap, "zzsnap"))
+
+  def testAddSession(self):
+    """tests new sessions get a snapshot of the cloned items"""
+    from lyntin import config
+    cm = config.ConfigManager(None)
+    cm._config["a"] = {"foo": config.IntConfig("foo", 5, 0, "test")}
+    snap = cm.getSnapshot("b")
+    cm.addSession("b", "a")
+    self.assert_(cm.getSnapshot("b") is snap)
+    self.assertEquals(snap.foo, 5)
+    cm.removeSession("b")
+    self.assert_(not hasattr(cm.getSnapshot("b"), "foo"))
+
 if __name__ == '__main__':
   from lyntin import constants
   print constants.VERSION